@@ -1,11 +1,23 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import json
 from collections import Counter
 
+import numpy as np
+
+from wd_dates import earliest_years, load_dates
+from wd_ids import IdArray, decode_id, decode_prop, encode_ids, encode_prop
+from wd_metrics import RunMetrics
+from wd_triples import TripleStore
+
 date_path = 'wd_years.json'
+# the dates the years come from, saved by wd2cg as an array
+date_array_path = 'date_claims.npy'
 rel_path = 'statements_final.txt'
+# the same statements, saved by wd2cg as integer arrays
+rel_array_path = 'statements_final.npz'
 excluded_rels = ['P31', 'P279', 'P61i']
 wd_url = 'https://wikidata.org/wiki/'
 threshold = 1000
@@ -13,24 +25,70 @@ threshold = 1000
 if len(sys.argv) > 1:
     threshold = int(sys.argv[1])
 
-with open(date_path) as date_file, open(rel_path) as rel_file:
-    dates = json.loads(date_file.read())
-    rels = rel_file.read().split('\n')[:-1]
-
-    back_edges = []
-    back_edge_ctr = Counter()
-    rel_ctr = Counter()
-    proportions = dict()
-
-    for rel in rels:
-        src, type, dest = rel.split()
-        if type not in excluded_rels and src in dates and dest in dates:
-            rel_ctr.update([type])
-            d0, d1 = dates[src], dates[dest]
-            if d0 > d1 and d0 - d1 > threshold:
-                print(wd_url + src, d0, type, wd_url + dest, d1)
-                back_edge_ctr.update([type])
-    print('back edge counts:', back_edge_ctr)
-    for type in back_edge_ctr:
-        proportions[type] = back_edge_ctr[type] / rel_ctr[type]
-    print('proportions:', proportions)
+metrics = RunMetrics('back_edge_finder')
+
+
+def year_lookup(codes, years):
+    """make a function looking up the years of an array of entity codes,
+    from the years of the given codes, returning whether each one has a
+    year, and the years"""
+    year_array = IdArray.from_codes(codes, years, np.int16)
+
+    def lookup(query):
+        found = year_array.get_codes(query)
+        return found != year_array.missing, found.astype(np.int64)
+    return lookup
+
+
+with metrics.stage('load'):
+    if os.path.exists(date_array_path):
+        codes, years = earliest_years(load_dates(date_array_path))
+    else:
+        with open(date_path) as date_file:
+            dates = json.loads(date_file.read())
+        codes = encode_ids(dates)
+        years = np.fromiter(dates.values(), dtype=np.int64, count=len(dates))
+
+    if os.path.exists(rel_array_path):
+        rels = TripleStore.load(rel_array_path)
+    else:
+        # wd2cg.py --shards writes the statements in shards, which are read
+        # in parallel and sorted back into the order of the whole file
+        rels = TripleStore.read_shards(rel_path).unique()
+
+back_edges = []
+back_edge_ctr = Counter()
+rel_ctr = Counter()
+proportions = dict()
+
+with metrics.stage('compare', len(rels)):
+    lookup = year_lookup(codes, years)
+    src_dated, src_years = lookup(rels.src)
+    dest_dated, dest_years = lookup(rels.dst)
+    counted = (~np.isin(rels.prop, [encode_prop(p) for p in excluded_rels]) &
+               src_dated & dest_dated)
+    back = counted & (src_years > dest_years) & \
+        (src_years - dest_years > threshold)
+
+# count relationship types in order of first appearance, as a loop would
+types, first, counts = np.unique(rels.prop[counted], return_index=True,
+                                 return_counts=True)
+for i in np.argsort(first):
+    rel_ctr[decode_prop(int(types[i]))] = int(counts[i])
+
+with metrics.stage('report', int(back.sum())):
+    for i in np.flatnonzero(back).tolist():
+        src, type, dest = (decode_id(int(rels.src[i])),
+                           decode_prop(int(rels.prop[i])),
+                           decode_id(int(rels.dst[i])))
+        d0, d1 = int(src_years[i]), int(dest_years[i])
+        print(wd_url + src, d0, type, wd_url + dest, d1)
+        back_edge_ctr.update([type])
+print('back edge counts:', back_edge_ctr)
+for type in back_edge_ctr:
+    proportions[type] = back_edge_ctr[type] / rel_ctr[type]
+print('proportions:', proportions)
+
+metrics.add_counts({'dated_statements': rel_ctr,
+                    'back_edges': back_edge_ctr})
+metrics.write()
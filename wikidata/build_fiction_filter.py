@@ -4,26 +4,15 @@
 import sys
 import json
 
-import networkx as nx
-
-from wd_constants import lang_order
+from wd_langs import get_label
+from wd_graph import CSRGraph
+from wd_scan import Extractor, scan
+from wd_triples import TripleBuffer
 
 roots = ('Q24199478', 'Q14897293')
 subclass = 'P279'
 
 
-def get_label(obj):
-    """get appropriate label, using language fallback chain"""
-    has_sitelinks = 'sitelinks' in obj
-    for lang in lang_order:
-        site = lang + 'wiki'
-        if has_sitelinks and site in obj['sitelinks']:
-            return obj['sitelinks'][site]['title']
-        elif lang in obj['labels']:
-            return obj['labels'][lang]['value']
-    return None
-
-
 def get_item_rels(subj_id, rel, claims):
     class_inst_stmts = []
     if rel in claims:
@@ -34,47 +23,54 @@ def get_item_rels(subj_id, rel, claims):
     return class_inst_stmts
 
 
-def process_dump(dump_path):
-    statements = []
-    labels = {}
+class FictionExtractor(Extractor):
+    """subclass (P279) statements and labels, made into filter.json, the
+    classes of fictional and mythical things"""
 
-    with open(dump_path) as infile:
-        infile.readline()
-        for line in infile:
-            try:
-                obj = json.loads(line.rstrip(',\n'))
-                qid = obj['id']
+    name = 'fiction'
 
-                if qid not in labels:
-                    obj_label = get_label(obj)
-                    if obj_label is not None:
-                        labels[qid] = obj_label
+    def __init__(self, out_dir='.'):
+        super().__init__(out_dir)
+        self.statements = []
+        self.labels = {}
 
-                if obj['type'] == 'item':
-                    statements += get_item_rels(qid, subclass, obj['claims'])
-            except Exception as e:
-                print('Exception on', qid, '-', e)
+    def process_entity(self, obj):
+        qid = obj['id']
+        if qid not in self.labels:
+            obj_label = get_label(obj)
+            if obj_label is not None:
+                self.labels[qid] = obj_label
 
-    return statements, labels
+        if obj['type'] == 'item':
+            self.statements += get_item_rels(qid, subclass, obj['claims'])
+
+    def finish(self):
+        print("Dump processed!  Making graph...")
+        filter_dict = make_filter(self.statements, self.labels)
+        with open(self.path("filter.json"), 'w') as filterfile:
+            filterfile.write(json.dumps(filter_dict, indent=4, sort_keys=True))
 
 
 def graph_from_statements(statements):
-    g = nx.DiGraph()
+    buf = TripleBuffer()
     for line in statements:
         try:
-            source = line[0]
-            destination = line[2]
-            g.add_edge(source, destination)
+            buf.add(line[0], line[1], (line[2],))
         except Exception:
             print("error on line:", line)
-    return g
+    return CSRGraph.from_store(buf.to_store())
+
 
+def make_filter(statements, labels):
+    """the roots and all their (transitive) subclasses, with their labels"""
+    graph = graph_from_statements(statements)
+    print("Graph created with", graph.number_of_nodes(), "nodes and",
+          graph.number_of_edges(), "edges.")
+    # everything that's a subclass of a root, however indirectly
+    filter_set = set(roots) | set(graph.reachable(roots, reverse=True))
+    print(len(filter_set), "items in the new filter.")
 
-def get_all_ancestors(graph, node):
-    parents = list(graph.predecessors(node))
-    for p in parents:
-        parents += get_all_ancestors(graph, p)
-    return parents
+    return {item: labels.get(item, item) for item in filter_set}
 
 
 if __name__ == "__main__":
@@ -83,20 +79,5 @@ if __name__ == "__main__":
     else:
         dump_path = 'latest-all.json'
 
-    statements, labels = process_dump(dump_path)
-    print("Dump processed!  Making graph...")
-    graph = graph_from_statements(statements)
-    print("Graph created with", graph.number_of_nodes(), "nodes and",
-          graph.number_of_edges(), "edges.")
-    to_filter = list(roots)
-
-    for root in roots:
-        to_filter += get_all_ancestors(graph, root)
-
-    filter_set = set(to_filter)
-    print(len(filter_set), "items in the new filter.")
-
-    filter_dict = {item: labels.get(item, item) for item in filter_set}
-
-    with open("filter.json", 'w') as filterfile:
-        filterfile.write(json.dumps(filter_dict, indent=4, sort_keys=True))
+    # writes filter.json
+    scan(dump_path, [FictionExtractor()])
@@ -5,8 +5,6 @@ DATE_SHORT="$(date +%Y%m%d)"
 # the .gz is 50% larger than the .bz2, but it's ready sooner and unzips faster
 #wget --no-if-modified-since -N https://dumps.wikimedia.org/wikidatawiki/entities/latest-all.json.gz
 #echo "CauseGraph: dump downloaded: $(date --utc +%Y%m%dT%H:%M:%S)"
-#gunzip -k latest-all.json.gz
-#echo "CauseGraph: dump decompressed: $(date --utc +%Y%m%dT%H:%M:%S)"
 
 WORKSPACE="workspace-$(date --utc +%Y%m%dT%H:%M:%S)"
 mkdir -p $WORKSPACE
@@ -17,7 +15,9 @@ cp *.py $WORKSPACE
 # cp fix_labels.py $WORKSPACE
 cp filter.json $WORKSPACE
 cd $WORKSPACE
-zcat /run/media/jamie/extra/data/wikimedia/latest-all.json.gz | ./wd2cg.py
+# wd2cg decompresses the dump itself, in a background thread
+# entities unchanged since last week's dump reuse their kept results
+./wd2cg.py --workers "$(nproc)" --chunk-size 50000000 --incremental ../wd2cg-state /run/media/jamie/extra/data/wikimedia/latest-all.json.gz
 echo "CauseGraph: starting additional python scripts"
 ./back_edge_finder.py 150 > back_edges_150_$DATE_SHORT.txt
 ./date_flagger.py > flagged_dates_$DATE_SHORT.txt
@@ -25,12 +25,18 @@ cat flagged_dates_$DATE_SHORT.txt
 #./cg_analysis.py > cg_analysis_$DATE_SHORT.txt
 cat cg_analysis_$DATE_SHORT.txt
 echo "CauseGraph: finished additional python scripts"
+# each script's stage timings and counters are in run_metrics.json; compare
+# with last week's run with ./wd_metrics.py ../run_metrics_<date>.json run_metrics.json
+cp run_metrics.json ../run_metrics_$DATE_SHORT.json
 echo "CauseGraph: dump processed: $(date --utc +%Y%m%dT%H:%M:%S)"
-# arangoimport --file "nodes.tsv" --type tsv --collection "items" --create-collection true
-# arangoimport --file "relationships.tsv" --type tsv --collection "relations" --from-collection-prefix "items" --to-collection-prefix "items" --create-collection true --create-collection-type edge
+# wd_preproc's items.jsonl and links.jsonl; a load that stops can carry on
+# from where it got to with --resume
+# ./wd_arango.py items.jsonl items
+# ./wd_arango.py --edges links.jsonl links
 # echo "CauseGraph: ArangoDB import complete: $(date --utc +%Y%m%dT%H:%M:%S)"
+# labels.json, links.bin and meta.json come from wd2cg, so only the layout
+# is left for node to do
 # nodejs --max_old_space_size=16384 makengraph.js
-# ./fix_labels.py
 # mkdir $DATE_SHORT
 # cp data/positions.bin $DATE_SHORT
 # cp links.bin $DATE_SHORT
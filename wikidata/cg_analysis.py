@@ -1,29 +1,30 @@
 #!/usr/bin/env python3
 
 import json
-import networkx as nx
+
+from wd_graph import CSRGraph
 
 wd_url = 'https://wikidata.org/wiki/'
 
-cg = nx.read_graphml('nxcg.graphml')
+# the graph saved by wd2cg
+cg = CSRGraph.load('cg_graph')
 
 years = json.loads(open('wd_years.json').read())
 
 maxdeg = 1
-degrees = cg.degree()
+degrees = cg.out_degree() + cg.in_degree()
 
 #TODO fix this
-#for n in degrees:
-#    if n[1] >= maxdeg and n[0] not in years:
-#        print(n)
-#        maxdeg = n[1]
-
-cg_dg = nx.DiGraph(cg)
+#for n in range(cg.number_of_nodes()):
+#    if degrees[n] >= maxdeg and cg.node_id(n) not in years:
+#        print(cg.node_id(n), degrees[n])
+#        maxdeg = degrees[n]
 
-pr = nx.pagerank(cg_dg)
+# (multiple edges between two nodes count as one)
+pr = cg.pagerank()
 maxpr = 0
 
-for n in pr:
-    if pr[n] >= maxpr and n not in years:
-        print(wd_url + n, pr[n])
-        maxpr = pr[n]
+for n, rank in enumerate(pr.tolist()):
+    if rank >= maxpr and cg.node_id(n) not in years:
+        print(wd_url + cg.node_id(n), rank)
+        maxpr = rank
@@ -1,25 +1,25 @@
 #!/usr/bin/env python3
-import json
+from wd_dates import format_time, load_dates
+from wd_ids import decode_id
+from wd_metrics import RunMetrics
 
-def flag_monthday(datestr):
+
+def flag_monthday(dates):
     """a date in this range is likely a month/day entered by a user, but stored as a month/year by Wikidata; check to make sure this isn't the case"""
-    try:
-        y,m,d = [int(x) for x in datestr.split('T')[0].rsplit('-', 2)]
-        # is "year" in the range where it could actually be a day of the month?
-        y_inrange = y in range(1,32)
-        # is a month specified  and valid? (unspecified == 0)
-        m_inrange = m in range(1,13)
-        if y_inrange and m_inrange and d == 0:
-            return True
-        else:
-            return False
-    except:
-        return False
+    # is "year" in the range where it could actually be a day of the month?
+    y_inrange = (dates['year'] >= 1) & (dates['year'] <= 31)
+    # is a month specified  and valid? (unspecified == 0)
+    m_inrange = (dates['month'] >= 1) & (dates['month'] <= 12)
+    return y_inrange & m_inrange & (dates['day'] == 0)
+
 
-dates_obj = json.load(open('date_claims.json'))
+metrics = RunMetrics('date_flagger')
+dates = load_dates('date_claims.npy')
 
-for k in dates_obj:
-    for l in dates_obj[k]:
-        claim_date = l[1]
-        if flag_monthday(claim_date):
-            print(k, l[1])
+with metrics.stage('flag', len(dates)):
+    flagged = dates[flag_monthday(dates)]
+    for entity, year, month, day in flagged[
+            ['entity', 'year', 'month', 'day']].tolist():
+        print(decode_id(entity), format_time(year, month, day))
+metrics.count('flagged', 'month/day', len(flagged))
+metrics.write()
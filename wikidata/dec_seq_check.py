@@ -8,18 +8,7 @@ import urllib.request
 import urllib.parse
 import zlib
 
-from wd_constants import lang_order
-
-def get_label(obj):
-    """get appropriate label, using language fallback chain"""
-    has_sitelinks = 'sitelinks' in obj
-    for lang in lang_order:
-        site = lang + 'wiki'
-        if has_sitelinks and site in obj['sitelinks']:
-            return obj['sitelinks'][site]['title']
-        elif lang in obj['labels']:
-            return obj['labels'][lang]['value']
-    return None
+from wd_langs import get_label
 
 current_dec = 2020
 
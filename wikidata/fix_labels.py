@@ -1,22 +1,29 @@
 #!/usr/bin/env python3
 
 import json
+import os
+
+from wd_labelstore import LabelStore, read_label_lines, write_labels
+from wd_ngraph import named_labels
+from wd_shards import map_shards
 
 f = open('labels.json', 'r')
 graphlabels = json.loads(f.read())
 f.close()
 
-f = open('wd_labels.json', 'r')
-wd_labels = json.loads(f.read())
-f.close()
-
-newlabels = []
+# the labels wd2cg saved, looked up without loading them all; without them,
+# the best labels in wd_preproc's wd_labels.txt (read in parallel, if it's
+# in shards) are saved the same way first
+if not os.path.exists('wd_labels'):
+    best_labels = {}
+    for shard_labels in map_shards(read_label_lines, 'wd_labels.txt'):
+        # an entity without a label has its ID as its best label
+        best_labels.update((qid, label) for qid, label in shard_labels.items()
+                           if label != qid)
+    write_labels(best_labels, 'wd_labels')
+wd_labels = LabelStore('wd_labels')
 
-for label in graphlabels:
-    if label in wd_labels:
-        newlabels.append(' '.join([wd_labels[label], '-', label]))
-    else:
-        newlabels.append(label)
+newlabels = named_labels(graphlabels, wd_labels)
 
 with open('newlabels.json', 'w') as outfile:
     outfile.write(json.dumps(newlabels, indent=True))
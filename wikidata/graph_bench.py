@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""compare building the statement graph with networkx and as a CSRGraph, for
+build time and peak memory"""
+
+import json
+import multiprocessing as mp
+import os
+import resource
+import sys
+import time
+
+from wd2cg import make_qid_nx_graph
+from wd_graph import CSRGraph
+from wd_triples import TripleStore
+
+
+def build_nx(statements, years):
+    return make_qid_nx_graph(statements, years=years)
+
+
+def build_csr(statements, years):
+    return CSRGraph.from_store(statements, years)
+
+
+def measure(build, rel_path, years_path, results):
+    """build a graph in a fresh process, so that its peak memory use is its
+    own; reports the seconds taken and the peak RSS added, in MB"""
+    statements = TripleStore.load(rel_path)
+    years = {}
+    if os.path.exists(years_path):
+        with open(years_path) as years_file:
+            years = json.loads(years_file.read())
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start_time = time.time()
+    graph = build(statements, years)
+    elapsed = time.time() - start_time
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux
+    results.put((elapsed, (rss_after - rss_before) / 1024,
+                 graph.number_of_nodes(), graph.number_of_edges()))
+
+
+# usage: graph_bench.py [statements_final.npz [wd_years.json]]
+if __name__ == "__main__":
+    rel_path = sys.argv[1] if len(sys.argv) > 1 else 'statements_final.npz'
+    years_path = sys.argv[2] if len(sys.argv) > 2 else 'wd_years.json'
+
+    ctx = mp.get_context('spawn')
+    report = []
+    for name, build in (('networkx', build_nx), ('csr', build_csr)):
+        results = ctx.Queue()
+        p = ctx.Process(target=measure,
+                        args=(build, rel_path, years_path, results))
+        p.start()
+        report.append((name,) + results.get())
+        p.join()
+
+    print('graph\tseconds\tpeak MB\tnodes\tedges')
+    for row in report:
+        print('%s\t%.2f\t%.1f\t%d\t%d' % row)
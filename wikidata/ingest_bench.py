@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""report wd2cg dump ingest throughput for different worker counts"""
+
+import os
+import sys
+import time
+
+from wd2cg import process_dump
+from wd_dump import open_dump
+
+# usage: ingest_bench.py sample-dump.json [worker counts...]
+# e.g. ingest_bench.py head-1M.json 1 2 4 8 16
+if __name__ == "__main__":
+    dump_path = sys.argv[1]
+    if len(sys.argv) > 2:
+        worker_counts = [int(n) for n in sys.argv[2:]]
+    else:
+        worker_counts = [1, 2, 4, os.cpu_count()]
+
+    # every line but the opening '[' and closing ']' is an entity
+    with open_dump(dump_path) as infile:
+        entity_count = sum(1 for line in infile) - 2
+
+    report = []
+    for workers in worker_counts:
+        start_time = time.time()
+        nodes, date_claims, labels, statements = process_dump(
+            dump_path, frozenset(), workers=workers)
+        elapsed = time.time() - start_time
+        report.append((workers, elapsed, entity_count / elapsed,
+                       len(statements)))
+
+    print('workers\tseconds\tentities/s\tstatements')
+    for workers, elapsed, rate, statement_count in report:
+        print('%d\t%.1f\t%.0f\t%d' % (workers, elapsed, rate, statement_count))
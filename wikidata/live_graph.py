@@ -1,12 +1,24 @@
 #!/usr/bin/env python3
+"""keep the graph up to date with Wikidata's recent changes: a process
+follows the event stream and queues the claims of interest, and the main
+process takes them off the queue in batches, as fast as they come, adding
+each batch's edges to the graph and logging them to graph_changes.txt
+together, then flushing the log as --flush-edges and --flush-seconds say
 
+every --report-seconds, it prints the events handled per second and the
+lag from each event's time (its meta.dt) to its batch being applied"""
+
+import argparse
 import json
+import queue
 import time
 import multiprocessing as mp
+from datetime import datetime
+
 import networkx as nx
 
 from wd2cg import make_qid_nx_graph
-from pywikibot.comms.eventstreams import EventStreams
+from wd_triples import TripleStore
 
 import wd_constants
 
@@ -149,6 +161,9 @@ def check_recent_changes(q):
 
 
 
+    # only the process following the stream needs pywikibot
+    from pywikibot.comms.eventstreams import EventStreams
+
     stream = EventStreams(streams=['recentchange'])
     stream.register_filter(wiki='wikidatawiki', type='edit')
 
@@ -162,7 +177,7 @@ def check_recent_changes(q):
                     print(json.dumps(change, indent=2))
                     print(change['meta']['dt'], k, change['meta']['uri'], prop, val)
                     qid = change['meta']['uri'].rsplit('/', 1)[1]
-                    q.put((k, qid, prop, val))
+                    q.put((k, qid, prop, val, change['meta']['dt']))
                 if k in op and prop in wd_constants.all_times:
                     print(json.dumps(change, indent=2))
                     qid = change['meta']['uri'].rsplit('/', 1)[1]
@@ -184,7 +199,161 @@ def add_wd_edge(graph, src, typ, dst):
     pass
 
 
+add_ops = ('wbcreateclaim', 'wbsetclaim-create')
+
+
+def apply_changes(g, changes):
+    """add the edges of a batch of (op, src, typ, dst) changes to the graph
+    all at once; returns the changes that added one"""
+    added = []
+    for op, src, typ, dst in changes:
+        if op in add_ops:
+            if typ in wd_constants.cg_rels:
+                added.append((op, src, typ, dst))
+            # should I notify for nested_time_rels? I guess not
+        elif op == 'wbremoveclaims':
+            if g.has_edge(src, dst):
+                # TODO change the following line to work with MultiDiGraph edges
+                # i.e. g.get_edge_data()[0] - the 0 is for one of potentially multiple edges
+                # if g.get_edge_data(src, dst)[0]['type'] == typ:
+                # g.remove_edge(src,dst)
+                print('not removing edge of type %s from %s to %s' % (typ, src, dst))
+        else:
+            print('IMPLEMENT handling for', op)
+    g.add_edges_from((src, dst, {'type': typ}) for _, src, typ, dst in added)
+    return added
+
+
+def drain(q, batch_size, timeout=None):
+    """wait (for up to timeout seconds) for a change on the queue, then take
+    those that have come in since, up to batch_size changes in all"""
+    try:
+        batch = [q.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+    while len(batch) < batch_size:
+        try:
+            batch.append(q.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def event_time(dt):
+    """seconds since the epoch of an event's meta.dt, e.g.
+    '2021-06-01T12:00:00Z'"""
+    return datetime.fromisoformat(dt.replace('Z', '+00:00')).timestamp()
+
+
+class ChangeLog:
+    """graph_changes.txt, written a batch of changes at a time, and flushed
+    once flush_edges changes haven't been (0 for no limit) or flush_seconds
+    have passed since it last was (0 for after every batch)"""
+
+    def __init__(self, outfile, flush_edges=0, flush_seconds=1.0):
+        self.outfile = outfile
+        self.flush_edges = flush_edges
+        self.flush_seconds = flush_seconds
+        self.unflushed = 0
+        self.flushed_at = time.time()
+
+    def write(self, changes):
+        """log a batch of changes (or none, so that the log is still flushed
+        in time while there aren't any)"""
+        if changes:
+            self.outfile.write(''.join(' '.join(change) + '\n'
+                                       for change in changes))
+            self.unflushed += len(changes)
+        if self.unflushed and (
+                (self.flush_edges and self.unflushed >= self.flush_edges) or
+                time.time() - self.flushed_at >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        self.outfile.flush()
+        self.unflushed = 0
+        self.flushed_at = time.time()
+
+
+class LiveStats:
+    """the events handled per second, and the lag from each event's time to
+    its batch being applied, over each reporting interval"""
+
+    def __init__(self):
+        self.started = self.interval_start = time.time()
+        self.events = self.interval_events = 0
+        self.edges_added = 0
+        self.lags = []
+
+    def add_batch(self, event_times, edges_added):
+        applied = time.time()
+        self.events += len(event_times)
+        self.interval_events += len(event_times)
+        self.edges_added += edges_added
+        self.lags.extend(applied - t for t in event_times)
+
+    def report(self, queue_size=None):
+        now = time.time()
+        elapsed = max(now - self.interval_start, 1e-9)
+        line = 'UPDATE: %d events in %.1f s (%.1f/s, %.1f/s overall), ' \
+            '%d edges added' % (
+                self.interval_events, elapsed, self.interval_events / elapsed,
+                self.events / max(now - self.started, 1e-9),
+                self.edges_added)
+        if self.lags:
+            self.lags.sort()
+            line += '; lag mean %.2f s, median %.2f s, max %.2f s' % (
+                sum(self.lags) / len(self.lags),
+                self.lags[len(self.lags) // 2], self.lags[-1])
+        if queue_size is not None:
+            line += '; queue size is %d' % queue_size
+        print(line)
+        self.interval_start = now
+        self.interval_events = 0
+        self.lags = []
+
+
+def consume(q, g, log, batch_size=1000, report_seconds=10.0, stats=None):
+    """apply the changes put on the queue to the graph in batches, logging
+    them, until a None is put on it; returns the LiveStats"""
+    stats = stats or LiveStats()
+    while True:
+        # wake up in time to flush the log and report, even with no changes
+        timeout = min(log.flush_seconds or report_seconds, report_seconds)
+        batch = drain(q, batch_size, timeout)
+        done = None in batch
+        if done:
+            batch = batch[:batch.index(None)]
+        added = apply_changes(g, [item[:4] for item in batch])
+        log.write(added)
+        stats.add_batch([event_time(item[4]) for item in batch], len(added))
+        if done:
+            log.flush()
+            return stats
+        if time.time() - stats.interval_start >= report_seconds:
+            print_graph_status(g)
+            try:
+                queue_size = q.qsize()
+            except NotImplementedError:
+                # (on macOS)
+                queue_size = None
+            stats.report(queue_size)
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='most changes applied at once')
+    parser.add_argument('--flush-edges', type=int, default=0,
+                        help='flush graph_changes.txt once this many added '
+                             'edges haven\'t been (default: no limit)')
+    parser.add_argument('--flush-seconds', type=float, default=1.0,
+                        help='flush graph_changes.txt at least this often '
+                             '(0: after every batch)')
+    parser.add_argument('--report-seconds', type=float, default=10.0,
+                        help='print the rate and lag this often')
+    args = parser.parse_args()
+
     years = {}
 
     try:
@@ -196,15 +365,12 @@ if __name__ == '__main__':
 
     try:
         with open('statements_final.txt', 'r') as statements:
-            g = make_qid_nx_graph(statements, years)
+            g = make_qid_nx_graph(TripleStore.read_text(statements), years)
     except FileNotFoundError:
         print('Statements file not found; starting with empty graph')
 
     print_graph_status(g)
 
-    edges_added = 0
-    just_added = False
-
     mp.set_start_method('spawn')
     q = mp.Queue()
     p = mp.Process(target=check_recent_changes, args=(q,))
@@ -212,7 +378,7 @@ if __name__ == '__main__':
 
     # TODO should I really just append?  When to start fresh?
     with open('graph_changes.txt', 'a+') as changes:
-        edges_added_from_file = 0
+        logged = []
         changes.seek(0)
         for line in changes.readlines():
             if not line.startswith('#'):
@@ -221,51 +387,13 @@ if __name__ == '__main__':
                 except ValueError:
                     print('ValueError on line:', line)
                     continue
-                if op in ('wbcreateclaim', 'wbsetclaim-create'):
-                    if typ in wd_constants.cg_rels:
-                        g.add_edge(src, dst, type=typ)
-                        edges_added_from_file += 1
-                    # should I notify for nested_time_rels? I guess not
-                elif op == 'wbremoveclaims':
-                    if g.has_edge(src, dst):
-                        # TODO change the following line to work with MultiDiGraph edges
-                        # i.e. g.get_edge_data()[0] - the 0 is for one of potentially multiple edges
-                        # if g.get_edge_data(src, dst)[0]['type'] == typ:
-                        # g.remove_edge(src,dst)
-                        print('not removing edge of type %s from %s to %s' % (typ, src, dst))
-                else:
-                    print('IMPLEMENT handling for', op)
+                logged.append((op, src, typ, dst))
             else:
                 print('adding', line[1:-1])
+        edges_added_from_file = len(apply_changes(g, logged))
         print(edges_added_from_file, 'edges added from existing graph_changes file')
         print_graph_status(g)
 
         changes.write('#changes starting ' + time.ctime() + '\n')
-        while True:
-            if not q.empty():
-                op, src, typ, dst = q.get()
-                if op in ('wbcreateclaim', 'wbsetclaim-create'):
-                    if typ in wd_constants.cg_rels:
-                        g.add_edge(src, dst, type=typ)
-                        just_added = True
-                        edges_added += 1
-                        changes.write(' '.join([op, src, typ, dst]) + '\n')
-                        # changes.flush()
-                    # should I notify for nested_time_rels? I guess not
-                elif op == 'wbremoveclaims':
-                    if g.has_edge(src, dst):
-                        # TODO change the following line to work with MultiDiGraph edges
-                        # i.e. g.get_edge_data()[0] - the 0 is for one of potentially multiple edges
-                        # if g.get_edge_data(src, dst)[0]['type'] == typ:
-                        # g.remove_edge(src,dst)
-                        print('not removing edge of type %s from %s to %s' % (typ, src, dst))
-                else:
-                    print('IMPLEMENT handling for', op)
-                # TODO choose a better condition here
-                if edges_added > 0 and edges_added % 10 == 0 and just_added:
-                    print_graph_status(g)
-                    print(edges_added, 'edges added')
-                    print('queue size is', q.qsize())
-                    just_added = False
-                    changes.flush()
-            time.sleep(.2)
+        log = ChangeLog(changes, args.flush_edges, args.flush_seconds)
+        consume(q, g, log, args.batch_size, args.report_seconds)
@@ -1,12 +1,29 @@
 fs = require('fs')
-dot = require('ngraph.fromdot')
+createGraph = require('ngraph.graph')
 ser = require('ngraph.serialization/json')
 start_years = require('./wd_years.json')
 createLayout = require('ngraph.offline.timelayout')
-save = require('ngraph.tobinary')
 
-graphstr = fs.readFileSync('nxcg.dot', 'utf-8')
-graph = dot(graphstr)
+// wd2cg writes the graph in ngraph.tobinary's format (see wd_ngraph.py), so
+// it doesn't have to be parsed from text here; the nodes are added in the
+// order of labels.json, so that data/positions.bin matches it
+meta = JSON.parse(fs.readFileSync('meta.json', 'utf8'))
+labels = JSON.parse(fs.readFileSync(meta.nodeFile, 'utf8'))
+links = fs.readFileSync(meta.linkFile)
+
+graph = createGraph()
+labels.forEach(function (id) {
+    graph.addNode(id)
+})
+var from
+for (var offset = 0; offset < links.length; offset += 4) {
+    var value = links.readInt32LE(offset)
+    if (value < 0) {
+        from = labels[-value - 1]
+    } else {
+        graph.addLink(from, labels[value - 1])
+    }
+}
 
 year_present_count = 0
 total = 0
@@ -24,4 +41,3 @@ graph_json = ser.save(graph)
 fs.writeFileSync('ngraph_with_dates.json', graph_json, 'utf8')
 layout = createLayout(graph, {maxTime: (new Date()).getFullYear()})
 layout.run()
-save(graph)
@@ -8,22 +8,11 @@ import urllib.request
 import urllib.parse
 import zlib
 
-from wd_constants import lang_order
+from wd_langs import get_label
 
 # different languages?  use WD?  generate multilingual list once from WD?
 months = ('January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December')
 
-def get_label(obj):
-    """get appropriate label, using language fallback chain"""
-    has_sitelinks = 'sitelinks' in obj
-    for lang in lang_order:
-        site = lang + 'wiki'
-        if has_sitelinks and site in obj['sitelinks']:
-            return obj['sitelinks'][site]['title']
-        elif lang in obj['labels']:
-            return obj['labels'][lang]['value']
-    return None
-
 def get_description(obj):
     try:
         return obj['descriptions']['en']['value']
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """Generate graph of fictional/mythical classes from Wikidata JSON dump"""
 
+import os
 import sys
 import json
 
@@ -8,6 +9,11 @@ import networkx as nx
 
 from wd_constants import lang_order
 
+# the shared dump reader lives in the parent directory; append rather than
+# insert, so that this directory's wd_constants is still the one imported
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from wd_dump import decode_line, open_dump
+
 roots = ('Q18706315', 'Q14897293', 'Q17442446')
 subclass = 'P279'
 
@@ -38,11 +44,11 @@ def process_dump(dump_path):
     statements = []
     labels = {}
 
-    with open(dump_path) as infile:
+    with open_dump(dump_path) as infile:
         infile.readline()
         for line in infile:
             try:
-                obj = json.loads(line.rstrip(',\n'))
+                obj = decode_line(line)
                 qid = obj['id']
 
                 if qid not in labels:
@@ -0,0 +1,7 @@
+"""the scripts in wikidata/ import each other as top-level modules, as they
+do when run from there"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
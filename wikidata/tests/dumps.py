@@ -0,0 +1,265 @@
+"""small made-up dumps for tests, with the kinds of entity that take
+different paths through the extractors"""
+
+import json
+import random
+
+from wd_constants import all_times, cg_rels, nested_time_rels
+
+cg_props = sorted(cg_rels)
+time_props = sorted(all_times)
+nested_props = sorted(nested_time_rels)
+# properties none of the extractors look at
+other_props = ['P17', 'P27', 'P131', 'P279']
+langs = ['en', 'de', 'fr', 'nl', 'ja', 'xx']
+
+
+def item_snak(prop, qid):
+    return {'snaktype': 'value', 'property': prop,
+            'datavalue': {'value': {'entity-type': 'item',
+                                    'numeric-id': int(qid[1:]), 'id': qid},
+                          'type': 'wikibase-entityid'},
+            'datatype': 'wikibase-item'}
+
+
+def time_snak(prop, rng):
+    year = rng.randint(-3000, 2025)
+    time = '%+05d-%02d-%02dT00:00:00Z' % (year, rng.randint(0, 12),
+                                          rng.randint(0, 28))
+    return {'snaktype': 'value', 'property': prop,
+            'datavalue': {'value': {'time': time, 'timezone': 0,
+                                    'before': 0, 'after': 0,
+                                    'precision': rng.choice([7, 9, 11]),
+                                    'calendarmodel': 'http://www.wikidata.'
+                                                     'org/entity/Q1985727'},
+                          'type': 'time'},
+            'datatype': 'time'}
+
+
+def string_snak(prop, text):
+    return {'snaktype': 'value', 'property': prop,
+            'datavalue': {'value': text, 'type': 'string'},
+            'datatype': 'string'}
+
+
+def statement(snak, rng, qualifiers=None, references=None):
+    claim = {'mainsnak': snak, 'type': 'statement', 'id': 'x',
+             'rank': rng.choice(['normal', 'normal', 'preferred',
+                                 'deprecated'])}
+    if qualifiers:
+        claim['qualifiers'] = qualifiers
+    if references:
+        claim['references'] = references
+    return claim
+
+
+def make_entities(count, seed=1):
+    """count entities, made the same way every time for a seed"""
+    rng = random.Random(seed)
+    entities = []
+    for number in range(1, count + 1):
+        qid = 'Q%d' % number
+
+        def target():
+            return 'Q%d' % rng.randint(1, count)
+
+        kind = rng.random()
+        if kind < 0.03:
+            entities.append({'type': 'property', 'datatype': 'wikibase-item',
+                             'id': 'P%d' % number,
+                             'labels': {'en': {'language': 'en',
+                                               'value': 'prop %d' % number}},
+                             'claims': {}})
+            continue
+        if kind < 0.06:
+            # lexemes have lemmas instead of labels
+            claims = {'P5191': [statement(item_snak('P5191', target()), rng)]}
+            entities.append({'type': 'lexeme', 'id': 'L%d' % number,
+                             'lemmas': {'en': {'language': 'en',
+                                               'value': 'lex'}},
+                             'claims': claims if rng.random() < 0.5 else [],
+                             'forms': [], 'senses': []})
+            continue
+        labels = {}
+        for lang in rng.sample(langs, rng.randint(0, 3)):
+            labels[lang] = {'language': lang,
+                            'value': 'label %s %d é"\\' % (lang, number)}
+        if rng.random() < 0.05:
+            # property keys in text don't make an entity relevant
+            labels['en'] = {'language': 'en',
+                            'value': 'mentions "%s": in text' %
+                                     rng.choice(cg_props)}
+        claims = {}
+        shape = rng.random()
+        if shape < 0.3:
+            # nothing the extractors want, so the prefilter skips it
+            for _ in range(rng.randint(0, 2)):
+                prop = rng.choice(other_props)
+                claims.setdefault(prop, []).append(
+                    statement(item_snak(prop, target()), rng))
+            if rng.random() < 0.2:
+                claims['P1813'] = [statement(string_snak(
+                    'P1813', '"%s": "Q1"' % rng.choice(cg_props)), rng)]
+            if rng.random() < 0.2:
+                # a relevant key in a reference: a false positive for the
+                # prefilter, which has to decode it all to find nothing
+                prop = rng.choice(time_props)
+                claims.setdefault('P17', []).append(statement(
+                    item_snak('P17', target()), rng,
+                    references=[{'snaks': {prop: [time_snak(prop, rng)]}}]))
+        else:
+            for _ in range(rng.choice([1, 2, 3, 5])):
+                roll = rng.random()
+                if roll < 0.4:
+                    prop = rng.choice(cg_props)
+                    snak = item_snak(prop, target())
+                elif roll < 0.7:
+                    prop = rng.choice(time_props)
+                    snak = time_snak(prop, rng)
+                elif roll < 0.85:
+                    prop = rng.choice(nested_props)
+                    snak = item_snak(prop, target())
+                else:
+                    prop = rng.choice(other_props + ['P31'])
+                    snak = item_snak(prop, target())
+                qualifiers = None
+                if rng.random() < 0.3:
+                    qualifier = rng.choice(time_props)
+                    qualifiers = {qualifier: [time_snak(qualifier, rng)]}
+                claims.setdefault(prop, []).append(
+                    statement(snak, rng, qualifiers))
+        entity = {'type': 'item', 'id': qid, 'labels': labels,
+                  'descriptions': {}, 'aliases': {}}
+        if claims or rng.random() < 0.8:
+            entity['claims'] = claims or []
+        if rng.random() < 0.5:
+            entity['sitelinks'] = {
+                lang + 'wiki': {'site': lang + 'wiki',
+                                'title': 'title %s %d' % (lang, number),
+                                'badges': []}
+                for lang in rng.sample(langs, rng.randint(1, 3))}
+        entities.append(entity)
+    for revision, entity in enumerate(entities, 1000):
+        entity['lastrevid'] = revision
+    return entities
+
+
+def edit_entities(entities, seed=2):
+    """the next version of a dump's entities: some changed (with new
+    revisions), some deleted and some added"""
+    rng = random.Random(seed)
+    revision = max(entity['lastrevid'] for entity in entities)
+    count = len(entities)
+    result = []
+    for entity in entities:
+        roll = rng.random()
+        if roll < 0.05:
+            continue
+        entity = json.loads(json.dumps(entity))
+        if roll < 0.2:
+            for lang in entity.get('labels', {}):
+                entity['labels'][lang]['value'] += ' (edited)'
+            for specs in (entity.get('claims') or {}).values():
+                for spec in specs:
+                    value = spec['mainsnak'].get('datavalue', {})['value']
+                    if isinstance(value, dict) and 'id' in value:
+                        value['id'] = 'Q%d' % rng.randint(1, count)
+                    elif isinstance(value, dict) and 'time' in value:
+                        value['time'] = '+%04d-01-01T00:00:00Z' % \
+                            rng.randint(1000, 1999)
+            revision += 1
+            entity['lastrevid'] = revision
+        result.append(entity)
+        if entity['type'] == 'item' and rng.random() < 0.03:
+            added = json.loads(json.dumps(entity))
+            added['id'] = 'Q%d' % (count + len(result))
+            revision += 1
+            added['lastrevid'] = revision
+            result.append(added)
+    return result
+
+
+def fixed_claim(snak, rank='normal'):
+    """a claim with the given rank, or none (with None)"""
+    claim = {'mainsnak': snak, 'type': 'statement', 'id': 'x'}
+    if rank is not None:
+        claim['rank'] = rank
+    return claim
+
+
+def fixed_time_snak(prop, time):
+    return {'snaktype': 'value', 'property': prop, 'datatype': 'time',
+            'datavalue': {'type': 'time',
+                          'value': {'time': time, 'precision': 11}}}
+
+
+def fixed_entity(qid, claims):
+    return {'type': 'item', 'id': qid,
+            'labels': {'en': {'language': 'en', 'value': 'label ' + qid}},
+            'claims': claims, 'sitelinks': {}}
+
+
+def bad_date_entities():
+    """two items with a parent, one of whose dates can't all be read: a time
+    that can't be parsed, and one in a claim without a rank"""
+    good = fixed_entity('Q1', {
+        'P569': [fixed_claim(fixed_time_snak(
+            'P569', '+1900-01-02T00:00:00Z'), 'preferred')],
+        'P40': [fixed_claim(item_snak('P40', 'Q2'))]})
+    bad = fixed_entity('Q3', {
+        'P569': [fixed_claim(fixed_time_snak('P569', 'not a time')),
+                 fixed_claim(fixed_time_snak(
+                     'P569', '+1901-00-00T00:00:00Z'), None),
+                 fixed_claim(fixed_time_snak(
+                     'P569', '+1902-00-00T00:00:00Z'))],
+        'P40': [fixed_claim(item_snak('P40', 'Q4'))]})
+    return [good, bad]
+
+
+def dump_lines(entities):
+    """the lines of a dump of entities, laid out as Wikidata's are"""
+    lines = [b'[\n']
+    for i, entity in enumerate(entities):
+        line = json.dumps(entity, ensure_ascii=False,
+                          separators=(',', ':')).encode()
+        lines.append(line + (b'\n' if i == len(entities) - 1 else b',\n'))
+    lines.append(b']\n')
+    return lines
+
+
+def write_dump(path, entities):
+    with open(path, 'wb') as outfile:
+        outfile.writelines(dump_lines(entities))
+    return str(path)
+
+
+def read_outputs(out_dir):
+    """the contents of every file under out_dir, by relative path, except
+    the ngraph meta.json (which has the time it was written)"""
+    outputs = {}
+    for path in sorted(out_dir.rglob('*')):
+        name = str(path.relative_to(out_dir))
+        if path.is_file() and name != 'meta.json':
+            outputs[name] = path.read_bytes()
+    return outputs
+
+
+def run_wd2cg(dump_path, out_dir, chunk_size=0, **options):
+    """run wd2cg on a dump (as wd2cg.py does, with options for process_dump),
+    writing its outputs to out_dir"""
+    import wd2cg
+    from wd_triples import ChunkSpiller
+
+    out_dir.mkdir(exist_ok=True)
+    spiller = None
+    if chunk_size:
+        spiller = ChunkSpiller(str(out_dir / 'statements.txt'),
+                               wd2cg.combined_inverses, chunk_size,
+                               run_dir=str(out_dir))
+    nodes, date_claims, labels, statements = wd2cg.process_dump(
+        str(dump_path), None, spiller=spiller, **options)
+    wd2cg.write_outputs(nodes, date_claims, labels, statements, spiller,
+                        str(out_dir))
+    if spiller is not None:
+        spiller.cleanup()
+    return read_outputs(out_dir)
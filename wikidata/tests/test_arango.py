@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from wd_arango import ArangoClient, BulkLoader, LoadError
+from wd_arango_fake import FakeArango, check_load
+
+
+def write_jsonl(path, documents):
+    with open(path, 'w') as outfile:
+        for document in documents:
+            outfile.write(json.dumps(document) + '\n')
+    return str(path)
+
+
+@pytest.fixture
+def documents(tmp_path):
+    """paths of items.jsonl and links.jsonl, as wd_preproc writes them"""
+    items = write_jsonl(tmp_path / 'items.jsonl', [
+        {'_key': 'Q%d' % i, 'label': 'item %d' % i} for i in range(1, 201)])
+    links = write_jsonl(tmp_path / 'links.jsonl', [
+        {'_key': 'Q%d-P40-Q%d' % (i, i + 1), '_from': 'Q%d' % i,
+         '_to': 'Q%d' % (i + 1)} for i in range(1, 200)])
+    return items, links
+
+
+def serve(**options):
+    server = FakeArango(**options).start()
+    return server, ArangoClient(server.url)
+
+
+def stop(server, client):
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_load_with_failures(documents):
+    items, links = documents
+    server, client = serve(fail_rate=0.2, drop_rate=0.1, seed=1)
+    retries = 0
+    for path, collection, edges in ((items, 'items', False),
+                                    (links, 'links', True)):
+        loader = BulkLoader(client, collection, batch_size=10, connections=4,
+                            retries=10, backoff=0.001, edges=edges,
+                            vertex_collection='items')
+        assert loader.load(path) == (200 if collection == 'items' else 199)
+        assert loader.counts['errors'] == 0
+        retries += loader.counts['retries']
+    stop(server, client)
+    assert server.requests['unavailable'] and server.requests['dropped']
+    assert retries > 0
+    assert check_load(server, 'items', items) == 0
+    assert check_load(server, 'links', links, 'items') == 0
+
+
+def test_rejected_batch(documents, monkeypatch):
+    items = documents[0]
+    server, client = serve()
+    imports = []
+
+    def reject(lines, params):
+        imports.append(lines)
+        return 400, {'error': True, 'code': 400, 'errorNum': 600,
+                     'errorMessage': 'invalid JSON'}
+    monkeypatch.setattr(server, 'import_lines', reject)
+    loader = BulkLoader(client, 'items', batch_size=1000, connections=1,
+                        backoff=0.001)
+    with pytest.raises(LoadError, match='batch 0 of items: HTTP 400'):
+        loader.load(items)
+    stop(server, client)
+    # rejected, rather than sent again
+    assert len(imports) == 1
+
+
+def test_resume(documents, tmp_path, monkeypatch):
+    items = documents[0]
+    server, client = serve()
+    state_path = str(tmp_path / 'wd_arango-items.json')
+    import_lines = server.import_lines
+    # the first key of each batch imported, and those to fail
+    first_keys = []
+    failing = {'Q51'}
+
+    def import_some(lines, params):
+        first_keys.append(json.loads(lines[0])['_key'])
+        if first_keys[-1] in failing:
+            return 503, {'error': True, 'errorMessage': 'service unavailable'}
+        return import_lines(lines, params)
+    monkeypatch.setattr(server, 'import_lines', import_some)
+    loader = BulkLoader(client, 'items', batch_size=10, connections=1,
+                        retries=0, state_path=state_path)
+    with pytest.raises(LoadError):
+        loader.load(items)
+    with open(state_path) as infile:
+        assert json.load(infile)['next_batch'] == 5
+
+    first_keys.clear()
+    failing.clear()
+    resumed = BulkLoader(client, 'items', batch_size=10, connections=1,
+                         state_path=state_path)
+    assert resumed.load(items, resume=True) == 150
+    stop(server, client)
+    # the batches before next_batch are skipped, and the rest sent in order
+    assert first_keys == ['Q%d' % i for i in range(51, 201, 10)]
+    assert check_load(server, 'items', items) == 0
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+import wd2cg
+import wd_preproc
+from dumps import make_entities, read_outputs, run_wd2cg, write_dump
+from wd_checkpoint import Checkpoint
+from wd_triples import ChunkSpiller, TripleBuffer
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(monkeypatch, module, name, calls):
+    """make module.name raise Interrupted on the given call"""
+    func = getattr(module, name)
+    count = 0
+
+    def wrapper(*args, **kwargs):
+        nonlocal count
+        count += 1
+        if count == calls:
+            raise Interrupted
+        return func(*args, **kwargs)
+    monkeypatch.setattr(module, name, wrapper)
+
+
+def test_wd2cg_resume(tmp_path, monkeypatch):
+    dump_path = write_dump(tmp_path / 'dump.json', make_entities(600))
+    options = dict(batch_size=40, chunk_size=60, checkpoint_every=150)
+    expected = run_wd2cg(dump_path, tmp_path / 'whole', **options)
+
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint'))
+    out_dir = tmp_path / 'resumed'
+    # checkpoints are saved after batches 4, 8 and 12, and the run stops
+    # while merging batch 11, after more statements have been spilled
+    with monkeypatch.context() as patched:
+        interrupt_after(patched, wd2cg, 'merge_partial', 11)
+        with pytest.raises(Interrupted):
+            run_wd2cg(dump_path, out_dir, checkpoint=checkpoint, **options)
+    index = checkpoint.load()
+    assert index['entity_count'] == 320
+    spilled = index['spiller']
+    assert os.path.getsize(out_dir / 'statements.txt') > spilled['text_size']
+    assert len(os.listdir(spilled['run_dir'])) > len(spilled['run_paths'])
+
+    outputs = run_wd2cg(dump_path, out_dir, checkpoint=checkpoint,
+                        resume=True, **options)
+    assert outputs == expected
+
+
+def test_preproc_resume(tmp_path, monkeypatch):
+    dump_path = write_dump(tmp_path / 'dump.json', make_entities(600))
+    options = dict(batch_size=40, checkpoint_every=150)
+    (tmp_path / 'whole').mkdir()
+    monkeypatch.chdir(tmp_path / 'whole')
+    wd_preproc.preprocess(dump_path, checkpoint=Checkpoint(
+        str(tmp_path / 'whole-checkpoint')), **options)
+    expected = read_outputs(tmp_path / 'whole')
+
+    (tmp_path / 'resumed').mkdir()
+    monkeypatch.chdir(tmp_path / 'resumed')
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint'))
+    with monkeypatch.context() as patched:
+        interrupt_after(patched, wd_preproc, 'process_lines', 11)
+        with pytest.raises(Interrupted):
+            wd_preproc.preprocess(dump_path, checkpoint=checkpoint,
+                                  **options)
+    assert checkpoint.load()['line_count'] == 160
+    wd_preproc.preprocess(dump_path, checkpoint=checkpoint, resume=True,
+                          **options)
+    assert read_outputs(tmp_path / 'resumed') == expected
+
+
+def statements(*rows):
+    buffer = TripleBuffer()
+    for src, prop, dst in rows:
+        buffer.add(src, prop, [dst])
+    return buffer.to_store()
+
+
+def test_spiller_restore(tmp_path):
+    spiller = ChunkSpiller(str(tmp_path / 'statements.txt'),
+                           wd2cg.combined_inverses, 2, run_dir=str(tmp_path))
+    spiller.add(statements(('Q1', 'P40', 'Q2'), ('Q3', 'P40', 'Q4')))
+    state = spiller.state()
+    text = (tmp_path / 'statements.txt').read_bytes()
+    merged = [list(block.iter_triples()) for block in spiller.merged_blocks()]
+
+    spiller.add(statements(('Q5', 'P40', 'Q6')))
+    spiller.add(statements(('Q7', 'P40', 'Q8')))
+    # as a resumed run would, with a new spiller
+    restored = ChunkSpiller(str(tmp_path / 'statements.txt'),
+                            wd2cg.combined_inverses, 2, run_dir=str(tmp_path))
+    restored.restore(state)
+    assert (tmp_path / 'statements.txt').read_bytes() == text
+    assert sorted(os.listdir(state['run_dir'])) == \
+        [os.path.basename(path) for path in state['run_paths']]
+    assert [list(block.iter_triples())
+            for block in restored.merged_blocks()] == merged
+    assert restored.count == 2
+    restored.cleanup()
+    assert not os.path.exists(state['run_dir'])
@@ -0,0 +1,16 @@
+from wd_columns import get_label
+
+
+def test_get_label():
+    # the first language of the chain with a sitelink or a label decides,
+    # and a sitelink's title comes before that language's label
+    assert get_label({'labels': {'de': {'value': 'Erde'},
+                                 'fr': {'value': 'Terre'}},
+                      'sitelinks': {'frwiki': {'title': 'Terre (planète)'}}}
+                     ) == 'Erde'
+    assert get_label({'labels': {'en': {'value': 'Earth'}},
+                      'sitelinks': {'enwiki': {'title': 'Earth (planet)'}}}
+                     ) == 'Earth (planet)'
+    assert get_label({'labels': {'xx': {'value': 'x'}}}) is None
+    # lexemes have lemmas instead of labels
+    assert get_label({'type': 'lexeme', 'lemmas': {}}) is None
@@ -0,0 +1,89 @@
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+import wd_extsort
+from wd_extsort import (ExternalSorter, intersect_sorted, merge_unique,
+                        read_lines, sort_file, subtract_sorted, write_lines)
+
+
+def random_lines(count, seed):
+    rng = random.Random(seed)
+    # few enough distinct lines that there are plenty of duplicates, and
+    # some that sort differently as bytes than as text would
+    return [('Q%d | Q%d %s' % (rng.randint(1, 500), rng.randint(1, 500),
+                               rng.choice(['', 'é', 'Z', '~']))).encode()
+            for _ in range(count)]
+
+
+@pytest.mark.parametrize('runs_at_once', [128, 3])
+def test_sort_matches_in_memory(tmp_path, monkeypatch, runs_at_once):
+    # with few runs merged at once, runs are merged early, too
+    monkeypatch.setattr(wd_extsort, 'max_runs', runs_at_once)
+    lines = random_lines(5000, 1)
+    with ExternalSorter(budget=1 << 14, tmp_dir=str(tmp_path)) as sorter:
+        sorter.extend(lines)
+        assert sorter.run_count > 3
+        assert len(sorter.run_paths) <= runs_at_once
+        assert list(sorter) == sorted(set(lines))
+        run_dir = sorter.run_dir
+    assert not os.path.exists(run_dir)
+
+
+def test_sort_file(tmp_path):
+    lines = random_lines(5000, 2)
+    write_lines(lines, tmp_path / 'lines.txt')
+    count = sort_file(tmp_path / 'lines.txt', tmp_path / 'sorted.txt',
+                      budget=1 << 14, tmp_dir=str(tmp_path))
+    assert count == len(set(lines))
+    assert list(read_lines(tmp_path / 'sorted.txt')) == sorted(set(lines))
+    # only the input and output are left
+    assert sorted(os.listdir(tmp_path)) == ['lines.txt', 'sorted.txt']
+
+
+def test_set_operations(tmp_path):
+    # as combine.py uses them, on each language's sorted links
+    sets = [set(random_lines(2000, seed)) for seed in range(3)]
+    paths = []
+    for i, lines in enumerate(sets):
+        paths.append(tmp_path / ('%d.txt' % i))
+        write_lines(lines, tmp_path / 'unsorted.txt')
+        sort_file(tmp_path / 'unsorted.txt', paths[-1], budget=1 << 12,
+                  tmp_dir=str(tmp_path))
+
+    def read_all():
+        return [read_lines(path) for path in paths]
+
+    assert list(merge_unique(*read_all())) == sorted(set.union(*sets))
+    assert list(intersect_sorted(*read_all())) == \
+        sorted(set.intersection(*sets))
+    assert list(subtract_sorted(*read_all()[:2])) == \
+        sorted(sets[0] - sets[1])
+
+
+def test_memory_stays_within_budget(tmp_path):
+    # in a fresh process, so that the peak resident size is this sort's own
+    budget = 8 << 20
+    script = '''
+import resource, sys
+from wd_extsort import ExternalSorter
+
+count = 1000000
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+with ExternalSorter(budget=%d, tmp_dir=sys.argv[1]) as sorter:
+    # about six times the budget, as the sorter counts line sizes
+    sorter.extend(b'%%09d' %% (i * 7919 %% count) for i in range(count))
+    assert sorter.run_count >= 5
+    for i, line in enumerate(sorter):
+        assert line == b'%%09d' %% i
+    assert i == count - 1
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print((after - before) * 1024)
+''' % budget
+    growth = subprocess.run(
+        [sys.executable, '-c', script, str(tmp_path)], check=True,
+        capture_output=True, cwd=os.path.dirname(wd_extsort.__file__)).stdout
+    assert int(growth) < 3 * budget
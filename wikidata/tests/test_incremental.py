@@ -0,0 +1,22 @@
+import pytest
+
+from dumps import edit_entities, make_entities, run_wd2cg, write_dump
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_second_dump_matches_full_run(tmp_path, workers):
+    first = make_entities(400)
+    second = edit_entities(first)
+    first_path = write_dump(tmp_path / 'first.json', first)
+    second_path = write_dump(tmp_path / 'second.json', second)
+    cache_path = str(tmp_path / 'cache')
+
+    expected = run_wd2cg(second_path, tmp_path / 'full', batch_size=50)
+    run_wd2cg(first_path, tmp_path / 'first', batch_size=50,
+              cache_path=cache_path)
+    # with most of the second dump's entities unchanged, and some batches
+    # all in the cache
+    outputs = run_wd2cg(second_path, tmp_path / 'second', batch_size=50,
+                        workers=workers, cache_path=cache_path)
+    assert outputs == expected
+    assert 'statements_final.txt' in outputs
@@ -0,0 +1,23 @@
+from wd_labelstore import LabelStore, write_labels
+
+
+def test_round_trip(tmp_path):
+    labels = {'Q42': 'Douglas Adams', 'Q1': 'universe', 'P31': 'instance of',
+              'L7': 'lexème', 'Q5': ''}
+    write_labels(labels, tmp_path / 'labels')
+    store = LabelStore(tmp_path / 'labels')
+    assert store.get_many(['Q42', 'Q1', 'P31', 'L7', 'Q5', 'Q2', 'P1']) == \
+        ['Douglas Adams', 'universe', 'instance of', 'lexème', None, None,
+         None]
+    assert len(store) == 4
+    assert dict(store.items()) == {qid: label for qid, label in
+                                   labels.items() if label}
+
+
+def test_lone_surrogates(tmp_path):
+    # as in a few of the dump's labels
+    labels = {'Q1': 'a\ud800b', 'Q2': '\udfff'}
+    write_labels(labels, tmp_path / 'labels')
+    store = LabelStore(tmp_path / 'labels')
+    assert store.get_many(['Q1', 'Q2']) == ['a\ud800b', '\udfff']
+    assert dict(store.items()) == labels
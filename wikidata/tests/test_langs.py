@@ -0,0 +1,35 @@
+import pytest
+
+from wd_langs import LabelChain, scan_label, scan_labels
+
+chain = LabelChain(('en', 'de', 'fr'))
+
+entities = [
+    {'labels': {'fr': {'value': 'Terre'}, 'de': {'value': 'Erde'}},
+     'sitelinks': {'frwiki': {'title': 'Terre (planète)'}}},
+    {'labels': {'en': {'value': 'Earth'}},
+     'sitelinks': {'dewiki': {'title': 'Erde'}}},
+    {'labels': {'xx': {'value': 'x'}}},
+    # the dump has [] for empty maps
+    {'labels': [], 'sitelinks': {'frwiki': {'title': 'Terre'}}},
+    {'labels': [], 'sitelinks': []},
+    # lexemes have lemmas instead of labels
+    {'type': 'lexeme', 'lemmas': {'en': {'value': 'lex'}}},
+]
+
+
+@pytest.mark.parametrize('obj', entities)
+def test_same_as_scan(obj):
+    assert chain.get_label(obj) == scan_label(obj, chain.langs)
+    assert list(chain.get_labels(obj).items()) == \
+        list(scan_labels(obj, chain.langs).items())
+
+
+def test_without_labels():
+    assert chain.get_label({'labels': []}) is None
+    assert chain.get_label({'type': 'lexeme'}) is None
+    assert chain.get_labels({'labels': [], 'sitelinks': []}) == \
+        {'best': None}
+    assert chain.get_label({'labels': [],
+                            'sitelinks': {'frwiki': {'title': 'Terre'}}}) \
+        == 'Terre'
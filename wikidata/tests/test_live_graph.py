@@ -0,0 +1,60 @@
+import io
+import queue
+
+import networkx as nx
+import pytest
+
+from live_graph import ChangeLog, LiveStats, consume
+
+dt = '2021-06-01T12:00:00Z'
+events = [
+    ('wbcreateclaim', 'Q1', 'P40', 'Q2', dt),
+    ('wbsetclaim-create', 'Q2', 'P40', 'Q3', dt),
+    # neither of these adds an edge
+    ('wbremoveclaims', 'Q1', 'P40', 'Q2', dt),
+    ('wbsetclaimvalue', 'Q3', 'P40', 'Q4', dt),
+    ('wbcreateclaim', 'Q3', 'P40', 'Q4', dt),
+    # nor does a claim of a property not in cg_rels
+    ('wbcreateclaim', 'Q4', 'P31', 'Q5', dt),
+    ('wbcreateclaim', 'Q4', 'P40', 'Q5', dt),
+]
+
+
+class FlushRecorder(io.StringIO):
+    """a log file that records what had been written at each flush"""
+
+    def __init__(self):
+        super().__init__()
+        self.flushed = []
+
+    def flush(self):
+        self.flushed.append(self.getvalue().splitlines())
+
+
+# with batches of two events, the edges are added two, none, one and one
+# at a time; the log is flushed once more when the queue ends
+@pytest.mark.parametrize('flush_edges, flush_seconds, flushed_lines', [
+    (3, 1e9, [3, 4]),
+    (0, 0, [2, 3, 4, 4]),
+])
+def test_consume(flush_edges, flush_seconds, flushed_lines):
+    q = queue.Queue()
+    for event in events + [None]:
+        q.put(event)
+    g = nx.MultiDiGraph()
+    outfile = FlushRecorder()
+    log = ChangeLog(outfile, flush_edges, flush_seconds)
+    stats = consume(q, g, log, batch_size=2, report_seconds=1e9,
+                    stats=LiveStats())
+
+    logged = ['wbcreateclaim Q1 P40 Q2', 'wbsetclaim-create Q2 P40 Q3',
+              'wbcreateclaim Q3 P40 Q4', 'wbcreateclaim Q4 P40 Q5']
+    assert outfile.getvalue().splitlines() == logged
+    assert [len(lines) for lines in outfile.flushed] == flushed_lines
+    assert outfile.flushed[-1] == logged
+    assert list(g.edges(data='type')) == [
+        ('Q1', 'Q2', 'P40'), ('Q2', 'Q3', 'P40'), ('Q3', 'Q4', 'P40'),
+        ('Q4', 'Q5', 'P40')]
+    assert stats.events == len(events)
+    assert stats.edges_added == 4
+    assert len(stats.lags) == len(events)
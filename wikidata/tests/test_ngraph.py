@@ -0,0 +1,77 @@
+import json
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from wd_graph import CSRGraph
+from wd_ngraph import labels_file, links_file, read_ngraph, write_ngraph
+from wd_triples import TripleBuffer
+
+# the loop makengraph.js reads links.bin with, printing the links it adds
+makengraph_links = '''
+fs = require('fs')
+meta = JSON.parse(fs.readFileSync(process.argv[1] + '/meta.json', 'utf8'))
+labels = JSON.parse(fs.readFileSync(process.argv[1] + '/' + meta.nodeFile,
+                                    'utf8'))
+links = fs.readFileSync(process.argv[1] + '/' + meta.linkFile)
+var from
+var added = []
+for (var offset = 0; offset < links.length; offset += 4) {
+    var value = links.readInt32LE(offset)
+    if (value < 0) {
+        from = labels[-value - 1]
+    } else {
+        added.push([from, labels[value - 1]])
+    }
+}
+console.log(JSON.stringify(added))
+'''
+
+
+def small_graph():
+    statements = TripleBuffer()
+    statements.add('Q5', 'P40', ['Q1', 'Q7'])
+    statements.add('Q5', 'P22', ['Q1'])
+    statements.add('Q1', 'P737', ['Q7'])
+    # Q3 and Q7 have no outgoing links
+    statements.add('Q9', 'P40', ['Q3'])
+    return CSRGraph.from_store(statements.to_store())
+
+
+def tobinary_links(ids, links):
+    """links.bin as ngraph.tobinary writes it for a graph with nodes added
+    in the order of ids: for every node, -(its index + 1), then (index + 1)
+    of each node it links to"""
+    index = {qid: i + 1 for i, qid in enumerate(ids)}
+    records = []
+    for qid in ids:
+        records.append(-index[qid])
+        records.extend(index[dst] for src, dst in links if src == qid)
+    return np.array(records, dtype='<i4').tobytes()
+
+
+def test_round_trip(tmp_path):
+    write_ngraph(small_graph(), str(tmp_path))
+    ids, links = read_ngraph(str(tmp_path))
+    assert ids == ['Q1', 'Q3', 'Q5', 'Q7', 'Q9']
+    # one link for each pair of nodes with statements between them
+    assert links == [('Q1', 'Q7'), ('Q5', 'Q1'), ('Q5', 'Q7'), ('Q9', 'Q3')]
+    assert json.loads((tmp_path / labels_file).read_text()) == ids
+    assert (tmp_path / links_file).read_bytes() == tobinary_links(ids, links)
+
+
+def test_empty_graph(tmp_path):
+    write_ngraph(CSRGraph.from_store(TripleBuffer().to_store()),
+                 str(tmp_path))
+    assert read_ngraph(str(tmp_path)) == ([], [])
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='needs Node.js')
+def test_makengraph_reads_the_same_links(tmp_path):
+    write_ngraph(small_graph(), str(tmp_path))
+    output = subprocess.run(['node', '-e', makengraph_links, str(tmp_path)],
+                            check=True, capture_output=True, text=True).stdout
+    assert [tuple(link) for link in json.loads(output)] == \
+        read_ngraph(str(tmp_path))[1]
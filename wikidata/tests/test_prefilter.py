@@ -0,0 +1,37 @@
+from dumps import dump_lines, make_entities, run_wd2cg, write_dump
+from wd2cg import has_relevant_props, item_prefix, process_lines
+
+
+def test_prefilter_changes_nothing():
+    entities = make_entities(400)
+    # process_dump hands process_lines the lines after the opening '['
+    lines = dump_lines(entities)[1:]
+    skipped = [line for line in lines
+               if line.startswith(item_prefix) and
+               not has_relevant_props(line)]
+    # items the prefilter skips, some with property keys in their labels or
+    # strings, and some it can't skip for a key in a reference
+    assert len(skipped) > 50
+    assert any(b'mentions \\"P' in line for line in skipped)
+    assert any(b'P1813' in line for line in skipped)
+    assert any(b'references' in line and has_relevant_props(line)
+               for line in lines)
+
+    prefiltered = process_lines(lines, prefilter=True)
+    unfiltered = process_lines(lines, prefilter=False)
+    assert prefiltered[0] == unfiltered[0]
+    assert prefiltered[1] == unfiltered[1]
+    assert list(prefiltered[2].items()) == list(unfiltered[2].items())
+    assert list(prefiltered[3].items()) == list(unfiltered[3].items())
+    for column in ('src', 'prop', 'dst'):
+        assert getattr(prefiltered[4], column) == \
+            getattr(unfiltered[4], column)
+    assert prefiltered[5]['skipped']['prefiltered'] == len(skipped)
+    assert prefiltered[5]['exceptions'] == unfiltered[5]['exceptions']
+
+
+def test_prefilter_outputs(tmp_path):
+    dump_path = write_dump(tmp_path / 'dump.json', make_entities(400))
+    assert run_wd2cg(dump_path, tmp_path / 'prefiltered', batch_size=64) == \
+        run_wd2cg(dump_path, tmp_path / 'unfiltered', batch_size=64,
+                  prefilter=False)
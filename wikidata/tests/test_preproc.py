@@ -0,0 +1,29 @@
+import json
+
+import numpy as np
+
+from dumps import bad_date_entities, dump_lines
+from wd_dates import ranked_date_dtype, to_dict
+from wd_ids import rank_codes
+from wd_preproc import process_lines
+
+
+def test_bad_dates_keep_the_entity():
+    count, (items, links, label_lines, dates), counts = process_lines(
+        dump_lines(bad_date_entities()))
+    assert count == 4
+    assert not counts['exceptions']
+    assert counts['skipped'] == {'date': 2}
+    assert [json.loads(line)['_key'] for line in items.splitlines()] == \
+        ['Q1', 'Q3']
+    assert [json.loads(line)['_to'] for line in links.splitlines()] == \
+        ['Q2', 'Q4']
+    assert b'\tQ3\n' in label_lines
+    dates = np.frombuffer(dates, dtype=ranked_date_dtype)
+    assert dates['entity'].tolist() == [1, 3]
+    assert dates['year'].tolist() == [1900, 1902]
+    assert dates['rank'].tolist() == [rank_codes['preferred'],
+                                      rank_codes['normal']]
+    assert to_dict(dates) == {
+        'Q1': [['P569', '+1900-01-02T00:00:00Z', 11, 'preferred']],
+        'Q3': [['P569', '+1902-00-00T00:00:00Z', 11, 'normal']]}
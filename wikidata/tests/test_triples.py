@@ -0,0 +1,104 @@
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+import wd2cg
+import wd_extsort
+import wd_triples
+from wd_triples import ChunkSpiller, TripleBuffer, TripleStore
+
+
+def random_store(count, seed):
+    rng = random.Random(seed)
+    buffer = TripleBuffer()
+    for _ in range(count):
+        # few enough distinct statements that chunks share some, and some
+        # with properties that directed flips
+        buffer.add('Q%d' % rng.randint(1, 300),
+                   rng.choice(['P31', 'P40', 'P22', 'P361', 'P527']),
+                   ['Q%d' % rng.randint(1, 300)])
+    return buffer.to_store()
+
+
+@pytest.mark.parametrize('runs_at_once', [128, 3])
+def test_spiller_matches_in_memory(tmp_path, monkeypatch, runs_at_once):
+    # with few runs merged at once, runs are merged early, too
+    monkeypatch.setattr(wd_extsort, 'max_runs', runs_at_once)
+    chunks = [random_store(500, seed) for seed in range(10)]
+    spiller = ChunkSpiller(str(tmp_path / 'statements.txt'),
+                           wd2cg.combined_inverses, 500, run_dir=str(tmp_path))
+    for chunk in chunks:
+        spiller.add(chunk)
+        assert len(spiller.run_paths) < runs_at_once
+    expected = TripleStore.concatenate(chunks).directed(
+        wd2cg.combined_inverses).unique()
+    blocks = list(spiller.merged_blocks(block_size=1000))
+    assert len(blocks) > 1
+    assert [triple for block in blocks for triple in block.iter_triples()] \
+        == list(expected.iter_triples())
+    assert spiller.count == 5000
+    spiller.cleanup()
+
+
+def test_spiller_restore_after_early_merge(tmp_path, monkeypatch):
+    monkeypatch.setattr(wd_extsort, 'max_runs', 3)
+    spiller = ChunkSpiller(str(tmp_path / 'statements.txt'),
+                           wd2cg.combined_inverses, 500, run_dir=str(tmp_path))
+    spiller.add(random_store(500, 0))
+    spiller.add(random_store(500, 1))
+    state = spiller.state()
+    merged = [list(block.iter_triples()) for block in spiller.merged_blocks()]
+    # the runs the state names are merged away, but kept for restore
+    spiller.add(random_store(500, 2))
+    spiller.add(random_store(500, 3))
+    assert len(spiller.run_paths) == 2
+    assert all(os.path.exists(path) for path in state['run_paths'])
+
+    restored = ChunkSpiller(str(tmp_path / 'statements.txt'),
+                            wd2cg.combined_inverses, 500,
+                            run_dir=str(tmp_path))
+    restored.restore(state)
+    assert [list(block.iter_triples())
+            for block in restored.merged_blocks()] == merged
+    # once two later states are saved, they're no longer needed
+    restored.add(random_store(500, 2))
+    restored.add(random_store(500, 3))
+    restored.state()
+    restored.state()
+    assert sorted(os.listdir(restored.run_dir)) == \
+        [os.path.basename(path) for path in restored.run_paths]
+    restored.cleanup()
+
+
+def test_merge_memory_stays_within_block_size(tmp_path):
+    # in a fresh process, so that the peak resident size is this merge's own
+    script = '''
+import os, resource, sys
+import numpy as np
+from wd_triples import TripleStore, merge_runs
+
+paths = []
+rng = np.random.default_rng(1)
+for i in range(32):
+    run = TripleStore.from_rows(rng.integers(0, 1 << 12, (100000, 3))).unique()
+    paths.append(os.path.join(sys.argv[1], 'run-%05d.bin' % i))
+    np.column_stack((run.src, run.prop, run.dst)).tofile(paths[-1])
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# about 75 MB of runs, merged 65536 rows (1.5 MB) at a time
+count = 0
+last = None
+for block in merge_runs(paths, block_size=1 << 16):
+    assert last is None or tuple(block[0]) > last
+    last = tuple(block[-1])
+    count += len(block)
+assert count > 3000000
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print((after - before) * 1024)
+'''
+    growth = subprocess.run(
+        [sys.executable, '-c', script, str(tmp_path)], check=True,
+        capture_output=True, cwd=os.path.dirname(wd_triples.__file__)).stdout
+    assert int(growth) < 16 << 20
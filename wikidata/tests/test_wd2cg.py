@@ -0,0 +1,19 @@
+from dumps import bad_date_entities, dump_lines
+from wd2cg import process_lines
+
+
+def test_bad_dates_keep_the_entity():
+    # process_dump hands process_lines the lines after the opening '['
+    count, nodes, date_claims, labels, statements, counts = process_lines(
+        dump_lines(bad_date_entities())[1:])
+    assert count == 3
+    assert not counts['exceptions']
+    # wd2cg doesn't keep ranks, so only the time that can't be parsed is
+    # skipped
+    assert counts['skipped'] == {'date': 1}
+    assert nodes == {'Q1', 'Q2', 'Q3', 'Q4'}
+    assert list(statements.to_store().iter_triples()) == \
+        [('Q1', 'P40', 'Q2'), ('Q3', 'P40', 'Q4')]
+    assert labels == {'Q1': 'label Q1', 'Q3': 'label Q3'}
+    assert [row[2] for row in date_claims['Q1']] == [1900]
+    assert [row[2] for row in date_claims['Q3']] == [1901, 1902]
@@ -1,64 +1,77 @@
 #!/usr/bin/env python3
 """make causegraph based on wikidata JSON dump"""
 
+import argparse
 import json
+import multiprocessing as mp
+import os
+import pickle
 import pprint
-import sys
-from collections import Counter
+import re
+import time
+from collections import Counter, deque
 
 import networkx as nx
+import numpy as np
 
+from wd_constraints import check_constraints
 from wd_constants import (all_times, cg_rels, times_plus_nested,
                           combined_inverses, lang_order, likely_nonspecific,
                           instance_of)
-
-
-def get_label(obj):
-    """get appropriate label, using language fallback chain"""
-    has_sitelinks = 'sitelinks' in obj
-    for lang in lang_order:
-        site = lang + 'wiki'
-        if has_sitelinks and site in obj['sitelinks']:
-            return obj['sitelinks'][site]['title']
-        elif lang in obj['labels']:
-            return obj['labels'][lang]['value']
-    return None
-
-
-def get_date_claims(claims, props):
-    """get date claims in the specified collection of properties"""
+from wd_checkpoint import Checkpoint
+from wd_dump import batched, decode_line, open_dump, skip_bytes
+from wd_dates import (date_dtype, date_row, earliest_years, save_dates,
+                      to_array)
+from wd_graph import CSRGraph
+from wd_ids import IdArray, IdSet, kind_shift, kinds
+from wd_incremental import (EntityCache, EntityCacheWriter, entity_key,
+                            fingerprint)
+from wd_labelstore import LabelStore, write_labels
+from wd_langs import get_label
+from wd_metrics import RunMetrics
+from wd_ngraph import write_ngraph
+from wd_scan import Extractor
+from wd_shards import ShardedOutput, remove_manifest
+from wd_triples import (ChunkSpiller, TripleBuffer, TripleStore,
+                        text_block_size)
+
+# the stages and counters of this run, which the main program saves to
+# run_metrics.json
+metrics = RunMetrics('wd2cg')
+
+
+def add_date_row(result, skipped, prop, claim_prop, value):
+    """add a date row to result or, if the time can't be read, count it in
+    skipped, so that one bad date doesn't lose the entity's others"""
+    try:
+        result.append(date_row(prop, claim_prop, value))
+    except (KeyError, TypeError, ValueError):
+        skipped['date'] += 1
+
+
+def get_date_claims(claims, props, skipped=None):
+    """get date claims in the specified collection of properties, counting
+    those that can't be read in skipped"""
+    if skipped is None:
+        skipped = Counter()
     result = []
     for claim in claims:
         if claim in props:
             for spec in claims[claim]:
                 if 'time' in spec['mainsnak'].get('datavalue', {}).get(
                         'value', {}):
-                    date = spec['mainsnak']['datavalue']['value']['time']
-                    precision = spec['mainsnak']['datavalue']['value']['precision']
-                    result.append([claim, date, precision])
+                    add_date_row(result, skipped, claim, None,
+                                 spec['mainsnak']['datavalue']['value'])
     return result
 
 
 # (though I'll have to get more precise in the future, for modern-day stuff)
-def dates_to_years(claims):
-    """grab usable years from wikidata dates, to inform CauseGraph layout"""
-    years = {}
-    for item in claims:
-        earliest_year = sys.maxsize
-        for c in claims[item]:
-            try:
-                # example date: March 15, 44 BCE (ignoring calendar issues)
-                # '-44-03-15T00:00:00Z'
-                # so split on '-' (but only the two on the right, so rsplit 2)
-                # and take the first
-                year = int(c[1].rsplit('-', 2)[0])
-                if year < earliest_year:
-                    earliest_year = year
-            except Exception as e:
-                print("error on", item, '-', e.message)
-        if earliest_year < 10000 and earliest_year > -10000:
-            years[item] = earliest_year
-    return years
+def dates_to_years(dates):
+    """grab usable years from wikidata dates (an array of date rows, see
+    wd_dates), to inform CauseGraph layout; returns an IdArray of int16
+    years (they're all within year_limit of 0)"""
+    entities, years = earliest_years(dates)
+    return IdArray.from_codes(entities, years, np.int16)
 
 
 def is_real(qid, claims, fiction_filter):
@@ -82,17 +95,18 @@ def is_real(qid, claims, fiction_filter):
 
 
 def check_claims(qid, claim, claim_set):
-    spec_stmts = []
+    """get the IDs of the entities that a claim points to"""
     other_qids = []
     for spec in claim_set:
         if 'id' in spec['mainsnak'].get('datavalue', {}).get('value', {}):
             other_qid = spec['mainsnak']['datavalue']['value']['id']
             other_qids.append(other_qid)
-            spec_stmts.append(qid + ' ' + claim + ' ' + other_qid)
-    return spec_stmts, other_qids
+    return other_qids
 
 
-def check_nested_dates(claim, claim_set):
+def check_nested_dates(claim, claim_set, skipped=None):
+    if skipped is None:
+        skipped = Counter()
     result = []
     for spec in claim_set:
         qualifiers = spec.get('qualifiers', {})
@@ -100,79 +114,384 @@ def check_nested_dates(claim, claim_set):
             if qualifier in all_times:
                 for item in qualifiers[qualifier]:
                     if 'time' in item.get('datavalue', {}).get('value', {}):
-                        date = item['datavalue']['value']['time']
-                        precision = item['datavalue']['value']['precision']
-                        result.append([claim + ' ' + qualifier, date, precision])
+                        add_date_row(result, skipped, qualifier, claim,
+                                     item['datavalue']['value'])
 
     return result
 
 
-def process_dump(dump_path, fiction_filter):
+# every property process_lines looks at; an entity with none of these can't
+# contribute nodes, statements or dates
+prefilter_props = frozenset(p.encode() for p in
+                            set(cg_rels) | times_plus_nested)
+# claim and qualifier keys look like "P737": in the raw dump lines
+prop_key_re = re.compile(rb'"(P[0-9]+)"\s*:')
+item_prefix = b'{"type":"item","id":"'
+
+
+def has_relevant_props(line):
+    """scan the raw bytes of a dump line for keys of the properties that
+    process_lines uses; this can give false positives (e.g. a matching key in
+    a qualifier of some other claim) but never false negatives"""
+    return not prefilter_props.isdisjoint(prop_key_re.findall(line))
+
+
+def decode_label_fields(line):
+    """decode only the labels and sitelinks of an item's dump line
+
+    returns None if the line isn't laid out as expected, in which case the
+    caller should decode the whole line instead"""
+    text = line.decode('utf-8')
+    decoder = json.JSONDecoder()
+    obj = {}
+    # "labels" and "sitelinks" only occur as keys of the top-level object, and
+    # can't occur unescaped inside string values
+    for field in ('labels', 'sitelinks'):
+        pos = text.find('"%s":' % field)
+        if pos != -1:
+            obj[field], _ = decoder.raw_decode(text, pos + len(field) + 3)
+    if 'labels' not in obj:
+        return None
+    return obj
+
+
+def extract_entity(obj, nodes, date_claims, labels, statements,
+                   skipped=None):
+    """collect the node, dates, label and statements of a decoded entity
+    (nodes is a plain set, to be added to an IdSet a batch at a time, as
+    merge_partial does), counting dates that can't be read in skipped
+
+    the dates come after the statements, so they can't lose the entity
+    anything else"""
+    qid = obj['id']
+
+    if qid not in labels:
+        obj_label = get_label(obj)
+        if obj_label is not None:
+            labels[qid] = obj_label
+
+    is_item = obj['type'] == 'item' or obj['type'] == 'lexeme'
+    if is_item and 'claims' in obj:
+        claims = obj['claims']
+        cg_rel_claims = [c for c in claims if c in cg_rels]
+        item_dates = [c for c in claims if c in all_times]
+        nested_date_claims = [c for c in claims if c in times_plus_nested]
+
+        if cg_rel_claims:
+            nodes.add(qid)
+
+            if instance_of in claims:
+                other_qids = check_claims(
+                    qid, instance_of, claims[instance_of])
+                # is nodes.update() needed here?
+                nodes.update(other_qids)
+                statements.add(qid, instance_of, other_qids)
+        for claim in cg_rel_claims:
+            other_qids = check_claims(qid, claim, claims[claim])
+            nodes.update(other_qids)
+            statements.add(qid, claim, other_qids)
+
+        if item_dates and (qid not in date_claims):
+            main_date_claims = get_date_claims(claims, all_times, skipped)
+        else:
+            main_date_claims = []
+        nested_dates = []
+        for claim in nested_date_claims:
+            nested_dates += check_nested_dates(claim, claims[claim],
+                                               skipped)
+
+        date_claims[qid] = main_date_claims + nested_dates
+
+
+def process_lines(lines, prefilter=True):
+    """collect nodes, dates, labels and statements from a batch of dump lines
+
+    returns the number of lines seen along with the partial results, so that
+    batches can be processed independently (e.g. in worker processes) and
+    merged afterwards with merge_partial, and counts of the entities skipped
+    and exceptions raised, for metrics
+
+    with prefilter, items that have none of the relevant properties skip the
+    full JSON decoding; only their label fields are decoded, if needed"""
     nodes = set()
     date_claims = {}
     labels = {}
-    statements = []
+    statements = TripleBuffer()
+    counts = {'skipped': Counter(), 'exceptions': Counter()}
 
     # collect statements of interest
     # TODO refactor this - it's too complex
-
-    # with open(dump_path) as infile:
-    with sys.stdin as infile:
-        infile.readline()
-        for line in infile:
-            try:
-                obj = json.loads(line.rstrip(',\n'))
-                qid = obj['id']
-
-                if qid not in labels:
-                    obj_label = get_label(obj)
-                    if obj_label is not None:
-                        labels[qid] = obj_label
-
-                is_item = obj['type'] == 'item' or obj['type'] == 'lexeme'
-                if is_item and 'claims' in obj:
-                    claims = obj['claims']
-                    cg_rel_claims = [c for c in claims if c in cg_rels]
-                    item_dates = [c for c in claims if c in all_times]
-                    nested_date_claims = [c for c in claims if
-                                          c in times_plus_nested]
-
-                    if cg_rel_claims:
-                        nodes.add(qid)
-
-                        if instance_of in claims:
-                            spec_stmts, other_qids = check_claims(
-                                qid, instance_of, claims[instance_of])
-                            # is nodes.update() needed here?
-                            nodes.update(other_qids)
-                            statements += spec_stmts
-                    if item_dates and (qid not in date_claims):
-                        main_date_claims = get_date_claims(claims, all_times)
-                    else:
-                        main_date_claims = []
-
-                    for claim in cg_rel_claims:
-                        spec_stmts, other_qids = check_claims(
-                            qid, claim, claims[claim])
-                        nodes.update(other_qids)
-                        statements += spec_stmts
-
-                    nested_dates = []
-                    for claim in nested_date_claims:
-                        nested_dates += check_nested_dates(claim, claims[claim])
-
-                    date_claims[qid] = main_date_claims + nested_dates
-            except Exception as e:
-                if line != ']\n':
-                    print("*** Exception",
-                          type(e), "-", e.message, "on following line:")
-                    print(line)
-
-    return nodes, date_claims, labels, statements
-
-
-def write_statements(statements, path):
-    """write file containing list of statements/relationships"""
+    for line in lines:
+        try:
+            if (prefilter and line.startswith(item_prefix) and
+                    not has_relevant_props(line)):
+                qid_end = line.index(b'"', len(item_prefix))
+                qid = line[len(item_prefix):qid_end].decode('ascii')
+                if qid in labels:
+                    obj = {}
+                else:
+                    obj = decode_label_fields(line)
+                if obj is not None:
+                    if qid not in labels:
+                        obj_label = get_label(obj)
+                        if obj_label is not None:
+                            labels[qid] = obj_label
+                    # an item with claims gets a (here empty) date entry
+                    if b'"claims":' in line:
+                        date_claims[qid] = []
+                    counts['skipped']['prefiltered'] += 1
+                    continue
+
+            extract_entity(decode_line(line), nodes, date_claims, labels,
+                           statements, counts['skipped'])
+        except Exception as e:
+            if line != b']\n':
+                print("*** Exception",
+                      type(e), "-", e, "on following line:")
+                print(line.decode('utf-8', 'replace'))
+                counts['exceptions'][type(e).__name__] += 1
+
+    return len(lines), nodes, date_claims, labels, statements, counts
+
+
+def merge_partial(result, partial):
+    """merge the partial results of process_lines into result, in dump order
+
+    the result's nodes are an IdSet, which takes a few NumPy calls for each
+    update whatever its size, so partials should be of whole batches, not of
+    single entities"""
+    nodes, date_claims, labels, statements = result
+    _, part_nodes, part_dates, part_labels, part_statements = partial[:5]
+    nodes.update(part_nodes)
+    date_claims.update(part_dates)
+    for qid in part_labels:
+        if qid not in labels:
+            labels[qid] = part_labels[qid]
+    statements.extend(part_statements)
+
+
+# changed whenever extracting an entity changes in a way the settings in
+# cache_fingerprint don't show (e.g. which entities or dates are dropped), so
+# that records kept from before aren't reused
+record_version = 2
+
+
+def cache_fingerprint():
+    """what the results kept in an EntityCache depend on"""
+    return fingerprint(cg_rels, all_times, times_plus_nested, lang_order,
+                       instance_of, date_dtype.descr, record_version)
+
+
+def encode_record(partial):
+    """the partial results of process_lines for a single line, as bytes"""
+    _, nodes, date_claims, labels, statements = partial[:5]
+    return pickle.dumps((list(nodes), date_claims, labels,
+                         statements.src.tobytes(), statements.prop.tobytes(),
+                         statements.dst.tobytes()), pickle.HIGHEST_PROTOCOL)
+
+
+def decode_record(record):
+    """the inverse of encode_record"""
+    nodes, date_claims, labels, src, prop, dst = pickle.loads(record)
+    statements = TripleBuffer()
+    statements.src.frombytes(src)
+    statements.prop.frombytes(prop)
+    statements.dst.frombytes(dst)
+    return 1, set(nodes), date_claims, labels, statements
+
+
+def process_cached(lines, records, prefilter=True):
+    """process_lines for a batch of lines along with their records kept by
+    the previous run (None for those that have to be extracted), e.g. in a
+    worker process: extracts each line without a record on its own, and
+    merges its results with those of the records; returns what
+    process_lines returns, and the records of the lines extracted, to be
+    kept for the next run"""
+    result = [set(), {}, {}, TripleBuffer()]
+    new_records = []
+    counts = {'skipped': Counter(), 'exceptions': Counter()}
+    for line, record in zip(lines, records):
+        if record is None:
+            partial = process_lines([line], prefilter)
+            new_records.append(encode_record(partial))
+            for counter in counts:
+                counts[counter].update(partial[5][counter])
+        else:
+            partial = decode_record(record)
+            counts['skipped']['unchanged'] += 1
+        merge_partial(result, partial)
+    return (len(lines),) + tuple(result) + (counts,), new_records
+
+
+def process_dump(dump_path, fiction_filter, workers=1, batch_size=1000,
+                 prefilter=True, spiller=None, checkpoint=None,
+                 checkpoint_every=0, resume=False, cache_path=None):
+    """process the dump at dump_path (or stdin if not given), optionally
+    spreading batches of lines across a pool of worker processes; the results
+    are merged in dump order, so they're the same for any number of workers
+
+    with a ChunkSpiller, statements are handed to it whenever a chunk's worth
+    has been collected, and the returned statements are empty
+
+    with a Checkpoint, one is saved every checkpoint_every entities, and with
+    resume, processing continues from the last one saved (if any); resuming
+    needs the same dump and options as the interrupted run
+
+    with a cache_path, the results of each entity are kept there for the next
+    run, which extracts only the entities that have changed since (see
+    wd_incremental), and reuses the kept results of the rest; the results are
+    the same as without the cache"""
+    # merged a batch at a time (see merge_partial), so keep batch_size from
+    # getting too small
+    result = [IdSet(), {}, {}, TripleBuffer()]
+    entity_count = 0
+    # bytes of the (uncompressed) dump consumed so far
+    offset = None
+    # partial results merged since the last checkpoint
+    since_checkpoint = []
+    checkpoint_count = 0
+    start_time = time.time()
+
+    def save_checkpoint():
+        nonlocal checkpoint_count
+        segment = since_checkpoint
+        spiller_state = None
+        if spiller is not None:
+            # spill everything so far, so that the checkpoint doesn't need
+            # any statements; the merged runs come out the same either way
+            if len(result[3]):
+                spiller.add(result[3].to_store())
+                result[3] = TripleBuffer()
+            spiller_state = spiller.state()
+            segment = [p[:4] + (TripleBuffer(),) + p[5:]
+                       for p in since_checkpoint]
+        checkpoint.save({'offset': offset, 'entity_count': entity_count,
+                         'spiller': spiller_state}, segment)
+        since_checkpoint.clear()
+        checkpoint_count = entity_count
+        print('checkpoint saved after', entity_count, 'entities')
+
+    def merge(partial, batch_bytes):
+        nonlocal entity_count, offset
+        entity_count += partial[0]
+        offset += batch_bytes
+        metrics.add_counts(partial[5])
+        metrics.add_counts({'statements': partial[4].prop_counts()})
+        merge_partial(result, partial)
+        if spiller is not None and len(result[3]) >= spiller.chunk_size:
+            spiller.add(result[3].to_store())
+            result[3] = TripleBuffer()
+        if checkpoint is not None and checkpoint_every:
+            since_checkpoint.append(partial)
+            if entity_count - checkpoint_count >= checkpoint_every:
+                save_checkpoint()
+
+    index = checkpoint.load() if checkpoint is not None and resume else None
+    if index is not None:
+        for segment in checkpoint.segments(index):
+            for partial in segment:
+                merge_partial(result, partial)
+        if spiller is not None:
+            spiller.restore(index['spiller'])
+        entity_count = checkpoint_count = index['entity_count']
+        print('resuming from checkpoint after', entity_count, 'entities')
+    elif checkpoint is not None:
+        # don't build on a stale checkpoint left by some other run
+        checkpoint.remove()
+
+    cache = cache_writer = None
+    reused_count = 0
+    if cache_path is not None:
+        cache = EntityCache(cache_path, cache_fingerprint())
+        cache_writer = EntityCacheWriter(cache_path, cache_fingerprint())
+        print('reusing results of up to', len(cache), 'unchanged entities')
+
+    # start the workers before the dump is opened, since opening a compressed
+    # dump starts a decompression thread, and forking with threads running
+    # isn't safe
+    pool = mp.Pool(workers) if workers > 1 else None
+
+    def run(func, args):
+        """call func now, or in a worker; returns a function giving the
+        result"""
+        if pool is not None:
+            return pool.apply_async(func, args).get
+        value = func(*args)
+        return lambda: value
+
+    def submit(batch):
+        """start processing a batch of lines; returns a function giving the
+        partial results of the batch"""
+        nonlocal reused_count
+        if cache is None:
+            return run(process_lines, (batch, prefilter))
+        keys = [entity_key(line) for line in batch]
+        records = cache.get_many(keys)
+        reused_count += sum(record is not None for record in records)
+        get_result = run(process_cached, (batch, records, prefilter))
+
+        def get_partial():
+            # all that's left here is keeping every record for the next run
+            partial, new_records = get_result()
+            new_records = iter(new_records)
+            for key, record in zip(keys, records):
+                if record is None:
+                    record = next(new_records)
+                cache_writer.add(key, record)
+            return partial
+        return get_partial
+
+    resumed_count = entity_count
+    extract_stage = metrics.stage('extract',
+                                  lambda: entity_count - resumed_count)
+    with extract_stage, open_dump(dump_path) as infile:
+        if index is not None:
+            offset = index['offset']
+            skip_bytes(infile, offset)
+        else:
+            offset = len(infile.readline())
+        # keep a bounded number of batches in flight, so that the whole
+        # dump isn't read into the pool's task queue ahead of the workers
+        pending = deque()
+        for batch in batched(infile, batch_size):
+            pending.append((submit(batch), sum(map(len, batch))))
+            if len(pending) >= workers * 4:
+                get_partial, batch_bytes = pending.popleft()
+                merge(get_partial(), batch_bytes)
+        while pending:
+            get_partial, batch_bytes = pending.popleft()
+            merge(get_partial(), batch_bytes)
+        if pool is not None:
+            # close rather than terminate, so workers flush their output
+            pool.close()
+            pool.join()
+
+    metrics.record_decompression(infile)
+    elapsed = time.time() - start_time
+    print('processed %d entities in %.1f s (%.0f entities/s, %d workers)' %
+          (entity_count, elapsed, entity_count / max(elapsed, 1e-9), workers))
+    if cache_writer is not None:
+        cache_writer.commit()
+        print('reused the results of', reused_count, 'unchanged entities')
+
+    nodes, date_claims, labels, statements = result
+    if spiller is not None:
+        spiller.add(statements.to_store())
+        statements = TripleBuffer()
+    return nodes, date_claims, labels, statements.to_store()
+
+
+def write_statements(statements, path, shards=0):
+    """write file containing list of statements/relationships (with shards,
+    that many shards of it, by source; see wd_shards)"""
+    if shards:
+        with ShardedOutput(path, shards) as outfile:
+            outfile.write_store(statements)
+        return
+    remove_manifest(path)
+    if isinstance(statements, TripleStore):
+        statements.write_text(path)
+        return
     with open(path, 'w') as csvfile:
         for item in statements:
             csvfile.write("%s\n" % item)
@@ -184,18 +503,24 @@ def write_items_json(items, path):
 
 
 def translate_statements(statements, labels):
-    """translate statements to natural language with labels"""
+    """translate statements to natural language with labels (a LabelStore),
+    looking them up a block of statements at a time"""
     statements_en = []
-    for statement in statements:
-        splitup = statement.split()
-        new_statement = []
-        for item in splitup:
-            try:
-                new_statement.append(labels[item])
-            except Exception:
-                print("*** Exception: no label for", item)
-                new_statement.append(item)
-        statements_en.append(' '.join(new_statement))
+    for start in range(0, len(statements), text_block_size):
+        block = statements.select(slice(start, start + text_block_size))
+        # properties are entities too, apart from inverse pseudo-properties
+        prop_codes = np.where(block.prop > 0,
+                              kinds.index('P') << kind_shift | block.prop, -1)
+        columns = [labels.get_codes(codes)
+                   for codes in (block.src, prop_codes, block.dst)]
+        for splitup, found in zip(block.iter_triples(), zip(*columns)):
+            new_statement = []
+            for item, label in zip(splitup, found):
+                if label is None:
+                    print("*** no label for", item)
+                    label = item
+                new_statement.append(label)
+            statements_en.append(' '.join(new_statement))
     return statements_en
 
 
@@ -217,8 +542,7 @@ def write_arangodb_rels(statements, labels):
     rel_header = '_from\t_to\ttype\n'
     with open('relationships.tsv', 'w') as relsfile:
         relsfile.write(rel_header)
-        for statement in statements:
-            splitup = statement.split()
+        for splitup in statements.iter_triples():
             relsfile.write("%s\t%s\t%s\n" % (splitup[0], splitup[2],
                                              splitup[1]))
 
@@ -226,9 +550,8 @@ def write_arangodb_rels(statements, labels):
 def make_nx_graph(statements, labels, years=None):
     # TODO: test this, or maybe get rid of it if not needed
     g = nx.MultiDiGraph()
-    for line in statements:
+    for splitup in statements.iter_triples():
         try:
-            splitup = line.strip().split()
             if splitup[0] in labels:
                 source = labels[splitup[0]]
             else:
@@ -244,15 +567,14 @@ def make_nx_graph(statements, labels, years=None):
                     g.add_node(destination, year=years[splitup[2]])
             g.add_edge(source, destination, type=splitup[1])
         except Exception:
-            print("error on line:", line)
+            print("error on statement:", splitup)
     return g
 
 
 def make_qid_nx_graph(statements, years=None):
     g = nx.MultiDiGraph()
-    for line in statements:
+    for splitup in statements.iter_triples():
         try:
-            splitup = line.strip().split()
             source = splitup[0]
             destination = splitup[2]
             if years is not None:
@@ -262,46 +584,31 @@ def make_qid_nx_graph(statements, years=None):
                     g.add_node(destination, year=years[splitup[2]])
             g.add_edge(source, destination, type=splitup[1])
         except Exception:
-            print("error on line:", line)
+            print("error on statement:", splitup)
     return g
 
 
-def graph_report(nxgraph):
-    """report graph statistics, violations of rules/constraints, etc."""
-    def edge_type(e):
-        edge_data = nxgraph.get_edge_data(*e)
-        return edge_data.get(0, {}).get('type', None)
-
+def graph_report(graph, violations=None):
+    """report graph statistics, violations of rules/constraints (counted,
+    from check_constraints), etc."""
     report = {}
-    report['node_count'] = nxgraph.number_of_nodes()
-    report['edge_count'] = nxgraph.number_of_edges()
-    report['rel_stats'] = Counter([edge_type(e) for e in nxgraph.edges()])
-    report['selfloops'] = list(nx.nodes_with_selfloops(nxgraph))
-    # TODO parents born after "children", or maybe died before (although...)
-    # TODO people "influenced by" others who weren't alive yet (at most, people
-    # would be influenced by the idea of such a person existing)
-    # - might need death dates for this one
-    # TODO identical reciprocal relationships that can't happen (or maybe are
-    #  unlikely and/or indicate a likely misuse of a property)
-    # TODO check other constraints of the various cg_rels
+    report['node_count'] = graph.number_of_nodes()
+    report['edge_count'] = graph.number_of_edges()
+    report['rel_stats'] = graph.type_counts()
+    report['selfloops'] = graph.selfloops()
+    if violations is not None:
+        report['violations'] = {rule: len(violations[rule])
+                                for rule in violations}
+    # further checks (e.g. parents who died well before their children were
+    # born) belong with the others in wd_constraints.check_constraints
     return report
 
 
-def direct(statement):
-    """ensure that a statement is pointing in the right direction, for purposes
-    of labeling and checking based on in-degree and out-degree"""
-    splitup = statement.split()
-    if splitup[1] in combined_inverses:
-        return (splitup[2] + ' ' + combined_inverses[splitup[1]] + ' ' +
-                splitup[0])
-    else:
-        return statement
-
-
 def dedupe_and_direct(statements):
-    """create a set of unique statements oriented in the same direction"""
+    """create a set of unique statements oriented in the same direction, for
+    purposes of labeling and checking based on in-degree and out-degree"""
     print('starting dedupe_and_direct with', len(statements), 'statements')
-    result = {direct(s) for s in statements}
+    result = statements.directed(combined_inverses).unique()
     print('finishing dedupe_and_direct with', len(result), 'statements')
     return result
 
@@ -309,56 +616,208 @@ def dedupe_and_direct(statements):
 def specific_only(statements, years):
     """return the subset of statements for which at least one end of a causal
     statement has a time specified"""
-
-    def is_specific(statement):
-        splitup = statement.split()
-        likely = splitup[1] in likely_nonspecific
-        if likely and splitup[0] not in years and splitup[2] not in years:
-            return False
+    return statements.specific_only(likely_nonspecific, years.codes())
+
+
+def merge_spilled(spiller, years, out_dir='.', shards=0):
+    """write unique_statements.txt and statements_final.txt (in shards, with
+    shards) from the chunks of a ChunkSpiller, merging them a block at a
+    time; returns the final statements"""
+    print('starting dedupe_and_direct with', spiller.count, 'statements')
+    dated_ids = years.codes()
+    unique_count = 0
+    final_blocks = []
+    final_path = os.path.join(out_dir, 'statements_final.txt')
+    if shards:
+        final_file = ShardedOutput(final_path, shards)
+    else:
+        remove_manifest(final_path)
+        final_file = open(final_path, 'w')
+    with open(os.path.join(out_dir, 'unique_statements.txt'), 'w') as \
+            unique_file, final_file:
+        for block in spiller.merged_blocks():
+            unique_count += len(block)
+            block.write_lines(unique_file)
+            final_block = block.specific_only(likely_nonspecific, dated_ids)
+            if shards:
+                final_file.write_store(final_block)
+            else:
+                final_block.write_lines(final_file)
+            final_blocks.append(final_block)
+    print('finishing dedupe_and_direct with', unique_count, 'statements')
+    return TripleStore.concatenate(final_blocks)
+
+
+def write_outputs(nodes, date_claims, labels, statements, spiller=None,
+                  out_dir='.', graphml=False, shards=0):
+    """write the statements (or, with a ChunkSpiller, merge its chunks),
+    their deduplicated and final versions, labels, dates, and the graph,
+    both as arrays and for ngraph (also as GraphML with graphml, which
+    takes far more memory)"""
+    def path(filename):
+        return os.path.join(out_dir, filename)
+
+    with metrics.stage('years'):
+        dates = to_array(date_claims)
+        years = dates_to_years(dates)
+        # now filter years to avoid exceeding Node memory limits
+        year_codes = years.codes()
+        years_compact = years.to_dict(
+            year_codes[nodes.contains_codes(year_codes)])
+    with metrics.stage('dedupe'):
+        if spiller is not None:
+            statements_final = merge_spilled(spiller, years, out_dir,
+                                             shards)
         else:
-            return True
+            write_statements(statements, path('statements.txt'))
+            unique_statements = dedupe_and_direct(statements)
+            del statements
+            write_statements(unique_statements,
+                             path('unique_statements.txt'))
+            statements_final = specific_only(unique_statements, years)
+            del unique_statements
+
+            # TODO consider adding fiction filtering here
+            write_statements(statements_final, path('statements_final.txt'),
+                             shards)
+    with metrics.stage('save'):
+        statements_final.save(path('statements_final.npz'))
+        write_labels(labels, path('wd_labels'))
+        save_dates(dates, path('date_claims.npy'))
+        write_items_json(years_compact, path('wd_years.json'))
+
+#    write_arangodb_nodes(nodes, labels, years_compact)
+#    write_arangodb_rels(statements_final, labels)
 
-    return {statement for statement in statements if is_specific(statement)}
+    with metrics.stage('graph'):
+        graph = CSRGraph.from_store(statements_final, years)
+    with metrics.stage('constraints'):
+        violations = check_constraints(graph, dates)
+    report = graph_report(graph, violations)
+    pprint.pprint(report)
+    metrics.add_counts({'final_statements': report['rel_stats'],
+                        'violations': report['violations']})
+    write_items_json(violations, path('constraint_violations.json'))
+    with metrics.stage('ngraph'):
+        graph.save(path('cg_graph'))
+        write_ngraph(graph, out_dir, LabelStore(path('wd_labels')))
+    if graphml:
+        with metrics.stage('graphml'):
+            # with the full set of relationships, this takes too much RAM
+            nxgraph = make_qid_nx_graph(statements_final, years=years)
+            nx.write_graphml(nxgraph, path('nxcg.graphml'))
+
+
+class CauseGraphExtractor(Extractor):
+    """the same as process_dump, as an extractor for wd_scan (without
+    prefiltering, workers or checkpoints, since wd_scan decodes every entity
+    anyway); with chunk_size, statements are spilled as with --chunk-size"""
+
+    name = 'statements'
+
+    # nodes are collected in a plain set, and added to the IdSet this many
+    # at a time, since adding to an IdSet costs NumPy calls for every update
+    node_batch_size = 1 << 16
+
+    def __init__(self, out_dir='.', chunk_size=0):
+        super().__init__(out_dir)
+        self.nodes = IdSet()
+        self.new_nodes = set()
+        # what was skipped (dates that couldn't be read), by why
+        self.skipped = Counter()
+        self.date_claims = {}
+        self.labels = {}
+        self.statements = TripleBuffer()
+        self.spiller = None
+        if chunk_size:
+            self.spiller = ChunkSpiller(self.path('statements.txt'),
+                                        combined_inverses, chunk_size,
+                                        run_dir=out_dir)
+
+    def process_entity(self, obj):
+        extract_entity(obj, self.new_nodes, self.date_claims, self.labels,
+                       self.statements, self.skipped)
+        if len(self.new_nodes) >= self.node_batch_size:
+            self.nodes.update(self.new_nodes)
+            self.new_nodes = set()
+        if self.spiller is not None and \
+                len(self.statements) >= self.spiller.chunk_size:
+            self.spiller.add(self.statements.to_store())
+            self.statements = TripleBuffer()
+
+    def finish(self):
+        self.nodes.update(self.new_nodes)
+        self.new_nodes = set()
+        if self.spiller is not None:
+            self.spiller.add(self.statements.to_store())
+            self.statements = TripleBuffer()
+        write_outputs(self.nodes, self.date_claims, self.labels,
+                      self.statements.to_store(), self.spiller, self.out_dir)
+        if self.spiller is not None:
+            self.spiller.cleanup()
 
 
 def load_item_filter(path):
-    """create frozenset from JSON file to enable filtering items in it"""
+    """create IdSet from JSON file to enable filtering items in it"""
     with open(path) as filterfile:
         filter_dict = json.loads(filterfile.read())
-        item_filter = frozenset(filter_dict.keys())
+        item_filter = IdSet(filter_dict.keys())
     return item_filter
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        dump_path = sys.argv[1]
-    else:
-        dump_path = 'latest-all.json'
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('dump_path', nargs='?',
+                        help='JSON dump, optionally .gz, .bz2 or .zst '
+                             '(default: read stdin)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes parsing the dump')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='dump lines handed to a worker at a time')
+    parser.add_argument('--no-prefilter', dest='prefilter',
+                        action='store_false',
+                        help='fully decode every entity, even those without '
+                             'any relevant properties')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help='write statements to disk every this many '
+                             'statements instead of keeping them in memory')
+    parser.add_argument('--checkpoint-every', type=int, default=0,
+                        help='save a checkpoint every this many entities')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue from the last checkpoint (run with '
+                             'the same dump and options as before)')
+    parser.add_argument('--incremental', metavar='DIR',
+                        help='keep the results of each entity in DIR, and '
+                             'reuse those kept by the previous run for '
+                             'entities that haven\'t changed since')
+    parser.add_argument('--shards', type=int, default=0,
+                        help='write statements_final.txt in this many '
+                             'shards, by source, for reading in parallel '
+                             '(see wd_shards)')
+    parser.add_argument('--graphml', action='store_true',
+                        help='also write the graph as nxcg.graphml, built '
+                             'with networkx (which needs far more memory)')
+    args = parser.parse_args()
+    if args.incremental and args.checkpoint_every:
+        parser.error('--incremental can\'t be used with checkpoints')
 
     fic_filter = load_item_filter('filter.json')
-    nodes, date_claims, labels, statements = process_dump(dump_path, fic_filter)
-    years = dates_to_years(date_claims)
-    # now filter years to avoid exceeding Node memory limits
-    years_compact = {qid: years[qid] for qid in nodes if qid in years}
-    write_statements(statements, 'statements.txt')
-    unique_statements = dedupe_and_direct(statements)
-    del statements
-    write_statements(unique_statements, 'unique_statements.txt')
-    statements_final = specific_only(unique_statements, years)
-    del unique_statements
-
-    # TODO consider adding fiction filtering here
-    write_statements(statements_final, 'statements_final.txt')
-    write_items_json(labels, 'wd_labels.json')
-    del labels
-    write_items_json(date_claims, 'date_claims.json')
-    write_items_json(years_compact, 'wd_years.json')
-
-#    write_arangodb_nodes(nodes, labels, years_compact)
-#    write_arangodb_rels(statements_final, labels)
-
-    # with the full set of relationships, this takes too much RAM
-    nxgraph = make_qid_nx_graph(statements_final, years=years)
-    graph_report = graph_report(nxgraph)
-    pprint.pprint(graph_report)
-    nx.write_graphml(nxgraph, 'nxcg.graphml')
+    spiller = None
+    if args.chunk_size:
+        spiller = ChunkSpiller('statements.txt', combined_inverses,
+                               args.chunk_size)
+    checkpoint = Checkpoint('wd2cg-checkpoint')
+    nodes, date_claims, labels, statements = process_dump(
+        args.dump_path, fic_filter, workers=args.workers,
+        batch_size=args.batch_size, prefilter=args.prefilter,
+        spiller=spiller, checkpoint=checkpoint,
+        checkpoint_every=args.checkpoint_every, resume=args.resume,
+        cache_path=args.incremental)
+    write_outputs(nodes, date_claims, labels, statements, spiller,
+                  graphml=args.graphml, shards=args.shards)
+
+    # everything's written, so there's nothing left to resume
+    if spiller is not None:
+        spiller.cleanup()
+    checkpoint.remove()
+    metrics.write()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""load JSON lines (wd_preproc's items.jsonl and links.jsonl) into ArangoDB
+through its HTTP bulk import API, in batches sent over several connections
+at once
+
+a batch that fails (a dropped connection, or a 429 or 5xx response) is sent
+again, after waiting twice as long each time; one that's rejected (any
+other error response) stops the load. the loader records in a state file
+how far it's got (every batch before the state's next_batch is done), so a
+load that stopped can go on from there with --resume, or from any batch
+with --start-batch; documents are imported with onDuplicate=replace (by
+default), so the batches that were under way when it stopped can be sent
+again without changing anything
+
+e.g., in place of arangoimport:
+    wd_arango.py items.jsonl items
+    wd_arango.py --edges links.jsonl links
+(for an output written in shards, e.g. by wd_preproc.py --shards, this
+loads each of its shards in turn)
+
+wd_arango_fake is a stand-in for ArangoDB to test loads against"""
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+from wd_dump import batched
+from wd_metrics import RunMetrics
+from wd_shards import output_paths
+
+default_url = 'http://localhost:8529'
+# responses worth sending a batch again after
+retry_statuses = frozenset((429, 500, 502, 503, 504))
+# what the import response counts, for each batch
+result_counts = ('created', 'errors', 'empty', 'updated', 'ignored')
+
+
+class LoadError(Exception):
+    """a batch was rejected, or kept failing"""
+
+
+class ArangoClient:
+    """requests to an ArangoDB database over keep-alive connections, one for
+    each thread making them (so a thread pool makes a connection pool)"""
+
+    def __init__(self, url=default_url, database='_system', username=None,
+                 password=None, timeout=300):
+        parts = urllib.parse.urlsplit(url)
+        self.connection_class = http.client.HTTPSConnection \
+            if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base = parts.path.rstrip('/') + '/_db/' + \
+            urllib.parse.quote(database, safe='')
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json'}
+        if username is not None:
+            credentials = '%s:%s' % (username, password or '')
+            self.headers['Authorization'] = 'Basic ' + \
+                base64.b64encode(credentials.encode()).decode()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.connection_class(self.host, self.port,
+                                               timeout=self.timeout)
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def request(self, method, path, body=None, params=None):
+        """(status, decoded JSON response); raises OSError or HTTPException
+        if the connection fails, after dropping it so that the next request
+        opens another"""
+        if params:
+            path += '?' + urllib.parse.urlencode(params)
+        connection = self.connection()
+        try:
+            connection.request(method, self.base + path, body, self.headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self.local.connection = None
+            raise
+        try:
+            result = json.loads(data) if data else {}
+        except ValueError:
+            # e.g. an error page from a proxy
+            result = {'errorMessage': data[:200].decode(errors='replace')}
+        return response.status, result
+
+    def close(self):
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+
+
+def read_batches(path, batch_size, offset=0):
+    """yield (byte offset, lines) for batches of batch_size lines from path,
+    starting at offset"""
+    with open(path, 'rb') as infile:
+        infile.seek(offset)
+        for lines in batched(infile, batch_size):
+            yield offset, lines
+            offset += sum(map(len, lines))
+
+
+class BulkLoader:
+    """sends a file of JSON lines to a collection in batches over a pool of
+    connections; with edges, the documents' _from and _to can be just keys
+    of the vertex collection's documents (as in links.jsonl)"""
+
+    def __init__(self, client, collection, batch_size=10000, connections=4,
+                 retries=5, backoff=1.0, edges=False, vertex_collection=None,
+                 on_duplicate='replace', state_path=None):
+        self.client = client
+        self.collection = collection
+        self.batch_size = batch_size
+        self.connections = connections
+        self.retries = retries
+        self.backoff = backoff
+        self.edges = edges
+        self.state_path = state_path
+        self.params = {'collection': collection, 'type': 'documents',
+                       'onDuplicate': on_duplicate, 'details': 'true'}
+        if edges and vertex_collection is not None:
+            self.params['fromPrefix'] = self.params['toPrefix'] = \
+                vertex_collection
+        self.counts = Counter()
+        # a few of the documents rejected, with why
+        self.details = []
+
+    def post(self, what, path, body, params=None, ok_statuses=()):
+        """make a POST request, trying again if it fails; returns the
+        response, and the number of retries"""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                status, result = self.client.request('POST', path, body,
+                                                     params)
+            except (OSError, http.client.HTTPException) as e:
+                error = '%s: %s' % (type(e).__name__, e)
+                continue
+            if status < 300 or status in ok_statuses:
+                return result, attempt
+            error = 'HTTP %d: %s' % (status, result.get('errorMessage', ''))
+            if status not in retry_statuses:
+                break
+        raise LoadError('%s: %s' % (what, error))
+
+    def create_collection(self):
+        """create the collection, unless there's one by that name already
+        (409: duplicate name)"""
+        spec = {'name': self.collection, 'type': 3 if self.edges else 2}
+        self.post('creating collection ' + self.collection,
+                  '/_api/collection', json.dumps(spec), ok_statuses=(409,))
+
+    def send(self, index, lines):
+        """import a batch; returns the import's response, and the number of
+        retries"""
+        return self.post('batch %d of %s' % (index, self.collection),
+                         '/_api/import', b''.join(lines), self.params)
+
+    def load_state(self):
+        if self.state_path is None or not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path) as infile:
+            return json.loads(infile.read())
+
+    def save_state(self, path, next_batch, offset):
+        state = {'path': path, 'collection': self.collection,
+                 'batch_size': self.batch_size, 'next_batch': next_batch,
+                 'offset': offset}
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as outfile:
+            outfile.write(json.dumps(state, indent=True))
+        os.replace(tmp_path, self.state_path)
+
+    def remove_state(self):
+        if self.state_path is not None and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def load(self, path, start_batch=0, resume=False):
+        """send the lines of path, from batch start_batch (or with resume,
+        from where the state file says the last load got to); returns the
+        number of documents sent"""
+        offset = 0
+        state = self.load_state() if resume else None
+        if state is not None:
+            if state['batch_size'] != self.batch_size:
+                raise ValueError('the load being resumed had batches of %d '
+                                 'lines' % state['batch_size'])
+            start_batch, offset = state['next_batch'], state['offset']
+            print('resuming', self.collection, 'from batch', start_batch)
+        batches = read_batches(path, self.batch_size, offset)
+        if offset == 0 and start_batch:
+            batches = islice(batches, start_batch, None)
+
+        self.create_collection()
+        # batches done out of order, by index, with their offsets
+        done = {}
+        next_batch = start_batch
+        documents = 0
+
+        def finish(future):
+            nonlocal next_batch, documents
+            index, batch_offset, lines = pending.pop(future)
+            result, retries = future.result()
+            self.counts['retries'] += retries
+            for count in result_counts:
+                self.counts[count] += result.get(count, 0)
+            if len(self.details) < 10:
+                self.details.extend(result.get('details', [])[:10])
+            self.counts['batches'] += 1
+            documents += len(lines)
+            done[index] = batch_offset + sum(map(len, lines))
+            # the state only moves past batches when all before them are done
+            if index == next_batch:
+                while next_batch in done:
+                    end_offset = done.pop(next_batch)
+                    next_batch += 1
+                if self.state_path is not None:
+                    self.save_state(path, next_batch, end_offset)
+
+        pending = {}
+        with ThreadPoolExecutor(self.connections) as executor:
+            try:
+                for index, (batch_offset, lines) in enumerate(batches,
+                                                              start_batch):
+                    future = executor.submit(self.send, index, lines)
+                    pending[future] = (index, batch_offset, lines)
+                    # keep a couple of batches queued for each connection,
+                    # without reading the whole file ahead of them
+                    while len(pending) >= self.connections * 2:
+                        for future in wait(pending,
+                                           return_when=FIRST_COMPLETED)[0]:
+                            finish(future)
+                while pending:
+                    for future in wait(pending,
+                                       return_when=FIRST_COMPLETED)[0]:
+                        finish(future)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+        return documents
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('path', help='JSON lines to import')
+    parser.add_argument('collection', help='collection to import them to')
+    parser.add_argument('--url', default=default_url,
+                        help='ArangoDB server (default: %(default)s)')
+    parser.add_argument('--database', default='_system')
+    parser.add_argument('--username', default='root')
+    parser.add_argument('--password',
+                        default=os.environ.get('ARANGO_PASSWORD'),
+                        help='(default: $ARANGO_PASSWORD)')
+    parser.add_argument('--edges', action='store_true',
+                        help='import to an edge collection')
+    parser.add_argument('--vertex-collection', default='items',
+                        help='collection the edges\' _from and _to keys are '
+                             'in, if not given as collection/key '
+                             '(default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help='lines sent in each request')
+    parser.add_argument('--connections', type=int, default=4,
+                        help='requests under way at once')
+    parser.add_argument('--retries', type=int, default=5,
+                        help='times to send a failed batch again')
+    parser.add_argument('--on-duplicate', default='replace',
+                        choices=('error', 'update', 'replace', 'ignore'))
+    parser.add_argument('--start-batch', type=int, default=0,
+                        help='skip the batches before this one')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue from where the last load of the '
+                             'collection got to')
+    args = parser.parse_args()
+
+    # an output written in shards is loaded a shard at a time, each with a
+    # state file of its own
+    paths = output_paths(args.path)
+    if len(paths) > 1 and args.start_batch:
+        parser.error('--start-batch can\'t be used with shards')
+
+    metrics = RunMetrics('wd_arango_' + args.collection)
+    client = ArangoClient(args.url, args.database, args.username,
+                          args.password)
+    loaders = []
+    sent = 0
+    try:
+        with metrics.stage('load_' + args.collection, lambda: sent):
+            for shard, path in enumerate(paths):
+                state_path = 'wd_arango-%s.json' % args.collection \
+                    if len(paths) == 1 else \
+                    'wd_arango-%s-%05d.json' % (args.collection, shard)
+                loaders.append(BulkLoader(
+                    client, args.collection, args.batch_size,
+                    args.connections, args.retries, edges=args.edges,
+                    vertex_collection=args.vertex_collection,
+                    on_duplicate=args.on_duplicate, state_path=state_path))
+                sent += loaders[-1].load(path, args.start_batch, args.resume)
+    finally:
+        client.close()
+        counts = Counter()
+        for loader in loaders:
+            counts.update(loader.counts)
+        metrics.add_counts({args.collection: counts})
+        metrics.write()
+    # the shards loaded first keep their state until they're all done
+    for loader in loaders:
+        loader.remove_state()
+    print(args.collection + ':', dict(counts))
+    for loader in loaders:
+        for detail in loader.details:
+            print(detail)
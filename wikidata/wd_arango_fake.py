@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""a stand-in for ArangoDB's HTTP API, with just what wd_arango uses
+(creating collections, and bulk imports of JSON lines), keeping the
+documents in memory; for testing loads, and their throughput, without a
+server
+
+it can be made to take a while over each request (as a server busy writing
+would), and to fail some of them, with a 503 or by dropping the connection,
+to see the loader's retries at work
+
+usage: wd_arango_fake.py items.jsonl links.jsonl
+loads both into a fake server with different numbers of connections,
+checking that every document arrives intact, and reports how fast; or
+wd_arango_fake.py --serve 8529 to run one for wd_arango.py to load into"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from wd_arango import ArangoClient, BulkLoader
+
+# /_db/<database> is optional, as with ArangoDB
+api_path = re.compile(r'^(?:/_db/[^/]+)?(/_api/.*)$')
+document_type, edge_type = 2, 3
+
+
+class FakeArangoHandler(BaseHTTPRequestHandler):
+    # keep connections open between requests, as ArangoDB does
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, result):
+        body = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def error(self, status, error_num, message):
+        self.respond(status, {'error': True, 'code': status,
+                              'errorNum': error_num, 'errorMessage': message})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        parts = urlsplit(self.path)
+        match = api_path.match(parts.path)
+        params = {name: values[-1]
+                  for name, values in parse_qs(parts.query).items()}
+        outcome = server.outcome()
+        server.requests[outcome] += 1
+        if outcome == 'dropped':
+            # as if the server went away mid-request
+            self.close_connection = True
+            return
+        if outcome == 'unavailable':
+            return self.error(503, 503, 'service unavailable')
+        if match is None:
+            return self.error(404, 404, 'unknown path')
+        if match.group(1) == '/_api/collection':
+            spec = json.loads(body)
+            status, result = server.create_collection(
+                spec['name'], spec.get('type', document_type))
+        elif match.group(1) == '/_api/import':
+            status, result = server.import_lines(body.split(b'\n'), params)
+        else:
+            return self.error(404, 404, 'unknown path')
+        self.respond(status, result)
+
+
+class FakeArango(ThreadingHTTPServer):
+    """serves requests on address (by default, on a free port) in a thread
+    for each connection; delay is the seconds each request takes, and
+    fail_rate and drop_rate how many of them (chosen at random, with seed)
+    get a 503 or a dropped connection"""
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), delay=0.0, fail_rate=0.0,
+                 drop_rate=0.0, seed=0):
+        super().__init__(address, FakeArangoHandler)
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # name -> (collection type, {key: document})
+        self.collections = {}
+        self.requests = Counter()
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address[:2]
+
+    def outcome(self):
+        """how a request goes: 'ok', 'unavailable' or 'dropped'"""
+        if self.delay:
+            time.sleep(self.delay)
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.drop_rate:
+            return 'dropped'
+        if roll < self.drop_rate + self.fail_rate:
+            return 'unavailable'
+        return 'ok'
+
+    def create_collection(self, name, collection_type):
+        with self.lock:
+            if name in self.collections:
+                return 409, {'error': True, 'code': 409, 'errorNum': 1207,
+                             'errorMessage': 'duplicate name'}
+            self.collections[name] = (collection_type, {})
+        return 200, {'error': False, 'name': name, 'type': collection_type}
+
+    def import_lines(self, lines, params):
+        """import JSON lines the way ArangoDB's /_api/import with
+        type=documents does"""
+        name = params.get('collection')
+        if name not in self.collections:
+            return 404, {'error': True, 'code': 404, 'errorNum': 1203,
+                         'errorMessage': 'collection or view not found: %s'
+                                         % name}
+        collection_type, documents = self.collections[name]
+        on_duplicate = params.get('onDuplicate', 'error')
+        prefixes = {'_from': params.get('fromPrefix'),
+                    '_to': params.get('toPrefix')}
+        result = Counter()
+        details = []
+        # the last line is empty if the body ends with a newline
+        if lines and not lines[-1].strip():
+            lines = lines[:-1]
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                result['empty'] += 1
+                continue
+            try:
+                document = json.loads(line)
+            except ValueError:
+                document = None
+            if not isinstance(document, dict):
+                result['errors'] += 1
+                details.append('at position %d: invalid JSON type' % number)
+                continue
+            if collection_type == edge_type:
+                if '_from' not in document or '_to' not in document:
+                    result['errors'] += 1
+                    details.append('at position %d: missing _from or _to '
+                                   'attribute' % number)
+                    continue
+                for end, prefix in prefixes.items():
+                    if prefix and '/' not in document[end]:
+                        document[end] = prefix + '/' + document[end]
+            with self.lock:
+                key = document.setdefault('_key', str(len(documents) + 1))
+                if key not in documents:
+                    documents[key] = document
+                    result['created'] += 1
+                elif on_duplicate == 'replace':
+                    documents[key] = document
+                    result['updated'] += 1
+                elif on_duplicate == 'update':
+                    documents[key] = dict(documents[key], **document)
+                    result['updated'] += 1
+                elif on_duplicate == 'ignore':
+                    result['ignored'] += 1
+                else:
+                    result['errors'] += 1
+                    details.append('at position %d: unique constraint '
+                                   'violated' % number)
+        result = dict({'error': False, 'created': 0, 'errors': 0,
+                       'empty': 0, 'updated': 0, 'ignored': 0}, **result)
+        if params.get('details') == 'true':
+            result['details'] = details
+        return 201, result
+
+    def start(self):
+        """serve in a background thread"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+def check_load(server, collection, path, vertex_collection=None):
+    """the number of lines of path whose document isn't in the server's
+    collection as it is in the file"""
+    documents = server.collections[collection][1]
+    missing = 0
+    with open(path, 'rb') as infile:
+        for line in infile:
+            expected = json.loads(line)
+            if vertex_collection is not None:
+                for end in ('_from', '_to'):
+                    if '/' not in expected[end]:
+                        expected[end] = vertex_collection + '/' + \
+                            expected[end]
+            if documents.get(expected['_key']) != expected:
+                missing += 1
+    return missing
+
+
+def benchmark(items_path, links_path, connection_counts, batch_size,
+              delay=0.0, fail_rate=0.0, drop_rate=0.0):
+    """load items and links into a new fake server for each number of
+    connections; yields (connections, seconds, documents/s, requests,
+    retries, documents not loaded intact)"""
+    for connections in connection_counts:
+        server = FakeArango(delay=delay, fail_rate=fail_rate,
+                            drop_rate=drop_rate).start()
+        client = ArangoClient(server.url)
+        start_time = time.time()
+        sent = retries = 0
+        for path, collection, edges in ((items_path, 'items', False),
+                                        (links_path, 'links', True)):
+            loader = BulkLoader(client, collection, batch_size, connections,
+                                backoff=0.01, edges=edges,
+                                vertex_collection='items')
+            sent += loader.load(path)
+            retries += loader.counts['retries']
+        elapsed = time.time() - start_time
+        client.close()
+        missing = check_load(server, 'items', items_path) + \
+            check_load(server, 'links', links_path, 'items')
+        server.shutdown()
+        server.server_close()
+        yield (connections, elapsed, sent / elapsed,
+               sum(server.requests.values()), retries, missing)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('items_path', nargs='?', default='items.jsonl')
+    parser.add_argument('links_path', nargs='?', default='links.jsonl')
+    parser.add_argument('--connections', type=int, nargs='+',
+                        default=[1, 2, 4, 8])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--delay', type=float, default=0.005,
+                        help='seconds the server takes over each request')
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='share of requests answered with a 503')
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help='share of requests whose connection is dropped')
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help='just serve on this port')
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        server = FakeArango(('127.0.0.1', args.serve), args.delay,
+                            args.fail_rate, args.drop_rate)
+        print('serving on', server.url)
+        server.serve_forever()
+    else:
+        print('connections\tseconds\tdocuments/s\trequests\tretries\t'
+              'not loaded')
+        for result in benchmark(args.items_path, args.links_path,
+                                args.connections, args.batch_size,
+                                args.delay, args.fail_rate, args.drop_rate):
+            print('%d\t%.2f\t%.0f\t%d\t%d\t%d' % result)
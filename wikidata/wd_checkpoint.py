@@ -0,0 +1,63 @@
+"""checkpoints for resuming long passes over the dump"""
+
+import os
+import pickle
+import shutil
+
+
+class Checkpoint:
+    """a directory holding a small index (input offset, counters, etc.) and
+    numbered segments of pickled results, each segment holding only what was
+    extracted since the checkpoint before it, so that saving a checkpoint
+    doesn't mean writing out everything extracted so far"""
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = os.path.join(path, 'index.pkl')
+
+    def segment_path(self, number):
+        return os.path.join(self.path, 'segment-%05d.pkl' % number)
+
+    def exists(self):
+        return os.path.exists(self.index_path)
+
+    def load(self):
+        """return the index of the last checkpoint, or None if there isn't
+        one; the index's 'segments' is the number of segments"""
+        if not self.exists():
+            return None
+        with open(self.index_path, 'rb') as index_file:
+            return pickle.load(index_file)
+
+    def segments(self, index):
+        """yield the segments saved up to the checkpoint with this index"""
+        for number in range(index['segments']):
+            with open(self.segment_path(number), 'rb') as segment_file:
+                yield pickle.load(segment_file)
+
+    def save(self, index, segment=None):
+        """save a checkpoint; the index is written last, and atomically, so
+        that an interrupted save leaves the previous checkpoint intact"""
+        os.makedirs(self.path, exist_ok=True)
+        previous = self.load()
+        index = dict(index, segments=previous['segments'] if previous else 0)
+        if segment is not None:
+            with open(self.segment_path(index['segments']), 'wb') as outfile:
+                pickle.dump(segment, outfile, pickle.HIGHEST_PROTOCOL)
+            index['segments'] += 1
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'wb') as outfile:
+            pickle.dump(index, outfile, pickle.HIGHEST_PROTOCOL)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def truncate_outputs(sizes):
+    """cut output files back to the sizes recorded in a checkpoint, dropping
+    anything written after it"""
+    for path in sizes:
+        os.truncate(path, sizes[path])
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""compact columnar extract of a Wikidata dump, so that analyses can load
+just the columns they need instead of scanning the dump again
+
+the extract is a directory of raw column files that are memory-mapped as
+NumPy arrays, described by meta.json; it has four tables:
+
+    entities    entity, label
+    claims      entity, prop, target, rank  (item-valued claims)
+    times       entity, prop, claim_prop, year, month, day, precision, rank
+    sitelinks   entity, site, title
+
+entities and targets are entity codes, props are property numbers and
+ranks are rank codes (see wd_ids); a time in a qualifier has the
+qualifier's property as prop and the property of the claim it qualifies as
+claim_prop (which is 0 for the time values of claims themselves); ranks
+index the 'ranks' list in meta.json, and sites the 'sites' list
+
+make one with: wd_scan.py dump.json.gz -e columns"""
+
+import json
+import os
+import sys
+from array import array
+
+import numpy as np
+
+from wd_constants import all_times, times_plus_nested
+from wd_dates import parse_time, year_limit
+from wd_ids import encode_id, encode_prop, rank_codes, ranks
+from wd_langs import get_label
+from wd_scan import Extractor
+
+# column name -> array typecode, for each table; string columns are None
+tables = {
+    'entities': {'entity': 'q', 'label': None},
+    'claims': {'entity': 'q', 'prop': 'i', 'target': 'q', 'rank': 'b'},
+    'times': {'entity': 'q', 'prop': 'i', 'claim_prop': 'i', 'year': 'q',
+              'month': 'b', 'day': 'b', 'precision': 'b', 'rank': 'b'},
+    'sitelinks': {'entity': 'q', 'site': 'h', 'title': None},
+}
+
+# column values are written out this many at a time
+flush_size = 1 << 16
+
+
+class ColumnWriter:
+    """appends values to a raw column file, a block at a time"""
+
+    def __init__(self, path, typecode):
+        self.outfile = open(path, 'wb')
+        self.values = array(typecode)
+        self.count = 0
+
+    def append(self, value):
+        self.values.append(value)
+        if len(self.values) >= flush_size:
+            self.flush()
+
+    def flush(self):
+        self.count += len(self.values)
+        self.values.tofile(self.outfile)
+        del self.values[:]
+
+    def close(self):
+        self.flush()
+        self.outfile.close()
+
+
+class StringColumnWriter:
+    """appends strings, as UTF-8, to a data file, along with a column of the
+    offsets where each one starts (and, last, where the data ends)"""
+
+    def __init__(self, path):
+        self.outfile = open(path, 'wb')
+        self.offsets = ColumnWriter(path + '.offsets', 'q')
+        self.size = 0
+        self.offsets.append(0)
+
+    def append(self, value):
+        data = (value or '').encode('utf-8', 'surrogatepass')
+        self.outfile.write(data)
+        self.size += len(data)
+        self.offsets.append(self.size)
+
+    def close(self):
+        self.outfile.close()
+        self.offsets.close()
+
+
+def column_path(path, table, column):
+    return os.path.join(path, '%s.%s' % (table, column))
+
+
+class ColumnarExtractor(Extractor):
+    """writes the columnar extract as the dump is scanned"""
+
+    name = 'columns'
+
+    def start(self):
+        super().start()
+        self.sites = {}
+        self.writers = {}
+        for table in tables:
+            for column, typecode in tables[table].items():
+                path = column_path(self.out_dir, table, column)
+                if typecode is None:
+                    writer = StringColumnWriter(path)
+                else:
+                    writer = ColumnWriter(path, typecode)
+                self.writers[table, column] = writer
+
+    def add_row(self, table, *values):
+        for column, value in zip(tables[table], values):
+            self.writers[table, column].append(value)
+
+    def add_time(self, entity, prop, claim_prop, snak, rank):
+        value = snak.get('datavalue', {}).get('value', {})
+        if 'time' in value:
+            year, month, day = parse_time(value['time'])
+            self.add_row('times', entity, encode_prop(prop), claim_prop,
+                         year, month, day, value['precision'], rank)
+
+    def process_entity(self, obj):
+        entity = encode_id(obj['id'])
+        self.add_row('entities', entity, get_label(obj))
+
+        for site, sitelink in obj.get('sitelinks', {}).items():
+            if site not in self.sites:
+                self.sites[site] = len(self.sites)
+            self.add_row('sitelinks', entity, self.sites[site],
+                         sitelink['title'])
+
+        # lexemes, and items without claims, can have [] for their claims
+        claims = obj.get('claims') or {}
+        for prop in claims:
+            prop_code = encode_prop(prop)
+            for spec in claims[prop]:
+                rank = rank_codes[spec.get('rank', 'normal')]
+                snak = spec['mainsnak']
+                value = snak.get('datavalue', {}).get('value', {})
+                if isinstance(value, dict) and 'id' in value:
+                    self.add_row('claims', entity, prop_code,
+                                 encode_id(value['id']), rank)
+                elif snak.get('datatype') == 'time':
+                    self.add_time(entity, prop, 0, snak, rank)
+                qualifiers = spec.get('qualifiers', {})
+                for qualifier in qualifiers:
+                    for qualifier_snak in qualifiers[qualifier]:
+                        if qualifier_snak.get('datatype') == 'time':
+                            self.add_time(entity, qualifier, prop_code,
+                                          qualifier_snak, rank)
+
+    def finish(self):
+        meta = {'tables': {}, 'ranks': ranks,
+                'sites': sorted(self.sites, key=self.sites.get)}
+        for table in tables:
+            columns = {}
+            for column, typecode in tables[table].items():
+                self.writers[table, column].close()
+                columns[column] = np.dtype(typecode).str if typecode else 'str'
+            rows = self.writers[table, next(iter(tables[table]))].count
+            meta['tables'][table] = {'rows': rows, 'columns': columns}
+        with open(os.path.join(self.out_dir, 'meta.json'), 'w') as metafile:
+            metafile.write(json.dumps(meta, indent=True))
+
+
+class StringColumn:
+    """a memory-mapped column of strings"""
+
+    def __init__(self, path):
+        self.offsets = np.memmap(path + '.offsets', dtype=np.int64, mode='r')
+        self.data = np.memmap(path, dtype=np.uint8, mode='r') \
+            if self.offsets[-1] else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self.data[start:end].tobytes().decode('utf-8', 'surrogatepass')
+
+
+class Columns:
+    """reader for a columnar extract; columns are memory-mapped when they're
+    asked for, and only then"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as metafile:
+            self.meta = json.loads(metafile.read())
+        self.sites = self.meta['sites']
+
+    def rows(self, table):
+        return self.meta['tables'][table]['rows']
+
+    def column(self, table, column):
+        """one column, as a NumPy array (or a StringColumn)"""
+        dtype = self.meta['tables'][table]['columns'][column]
+        path = column_path(self.path, table, column)
+        if dtype == 'str':
+            return StringColumn(path)
+        if not self.rows(table):
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    def table(self, table, columns=None):
+        """a dict of the requested columns of a table (default: all)"""
+        if columns is None:
+            columns = self.meta['tables'][table]['columns']
+        return {column: self.column(table, column) for column in columns}
+
+    def labels(self):
+        """dict from entity code to label, for entities that have one"""
+        entities = self.column('entities', 'entity')
+        labels = self.column('entities', 'label')
+        lengths = np.diff(labels.offsets)
+        return {int(entities[row]): labels[row]
+                for row in np.flatnonzero(lengths).tolist()}
+
+    def earliest_years(self):
+        """the earliest year of each entity among its dates, as used by wd2cg
+        (see dates_to_years there); returns arrays of entity codes and years"""
+        times = self.table('times', ('entity', 'prop', 'claim_prop', 'year'))
+        used = np.isin(times['prop'], [encode_prop(p) for p in all_times]) & (
+            (times['claim_prop'] == 0) |
+            np.isin(times['claim_prop'],
+                    [encode_prop(p) for p in times_plus_nested]))
+        entities, years = times['entity'][used], times['year'][used]
+        order = np.lexsort((years, entities))
+        entities, years = entities[order], years[order]
+        first = np.ones(len(entities), dtype=bool)
+        first[1:] = entities[1:] != entities[:-1]
+        entities, years = entities[first], years[first]
+        in_range = (years > -year_limit) & (years < year_limit)
+        return entities[in_range], years[in_range]
+
+
+# usage: wd_columns.py extract-dir
+if __name__ == "__main__":
+    columns = Columns(sys.argv[1])
+    for table in columns.meta['tables']:
+        print(table, columns.rows(table), 'rows:',
+              ', '.join(columns.meta['tables'][table]['columns']))
+    print(len(columns.sites), 'sites')
@@ -0,0 +1,146 @@
+"""constraint checks on the statement graph, comparing the dates at either
+end of every edge of a kind at once, as array operations on a CSRGraph"""
+
+import numpy as np
+
+from wd_constants import ends, starts
+from wd_dates import group_starts
+from wd_graph import no_year
+from wd_ids import decode_prop, encode_prop
+
+# (property, reversed) for edges from a parent to a child, and from someone
+# to someone they influenced; reversed edges go the other way (statements
+# are usually directed already, see wd2cg.dedupe_and_direct, but this way
+# either kind works)
+parent_rels = (('P40', False), ('P22', True), ('P25', True))
+influence_rels = (('P737i', False), ('P737', True))
+
+# properties for which 'A p B' and 'B p A' can't both be true
+asymmetric_rels = ('P40', 'P22', 'P25', 'P3448', 'P3448i', 'P184', 'P185',
+                   'P1066', 'P802', 'P155', 'P156', 'P1365', 'P1366')
+
+# dates less precise than a year (e.g. decades or centuries) aren't compared
+min_precision = 9
+
+
+def extreme_years(codes, entities, years, reduce):
+    """the years of the given (sorted, unique) entity codes, reduced by
+    reduce (e.g. np.minimum) over each one's rows, or no_year for none"""
+    result = np.full(len(codes), no_year, dtype=np.int64)
+    if len(entities):
+        order = np.argsort(entities, kind='stable')
+        entities, years = entities[order], years[order]
+        starts = group_starts(entities)
+        result[np.searchsorted(codes, entities[starts])] = \
+            reduce.reduceat(years, starts)
+    return result
+
+
+def life_spans(dates):
+    """entity codes, with the earliest year among each one's start dates
+    (e.g. date of birth) and the latest among its end dates (e.g. date of
+    death), or no_year where there isn't one; from an array of date rows
+    (see wd_dates)"""
+    used = (dates['claim_prop'] == 0) & (dates['precision'] >= min_precision)
+    is_start = used & np.isin(dates['prop'], [encode_prop(p) for p in starts])
+    is_end = used & np.isin(dates['prop'], [encode_prop(p) for p in ends])
+    codes = np.unique(dates['entity'][is_start | is_end])
+    return (codes,
+            extreme_years(codes, dates['entity'][is_start],
+                          dates['year'][is_start], np.minimum),
+            extreme_years(codes, dates['entity'][is_end],
+                          dates['year'][is_end], np.maximum))
+
+
+def node_values(graph, codes, values):
+    """an array of values for the nodes of graph, from the values for
+    (unsorted) entity codes, with no_year for nodes without one"""
+    result = np.full(graph.number_of_nodes(), no_year, dtype=np.int64)
+    if len(codes) and len(result):
+        pos = np.minimum(np.searchsorted(graph.nodes, codes), len(result) - 1)
+        found = graph.nodes[pos] == codes
+        result[pos[found]] = values[found]
+    return result
+
+
+def edges_of(graph, rels, src=None):
+    """(from, to, edge) node and edge numbers of the edges of the given
+    (property, reversed) rels, with reversed ones turned around"""
+    if src is None:
+        src = graph.out_src()
+    from_nodes, to_nodes, edges = [], [], []
+    for prop, is_reversed in rels:
+        edge = np.flatnonzero(graph.out_type == encode_prop(prop))
+        if is_reversed:
+            from_nodes.append(graph.out_dst[edge])
+            to_nodes.append(src[edge])
+        else:
+            from_nodes.append(src[edge])
+            to_nodes.append(graph.out_dst[edge])
+        edges.append(edge)
+    return (np.concatenate(from_nodes), np.concatenate(to_nodes),
+            np.concatenate(edges))
+
+
+def reciprocal_edges(graph, props, src=None):
+    """edges 'A p B' (for p in props) where 'B p A' is also present; each
+    pair is given once, by the edge with the lower-numbered source"""
+    if src is None:
+        src = graph.out_src()
+    n = graph.number_of_nodes()
+    found = []
+    for prop in props:
+        edge = np.flatnonzero(graph.out_type == encode_prop(prop))
+        forward = src[edge].astype(np.int64) * n + graph.out_dst[edge]
+        backward = graph.out_dst[edge].astype(np.int64) * n + src[edge]
+        found.append(edge[np.isin(backward, forward) &
+                          (src[edge] < graph.out_dst[edge])])
+    return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+
+def check_constraints(graph, dates):
+    """check the graph for statements that can't be right, given an array
+    of date rows (see wd_dates); returns a dict from each rule to its
+    violations, which are (source, property, destination, and the two years
+    compared) for edges, or (entity, start year, end year) for entities"""
+    codes, first_years, last_years = life_spans(dates)
+    first = node_values(graph, codes, first_years)
+    last = node_values(graph, codes, last_years)
+    src = graph.out_src()
+
+    def year(value):
+        return None if value == no_year else value
+
+    def edge_violations(edges, src_years, dst_years):
+        return [(graph.node_id(src[e]), decode_prop(int(graph.out_type[e])),
+                 graph.node_id(graph.out_dst[e]), year(s), year(d))
+                for e, s, d in zip(edges.tolist(), src_years.tolist(),
+                                   dst_years.tolist())]
+
+    violations = {}
+
+    parent, child, edge = edges_of(graph, parent_rels, src)
+    bad = (first[parent] != no_year) & (first[child] != no_year) & \
+        (first[parent] > first[child])
+    violations['parent born after child'] = edge_violations(
+        edge[bad], first[parent][bad], first[child][bad])
+
+    influencer, influenced, edge = edges_of(graph, influence_rels, src)
+    bad = (first[influencer] != no_year) & (last[influenced] != no_year) & \
+        (first[influencer] > last[influenced])
+    violations['influenced by someone born after their death'] = \
+        edge_violations(edge[bad], first[influencer][bad],
+                        last[influenced][bad])
+
+    edge = reciprocal_edges(graph, asymmetric_rels, src)
+    violations['impossible reciprocal relationship'] = edge_violations(
+        edge, first[src[edge]], first[graph.out_dst[edge]])
+
+    bad = np.flatnonzero((first != no_year) & (last != no_year) &
+                         (last < first))
+    violations['ended before it started'] = [
+        (graph.node_id(i), s, e)
+        for i, s, e in zip(bad.tolist(), first[bad].tolist(),
+                           last[bad].tolist())]
+
+    return violations
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""date claims as a structured NumPy array, decoded from their timestamps
+once while extracting, and saved as date_claims.npy to be memory-mapped by
+whatever reads it (instead of re-parsing date_claims.json)
+
+each row is a time value of an entity: prop is the property (see wd_ids) of
+the claim or, for a time in a qualifier, of the qualifier, in which case
+claim_prop is the property of the claim it qualifies (0 for the time values
+of claims themselves); rows are in the order they were found in
+
+wd_preproc writes its dates (date_claims.bin) with one more column, rank,
+the rank of the claim (for a qualifier's time, of the claim it qualifies),
+as rows of ranked_date_dtype one after another, without a header, so they
+can be appended to as they're extracted; load_dates loads either"""
+
+import json
+import os
+import sys
+
+import numpy as np
+
+from wd_ids import (decode_id, decode_prop, encode_id, encode_prop,
+                    rank_codes, ranks)
+
+date_dtype = np.dtype([('entity', np.int64), ('prop', np.int32),
+                       ('claim_prop', np.int32), ('year', np.int64),
+                       ('month', np.int8), ('day', np.int8),
+                       ('precision', np.int8)])
+
+# the rank column has rank codes (see wd_ids)
+ranked_date_dtype = np.dtype(date_dtype.descr + [('rank', np.int8)])
+
+# years as far from 0 as this (e.g. the age of the universe) aren't used for
+# layout
+year_limit = 10000
+
+
+def parse_time(time):
+    """'+1952-03-11T00:00:00Z' -> (1952, 3, 11); the month and day are 0
+    when they're unknown"""
+    date = time.split('T', 1)[0]
+    year, month, day = date.rsplit('-', 2)
+    return int(year), int(month), int(day)
+
+
+def format_time(year, month, day):
+    """the inverse of parse_time, for the dates Wikidata has (which are all
+    at midnight)"""
+    return '%+05d-%02d-%02dT00:00:00Z' % (year, month, day)
+
+
+def date_row(prop, claim_prop, value):
+    """an entity's row (without the entity) for the time value of a claim,
+    or of a qualifier of a claim_prop claim (None for a claim's own value)"""
+    year, month, day = parse_time(value['time'])
+    return (encode_prop(prop), encode_prop(claim_prop) if claim_prop else 0,
+            year, month, day, value['precision'])
+
+
+def ranked_date_row(prop, claim_prop, value, rank):
+    """date_row, with the rank of the claim"""
+    return date_row(prop, claim_prop, value) + (rank_codes[rank],)
+
+
+def to_array(date_claims):
+    """an array of date rows, from a dict of each entity's rows"""
+    count = sum(map(len, date_claims.values()))
+    return np.fromiter(((encode_id(qid),) + row
+                        for qid in date_claims for row in date_claims[qid]),
+                       dtype=date_dtype, count=count)
+
+
+def save_dates(dates, path):
+    np.save(path, dates)
+
+
+def load_dates(path, mmap=True):
+    """load saved date rows (or, from a .bin file, ranked date rows),
+    memory-mapped unless mmap is False"""
+    if path.endswith('.bin'):
+        # np.memmap can't map an empty file
+        if mmap and os.path.getsize(path):
+            return np.memmap(path, dtype=ranked_date_dtype, mode='r')
+        return np.fromfile(path, dtype=ranked_date_dtype)
+    return np.load(path, mmap_mode='r' if mmap else None)
+
+
+def group_starts(values):
+    """where each run of equal values starts"""
+    return np.flatnonzero(np.r_[True, values[1:] != values[:-1]][:len(values)])
+
+
+def earliest_years(dates):
+    """the earliest year of each entity among its dates, for those where it
+    isn't too far from 0; returns arrays of entity codes and years, in the
+    order the entities first appear"""
+    order = np.argsort(dates['entity'], kind='stable')
+    entities = dates['entity'][order]
+    starts = group_starts(entities)
+    years = np.minimum.reduceat(dates['year'][order], starts) if len(starts) \
+        else np.zeros(0, dtype=np.int64)
+    # order[starts] is where each entity first appears, since the sort is
+    # stable
+    first = np.argsort(order[starts])
+    entities, years = entities[starts][first], years[first]
+    in_range = (years > -year_limit) & (years < year_limit)
+    return entities[in_range], years[in_range]
+
+
+def to_dict(dates):
+    """the rows as the lists that used to be written to date_claims.json:
+    [prop, time, precision], with 'claim_prop prop' as the prop for dates in
+    qualifiers (and with the rank last, for ranked rows)"""
+    claims = {}
+    for row in dates.tolist():
+        entity, prop, claim_prop, year, month, day, precision = row[:7]
+        prop = decode_prop(prop)
+        if claim_prop:
+            prop = decode_prop(claim_prop) + ' ' + prop
+        claims.setdefault(decode_id(entity), []).append(
+            [prop, format_time(year, month, day), precision] +
+            [ranks[rank] for rank in row[7:]])
+    return claims
+
+
+# usage: wd_dates.py [date_claims.npy or .bin] > date_claims.json
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else 'date_claims.npy'
+    print(json.dumps(to_dict(load_dates(path)), indent=True))
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""shared reader for Wikidata JSON dumps, using the fastest JSON decoder
+available (orjson, then msgspec, then the standard library)"""
+
+import bz2
+import concurrent.futures
+import gc
+import io
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+
+# name -> function decoding a JSON document straight from bytes
+backends = {}
+# exceptions each backend raises on input it can't decode
+decode_errors = {'json': ValueError}
+
+try:
+    import orjson
+    backends['orjson'] = orjson.loads
+    decode_errors['orjson'] = orjson.JSONDecodeError
+except ImportError:
+    pass
+
+try:
+    import msgspec
+    backends['msgspec'] = msgspec.json.decode
+    decode_errors['msgspec'] = msgspec.DecodeError
+except ImportError:
+    pass
+
+backends['json'] = json.loads
+preference = ('orjson', 'msgspec', 'json')
+
+
+def get_backend(name=None):
+    """return (name, loads) for the named backend, or else the one set in the
+    CG_JSON_BACKEND environment variable, or else the fastest available"""
+    name = name or os.environ.get('CG_JSON_BACKEND')
+    if name:
+        if name not in backends:
+            raise ValueError('JSON backend %s is not available' % name)
+        return name, backends[name]
+    for name in preference:
+        if name in backends:
+            return name, backends[name]
+
+
+backend_name, backend_loads = get_backend()
+
+
+def loads(data):
+    """decode JSON from bytes (or str) with the selected backend; anything it
+    rejects that the standard library accepts (e.g. lone surrogates) is
+    decoded by the standard library instead"""
+    if backend_name == 'json':
+        return json.loads(data)
+    try:
+        return backend_loads(data)
+    except decode_errors[backend_name]:
+        return json.loads(data)
+
+
+def decode_line(line):
+    """decode one entity line of the dump, which ends with ',\\n' (or '\\n'
+    for the last entity)"""
+    return loads(line.rstrip(b',\n'))
+
+
+# decompressed data is handed from the decompression thread(s) to the reader
+# in chunks of roughly this size, with up to read_ahead_chunks of them queued
+chunk_size = 1 << 22
+read_ahead_chunks = 64
+# multistream bz2 files are split into tasks of at least this many compressed
+# bytes, decompressed in parallel
+bz2_task_size = 1 << 22
+# with no stream boundary in this many bytes, a bz2 file is decompressed
+# serially instead (e.g. a single-stream file)
+bz2_max_task_size = 1 << 26
+bz2_stream_re = re.compile(rb'BZh[1-9]1AY&SY')
+
+
+class BadSplit(Exception):
+    """a candidate bz2 stream boundary turned out not to be one"""
+
+
+class ThreadedReader(io.RawIOBase):
+    """raw stream reading chunks produced by a background thread, which runs
+    ahead of the reader by up to max_chunks chunks
+
+    busy_time is how long the thread has spent producing chunks, and
+    wait_time how long the reader has spent waiting for them"""
+
+    def __init__(self, chunks, fileobj, max_chunks=read_ahead_chunks):
+        self.queue = queue.Queue(max_chunks)
+        self.fileobj = fileobj
+        self.pending = memoryview(b'')
+        self.finished = False
+        self.busy_time = self.wait_time = 0.0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.produce, args=(chunks,),
+                                       daemon=True)
+        self.thread.start()
+
+    def produce(self, chunks):
+        try:
+            start_time = time.time()
+            for chunk in chunks:
+                self.busy_time += time.time() - start_time
+                if not self.put(chunk):
+                    return
+                start_time = time.time()
+            self.busy_time += time.time() - start_time
+            self.put(None)
+        except Exception as e:
+            self.put(e)
+
+    def put(self, item):
+        """queue an item, giving up if the reader has been closed"""
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        while not self.pending and not self.finished:
+            start_time = time.time()
+            chunk = self.queue.get()
+            self.wait_time += time.time() - start_time
+            if chunk is None:
+                self.finished = True
+            elif isinstance(chunk, Exception):
+                self.finished = True
+                raise chunk
+            else:
+                self.pending = memoryview(chunk)
+        count = min(len(buf), len(self.pending))
+        buf[:count] = self.pending[:count]
+        self.pending = self.pending[count:]
+        return count
+
+    def close(self):
+        self.stopped.set()
+        self.fileobj.close()
+        super().close()
+
+
+def gzip_chunks(fileobj):
+    """decompress a (possibly multi-member) gzip file"""
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    while True:
+        data = fileobj.read(chunk_size)
+        if not data:
+            break
+        while data:
+            chunk = decompressor.decompress(data)
+            if chunk:
+                yield chunk
+            data = b''
+            if decompressor.eof:
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    chunk = decompressor.flush()
+    if chunk:
+        yield chunk
+
+
+def zstd_chunks(fileobj):
+    """decompress a zstandard file (which may hold several frames)"""
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('reading .zst dumps needs the zstandard package')
+    reader = zstandard.ZstdDecompressor().stream_reader(
+        fileobj, read_size=chunk_size, read_across_frames=True)
+    while True:
+        chunk = reader.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def decompress_bz2_streams(data):
+    """decompress data made up of one or more complete bz2 streams"""
+    result = []
+    while data:
+        decompressor = bz2.BZ2Decompressor()
+        result.append(decompressor.decompress(data))
+        if not decompressor.eof:
+            raise BadSplit()
+        data = decompressor.unused_data
+    return b''.join(result)
+
+
+def bz2_serial_chunks(fileobj, data):
+    """decompress concatenated bz2 streams one after the other, starting with
+    the already-read data"""
+    decompressor = bz2.BZ2Decompressor()
+    while data:
+        while data:
+            chunk = decompressor.decompress(data)
+            if chunk:
+                yield chunk
+            data = b''
+            if decompressor.eof:
+                data = decompressor.unused_data
+                decompressor = bz2.BZ2Decompressor()
+        data = fileobj.read(chunk_size)
+
+
+def bz2_tasks(fileobj):
+    """split a multistream bz2 file into runs of whole streams of at least
+    bz2_task_size bytes; yields (data, is_split) where is_split is False for a
+    remainder that couldn't be split and has to be decompressed serially"""
+    buf = b''
+    searched = 0
+    while True:
+        data = fileobj.read(chunk_size)
+        buf += data
+        split = 0
+        # the stream starting at offset 0 is already known, so look for the
+        # last boundary past bz2_task_size (and not one already searched)
+        for match in bz2_stream_re.finditer(buf, max(searched - 9, 1)):
+            if match.start() >= bz2_task_size:
+                split = match.start()
+        searched = len(buf)
+        if split:
+            yield buf[:split], True
+            buf = buf[split:]
+            searched -= split
+        elif not data:
+            if buf:
+                yield buf, True
+            return
+        elif len(buf) > bz2_max_task_size:
+            yield buf, False
+            return
+
+
+def bz2_chunks(fileobj, threads):
+    """decompress a bz2 file, decompressing independent streams of a
+    multistream file in parallel; if a candidate stream boundary is false,
+    the data around it is decompressed again in one piece"""
+    in_flight = deque()
+    carry = b''
+    remainder = None
+
+    def drain(limit):
+        nonlocal carry
+        while len(in_flight) > limit:
+            data, future = in_flight.popleft()
+            try:
+                if carry:
+                    chunk = decompress_bz2_streams(carry + data)
+                else:
+                    chunk = future.result()
+            except (BadSplit, OSError, EOFError):
+                carry += data
+                continue
+            carry = b''
+            yield chunk
+
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        for data, is_split in bz2_tasks(fileobj):
+            if not is_split:
+                remainder = data
+                break
+            in_flight.append(
+                (data, executor.submit(decompress_bz2_streams, data)))
+            yield from drain(threads * 2)
+        yield from drain(0)
+
+    if remainder is not None:
+        yield from bz2_serial_chunks(fileobj, carry + remainder)
+    elif carry:
+        yield decompress_bz2_streams(carry)
+
+
+def open_dump(path=None, threads=None):
+    """open a dump for reading lines as bytes; with no path (or '-'), read
+    from stdin
+
+    .gz, .bz2 and .zst dumps are decompressed in background threads that run
+    ahead of the reader, so no uncompressed copy is needed; the streams of a
+    multistream .bz2 (like the Wikipedia dumps) are decompressed in parallel
+    by up to threads threads"""
+    if not path or path == '-':
+        return sys.stdin.buffer
+    fileobj = open(path, 'rb')
+    if path.endswith('.gz'):
+        chunks = gzip_chunks(fileobj)
+    elif path.endswith('.bz2'):
+        chunks = bz2_chunks(fileobj, threads or os.cpu_count())
+    elif path.endswith('.zst'):
+        chunks = zstd_chunks(fileobj)
+    else:
+        return fileobj
+    return io.BufferedReader(ThreadedReader(chunks, fileobj),
+                             buffer_size=chunk_size)
+
+
+def skip_bytes(infile, count):
+    """skip the first count (uncompressed) bytes of an open dump, e.g. to
+    resume from a checkpoint; compressed input has to be decompressed up to
+    that point, but nothing in it is decoded"""
+    if infile.seekable():
+        infile.seek(count)
+        return
+    while count:
+        data = infile.read(min(count, chunk_size))
+        if not data:
+            break
+        count -= len(data)
+
+
+def batched(lines, size):
+    """group dump lines into lists of at most size lines"""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def benchmark(lines):
+    """time each available backend decoding the given dump lines"""
+    results = {}
+    expected = [json.loads(line.rstrip(b',\n')) for line in lines]
+    size = sum(len(line) for line in lines)
+    for name in backends:
+        decode = backends[name]
+        # keep collections of the growing result list out of the timings
+        gc.collect()
+        gc.disable()
+        start_time = time.time()
+        decoded = [decode(line.rstrip(b',\n')) for line in lines]
+        elapsed = time.time() - start_time
+        gc.enable()
+        results[name] = (elapsed, len(lines) / elapsed,
+                         size / elapsed / 1e6, decoded == expected)
+    return results
+
+
+# usage: wd_dump.py sample-dump.json [max lines]
+if __name__ == "__main__":
+    max_lines = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    sample = []
+    with open_dump(sys.argv[1]) as infile:
+        for line in infile:
+            if line.startswith(b'{'):
+                sample.append(line)
+                if len(sample) >= max_lines:
+                    break
+
+    print('decoding', len(sample), 'lines; default backend is', backend_name)
+    print('backend\tseconds\tlines/s\tMB/s\tsame as json')
+    for name, result in benchmark(sample).items():
+        print('%s\t%.2f\t%.0f\t%.1f\t%s' % ((name,) + result))
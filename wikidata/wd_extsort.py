@@ -0,0 +1,142 @@
+"""sorting and deduplicating sets of lines too big to hold in memory: lines
+are sorted in runs that fit a memory budget, spilled to files, and merged
+back all at once; sets kept as sorted files can then be combined (union,
+intersection, difference) by reading them through once"""
+
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+from itertools import groupby
+
+# bytes of lines (counting Python's overhead for each) to sort in memory at
+# once
+default_budget = 1 << 30
+# at most this many run files are merged (so open) at once
+max_runs = 128
+
+
+def merge_unique(*iterables):
+    """merge sorted iterables into one sorted iterator without duplicates
+    (their union, if each is a set)"""
+    last = None
+    first = True
+    for item in heapq.merge(*iterables):
+        if first or item != last:
+            yield item
+            last = item
+            first = False
+
+
+def intersect_sorted(*iterables):
+    """the items in all of some sorted, duplicate-free iterables"""
+    for item, group in groupby(heapq.merge(*iterables)):
+        if sum(1 for _ in group) == len(iterables):
+            yield item
+
+
+def subtract_sorted(items, others):
+    """the items of one sorted, duplicate-free iterable that aren't in
+    another"""
+    others = iter(others)
+    other = next(others, None)
+    for item in items:
+        while other is not None and other < item:
+            other = next(others, None)
+        if other is None or other != item:
+            yield item
+
+
+def read_lines(path):
+    """the lines of a file as bytes, without their newlines"""
+    with open(path, 'rb') as infile:
+        for line in infile:
+            yield line.rstrip(b'\n')
+
+
+def write_lines(lines, path):
+    """write lines (bytes, without newlines) to a file; returns how many"""
+    count = 0
+    with open(path, 'wb') as outfile:
+        for line in lines:
+            outfile.write(line + b'\n')
+            count += 1
+    return count
+
+
+class ExternalSorter:
+    """collects lines (bytes, without newlines), sorting and spilling them
+    to a run file whenever they reach the memory budget; iterate over it
+    for all the lines, sorted and without duplicates"""
+
+    def __init__(self, budget=default_budget, tmp_dir=None):
+        self.budget = budget
+        self.tmp_dir = tmp_dir
+        self.run_dir = None
+        self.run_paths = []
+        self.run_count = 0
+        self.lines = []
+        self.size = 0
+
+    def add(self, line):
+        self.lines.append(line)
+        # the list's pointer to the line, and the line itself
+        self.size += 8 + sys.getsizeof(line)
+        if self.size >= self.budget:
+            self.spill()
+
+    def extend(self, lines):
+        for line in lines:
+            self.add(line)
+
+    def run_path(self):
+        if self.run_dir is None:
+            self.run_dir = tempfile.mkdtemp(prefix='sort-runs-',
+                                            dir=self.tmp_dir)
+        self.run_count += 1
+        return os.path.join(self.run_dir, 'run-%05d.txt' % self.run_count)
+
+    def spill(self):
+        path = self.run_path()
+        self.lines.sort()
+        write_lines(merge_unique(self.lines), path)
+        self.run_paths.append(path)
+        self.lines = []
+        self.size = 0
+        if len(self.run_paths) >= max_runs:
+            # merge the runs so far into one, so there are never too many
+            # to merge at the end
+            path = self.run_path()
+            write_lines(merge_unique(*[read_lines(run_path)
+                                       for run_path in self.run_paths]), path)
+            for run_path in self.run_paths:
+                os.remove(run_path)
+            self.run_paths = [path]
+
+    def __iter__(self):
+        self.lines.sort()
+        return merge_unique(self.lines,
+                            *[read_lines(path) for path in self.run_paths])
+
+    def cleanup(self):
+        if self.run_dir is not None:
+            shutil.rmtree(self.run_dir)
+            self.run_dir = None
+        self.run_paths = []
+        self.lines = []
+        self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
+
+
+def sort_file(path, out_path, budget=default_budget, tmp_dir=None):
+    """write the distinct lines of a file, sorted, to out_path; returns how
+    many there are"""
+    with ExternalSorter(budget, tmp_dir) as sorter:
+        sorter.extend(read_lines(path))
+        return write_lines(sorter, out_path)
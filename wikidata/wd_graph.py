@@ -0,0 +1,230 @@
+"""directed multigraph of statements in compressed sparse row (CSR) form,
+backed by NumPy arrays, for graphs too big for networkx
+
+nodes are numbered by the position of their entity code (see wd_ids) in the
+sorted array of codes; each node's outgoing edges are a slice of out_dst and
+out_type (given by out_ptr), and its incoming edges the same of in_src and
+in_type; edge types are property codes"""
+
+import os
+from collections import Counter
+
+import numpy as np
+
+from wd_ids import IdArray, decode_id, decode_prop, encode_id
+
+# the year of a node without one
+no_year = np.iinfo(np.int64).min
+
+array_names = ('nodes', 'years', 'out_ptr', 'out_dst', 'out_type', 'in_ptr',
+               'in_src', 'in_type')
+
+
+def csr_index(rows, row_count):
+    """the row pointers and the (stable) order of the entries sorted by row,
+    for entries in the given rows"""
+    order = np.argsort(rows, kind='stable')
+    ptr = np.zeros(row_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=row_count), out=ptr[1:])
+    return ptr, order
+
+
+def gather(ptr, values, rows):
+    """the values of all the given rows, concatenated"""
+    starts = ptr[rows]
+    lengths = ptr[rows + 1] - starts
+    total = lengths.sum()
+    if not total:
+        return values[:0]
+    # index of each entry: its row's start, plus its position within the row
+    first = np.cumsum(lengths) - lengths
+    positions = np.arange(total) - np.repeat(first - starts, lengths)
+    return values[positions]
+
+
+class CSRGraph:
+    """read-only graph of statements; make one with from_store"""
+
+    def __init__(self, nodes, years, out_ptr, out_dst, out_type, in_ptr,
+                 in_src, in_type):
+        self.nodes = nodes
+        self.years = years
+        self.out_ptr = out_ptr
+        self.out_dst = out_dst
+        self.out_type = out_type
+        self.in_ptr = in_ptr
+        self.in_src = in_src
+        self.in_type = in_type
+
+    @classmethod
+    def from_store(cls, statements, years=None):
+        """the graph of a TripleStore's statements, with a year for each of
+        its nodes found in years (an IdArray, or a dict like wd_years.json)"""
+        nodes = np.unique(np.concatenate((statements.src, statements.dst)))
+        src = np.searchsorted(nodes, statements.src).astype(np.int32)
+        dst = np.searchsorted(nodes, statements.dst).astype(np.int32)
+        prop = statements.prop.astype(np.int32)
+        out_ptr, out_order = csr_index(src, len(nodes))
+        in_ptr, in_order = csr_index(dst, len(nodes))
+
+        node_years = np.full(len(nodes), no_year, dtype=np.int64)
+        if years:
+            if not isinstance(years, IdArray):
+                years = IdArray.from_dict(years, np.int64)
+            found = years.has_codes(nodes)
+            node_years[found] = years.get_codes(nodes[found])
+
+        return cls(nodes, node_years, out_ptr, dst[out_order],
+                   prop[out_order], in_ptr, src[in_order], prop[in_order])
+
+    def save(self, path):
+        """save the arrays as .npy files in the directory at path"""
+        os.makedirs(path, exist_ok=True)
+        for name in array_names:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """load a saved graph, memory-mapping its arrays unless mmap is
+        False"""
+        mmap_mode = 'r' if mmap else None
+        return cls(*[np.load(os.path.join(path, name + '.npy'),
+                             mmap_mode=mmap_mode) for name in array_names])
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        return len(self.out_dst)
+
+    def index(self, qid):
+        """the node number of an entity ID, or None if it isn't a node"""
+        code = encode_id(qid)
+        pos = np.searchsorted(self.nodes, code)
+        if pos < len(self.nodes) and self.nodes[pos] == code:
+            return int(pos)
+        return None
+
+    def node_id(self, index):
+        return decode_id(int(self.nodes[index]))
+
+    def year(self, qid):
+        index = self.index(qid)
+        if index is None or self.years[index] == no_year:
+            return None
+        return int(self.years[index])
+
+    def successors(self, qid):
+        """(entity ID, property) for each edge from qid"""
+        index = self.index(qid)
+        if index is None:
+            return []
+        start, end = self.out_ptr[index], self.out_ptr[index + 1]
+        return [(self.node_id(dst), decode_prop(int(prop)))
+                for dst, prop in zip(self.out_dst[start:end],
+                                     self.out_type[start:end])]
+
+    def predecessors(self, qid):
+        """(entity ID, property) for each edge to qid"""
+        index = self.index(qid)
+        if index is None:
+            return []
+        start, end = self.in_ptr[index], self.in_ptr[index + 1]
+        return [(self.node_id(src), decode_prop(int(prop)))
+                for src, prop in zip(self.in_src[start:end],
+                                     self.in_type[start:end])]
+
+    def out_degree(self):
+        return np.diff(self.out_ptr)
+
+    def in_degree(self):
+        return np.diff(self.in_ptr)
+
+    def out_src(self):
+        """the source node of each edge, in the order of out_dst"""
+        return np.repeat(np.arange(len(self.nodes), dtype=np.int32),
+                         self.out_degree())
+
+    def edges(self):
+        """yield (source, property, destination) ID strings for every edge"""
+        for src, prop, dst in zip(self.out_src().tolist(),
+                                  self.out_type.tolist(),
+                                  self.out_dst.tolist()):
+            yield self.node_id(src), decode_prop(prop), self.node_id(dst)
+
+    def type_counts(self):
+        """Counter of edges by property"""
+        types, counts = np.unique(self.out_type, return_counts=True)
+        return Counter({decode_prop(int(t)): int(c)
+                        for t, c in zip(types, counts)})
+
+    def selfloops(self):
+        """IDs of the nodes with an edge to themselves"""
+        src = self.out_src()
+        looped = np.unique(src[src == self.out_dst])
+        return [self.node_id(i) for i in looped.tolist()]
+
+    def reachable(self, qids, reverse=False):
+        """IDs of the nodes reachable from any of qids (including those
+        themselves), following edges backwards with reverse"""
+        ptr, adjacent = (self.in_ptr, self.in_src) if reverse else \
+            (self.out_ptr, self.out_dst)
+        seen = np.zeros(len(self.nodes), dtype=bool)
+        frontier = np.array([i for i in map(self.index, qids)
+                             if i is not None], dtype=np.int64)
+        seen[frontier] = True
+        while len(frontier):
+            neighbors = np.unique(gather(ptr, adjacent, frontier))
+            frontier = neighbors[~seen[neighbors]]
+            seen[frontier] = True
+        return [self.node_id(i) for i in np.flatnonzero(seen).tolist()]
+
+    def pagerank(self, alpha=0.85, max_iter=100, tol=1.0e-6):
+        """PageRank of each node, as networkx.pagerank computes it for the
+        graph with multiple edges between two nodes merged into one"""
+        n = len(self.nodes)
+        if not n:
+            return np.zeros(0)
+        pairs = np.unique(self.out_src().astype(np.int64) * n + self.out_dst)
+        src, dst = pairs // n, pairs % n
+        out_degree = np.bincount(src, minlength=n).astype(np.float64)
+        dangling = out_degree == 0
+        share = np.divide(1.0, out_degree, out=np.zeros(n),
+                          where=~dangling)
+        x = np.full(n, 1.0 / n)
+        for _ in range(max_iter):
+            last = x
+            x = alpha * (np.bincount(dst, weights=last[src] * share[src],
+                                     minlength=n) +
+                         last[dangling].sum() / n) + (1 - alpha) / n
+            if np.abs(x - last).sum() < n * tol:
+                return x
+        raise RuntimeError('pagerank failed to converge in %d iterations' %
+                           max_iter)
+
+    def to_networkx(self, qids=None):
+        """a networkx MultiDiGraph like wd2cg.make_qid_nx_graph makes, of
+        the subgraph of the given nodes (default: all, for small graphs)"""
+        import networkx as nx
+
+        g = nx.MultiDiGraph()
+        if qids is None:
+            indices = np.arange(len(self.nodes))
+        else:
+            indices = np.array([i for i in map(self.index, qids)
+                                if i is not None], dtype=np.int64)
+        included = np.zeros(len(self.nodes), dtype=bool)
+        included[indices] = True
+        for index in indices.tolist():
+            node = self.node_id(index)
+            if self.years[index] != no_year:
+                g.add_node(node, year=int(self.years[index]))
+            else:
+                g.add_node(node)
+            start, end = self.out_ptr[index], self.out_ptr[index + 1]
+            for dst, prop in zip(self.out_dst[start:end].tolist(),
+                                 self.out_type[start:end].tolist()):
+                if included[dst]:
+                    g.add_edge(node, self.node_id(dst),
+                               type=decode_prop(prop))
+        return g
@@ -0,0 +1,289 @@
+"""compact integer codes for Wikidata entity and property IDs"""
+
+import numpy as np
+
+# an entity code keeps the ID's number in the low 32 bits, a form or sense
+# number (for IDs like 'L7-F1') in the next 24 bits, and the kind of entity
+# above that; items are kind 0, so an item's code is just its number
+kinds = ('Q', 'P', 'L', 'M', 'E', 'F', 'S')
+sub_kinds = {'F': 5, 'S': 6}
+number_bits = 32
+sub_bits = 24
+kind_shift = number_bits + sub_bits
+number_mask = (1 << number_bits) - 1
+sub_mask = (1 << sub_bits) - 1
+
+# claims' ranks, coded as their index here (e.g. in wd_columns' rank columns
+# and wd_dates' ranked date rows)
+ranks = ('deprecated', 'normal', 'preferred')
+rank_codes = {rank: code for code, rank in enumerate(ranks)}
+
+
+def encode_id(entity_id):
+    """'Q42' -> 42, and other kinds of ID to codes that don't collide"""
+    if entity_id[0] == 'Q':
+        number = int(entity_id[1:])
+        if number > number_mask:
+            raise ValueError('ID out of range: %s' % entity_id)
+        return number
+    if '-' in entity_id:
+        # a lexeme's form or sense, e.g. 'L7-F1' or 'L7-S2'
+        lexeme, sub = entity_id.split('-')
+        kind, number, sub_number = sub_kinds[sub[0]], int(lexeme[1:]), \
+            int(sub[1:])
+    else:
+        kind, number, sub_number = kinds.index(entity_id[0]), \
+            int(entity_id[1:]), 0
+    if number > number_mask or sub_number > sub_mask:
+        raise ValueError('ID out of range: %s' % entity_id)
+    return kind << kind_shift | sub_number << number_bits | number
+
+
+def decode_id(code):
+    """the inverse of encode_id"""
+    if code <= number_mask:
+        return 'Q%d' % code
+    kind = kinds[code >> kind_shift]
+    number = code & number_mask
+    if kind in sub_kinds:
+        return 'L%d-%s%d' % (number, kind, code >> number_bits & sub_mask)
+    return '%s%d' % (kind, number)
+
+
+def encode_prop(prop):
+    """'P737' -> 737, with inverse pseudo-properties like 'P737i' negative"""
+    if prop[-1] == 'i':
+        return -int(prop[1:-1])
+    return int(prop[1:])
+
+
+def decode_prop(code):
+    """the inverse of encode_prop"""
+    if code < 0:
+        return 'P%di' % -code
+    return 'P%d' % code
+
+
+def encode_item_ids(entity_ids):
+    """encode a list of item IDs all at once, by their digits in a matrix of
+    their characters; returns None if they aren't all item IDs"""
+    try:
+        chars = np.array(entity_ids, dtype=bytes)
+    except UnicodeEncodeError:
+        return None
+    chars = chars.view(np.uint8).reshape(len(chars), -1)
+    # 'Q' and at most as many digits as the largest number
+    if not 1 < chars.shape[1] <= 1 + len(str(number_mask)) or \
+            (chars[:, 0] != ord('Q')).any():
+        return None
+    codes = np.zeros(len(chars), dtype=np.int64)
+    valid = chars[:, 1] != 0
+    for column in chars[:, 1:].T:
+        # shorter IDs are padded with zeros
+        ended = column == 0
+        digit = column.astype(np.int64) - ord('0')
+        valid &= ended | ((digit >= 0) & (digit <= 9))
+        codes = np.where(ended, codes, codes * 10 + digit)
+    if not valid.all() or (codes > number_mask).any():
+        return None
+    return codes
+
+
+def encode_ids(entity_ids):
+    """encode a collection of entity IDs into an int64 array"""
+    entity_ids = list(entity_ids)
+    if not entity_ids:
+        return np.zeros(0, dtype=np.int64)
+    codes = encode_item_ids(entity_ids)
+    if codes is not None:
+        return codes
+    return np.fromiter((encode_id(i) for i in entity_ids), dtype=np.int64,
+                       count=len(entity_ids))
+
+
+def decode_ids(codes):
+    """decode an array of entity codes into a list of IDs"""
+    codes = np.asarray(codes, dtype=np.int64)
+    if len(codes) and codes.min() >= 0 and codes.max() <= number_mask:
+        return ['Q%d' % code for code in codes.tolist()]
+    return [decode_id(code) for code in codes.tolist()]
+
+
+def split_codes(codes):
+    """the kind (as an index into kinds), and the number, of each of an array
+    of entity codes, and whether it's a lexeme's form or sense"""
+    codes = np.asarray(codes, dtype=np.int64)
+    return (codes >> kind_shift, codes & number_mask,
+            (codes >> number_bits & sub_mask) != 0)
+
+
+class IdSet:
+    """set of entity IDs as bitsets indexed by entity number, one per kind of
+    entity, so that membership is a bit lookup and a million items take
+    125 KB; the rare forms and senses of lexemes are kept in a plain set of
+    codes
+
+    IDs can be added and tested one at a time, or as arrays of codes"""
+
+    def __init__(self, entity_ids=()):
+        self.bits = {}
+        self.sub_codes = set()
+        self.count = 0
+        self.update(entity_ids)
+
+    def __len__(self):
+        return self.count
+
+    def add_codes(self, codes):
+        codes = np.unique(np.asarray(codes, dtype=np.int64))
+        codes = codes[~self.contains_codes(codes)]
+        self.count += len(codes)
+        kind_indices, numbers, is_sub = split_codes(codes)
+        self.sub_codes.update(codes[is_sub].tolist())
+        for kind_index in np.unique(kind_indices[~is_sub]).tolist():
+            in_kind = numbers[(kind_indices == kind_index) & ~is_sub]
+            bits = self.bits.get(kind_index, np.zeros(0, dtype=np.uint8))
+            size = (int(in_kind.max()) >> 3) + 1
+            if size > len(bits):
+                # grow by at least half, so that adding one at a time isn't
+                # quadratic
+                grown = np.zeros(max(size, len(bits) * 3 // 2),
+                                 dtype=np.uint8)
+                grown[:len(bits)] = bits
+                bits = self.bits[kind_index] = grown
+            np.bitwise_or.at(bits, in_kind >> 3,
+                             (1 << (in_kind & 7)).astype(np.uint8))
+
+    def contains_codes(self, codes):
+        """whether each of an array of entity codes is in the set"""
+        codes = np.asarray(codes, dtype=np.int64)
+        kind_indices, numbers, is_sub = split_codes(codes)
+        found = np.zeros(len(codes), dtype=bool)
+        for kind_index, bits in self.bits.items():
+            in_kind = (kind_indices == kind_index) & ~is_sub & \
+                (numbers >> 3 < len(bits))
+            byte = bits[numbers[in_kind] >> 3]
+            found[in_kind] = (byte >> (numbers[in_kind] & 7) & 1).astype(bool)
+        if self.sub_codes and is_sub.any():
+            found[is_sub] = np.isin(codes[is_sub], list(self.sub_codes))
+        return found
+
+    def add(self, entity_id):
+        self.add_codes([encode_id(entity_id)])
+
+    def update(self, entity_ids):
+        """add a collection of entity IDs, or another IdSet"""
+        if isinstance(entity_ids, IdSet):
+            self.add_codes(entity_ids.codes())
+        else:
+            self.add_codes(encode_ids(entity_ids))
+
+    def __contains__(self, entity_id):
+        try:
+            code = encode_id(entity_id)
+        except (ValueError, IndexError, KeyError):
+            return False
+        return bool(self.contains_codes([code])[0])
+
+    def codes(self):
+        """the codes of the IDs in the set, sorted"""
+        parts = [np.flatnonzero(np.unpackbits(bits, bitorder='little')) |
+                 kind_index << kind_shift
+                 for kind_index, bits in sorted(self.bits.items())]
+        parts.append(np.array(sorted(self.sub_codes), dtype=np.int64))
+        return np.sort(np.concatenate(parts).astype(np.int64))
+
+    def __iter__(self):
+        return iter(decode_ids(self.codes()))
+
+
+class IdArray:
+    """a typed value (e.g. an int16 year) for each of some entities, in an
+    array per kind of entity indexed by entity number, with missing as the
+    value of entities without one (by default, the dtype's minimum)"""
+
+    def __init__(self, dtype, missing=None):
+        self.dtype = np.dtype(dtype)
+        self.missing = np.iinfo(self.dtype).min if missing is None else \
+            missing
+        self.values = {}
+
+    @classmethod
+    def from_codes(cls, codes, values, dtype, missing=None):
+        result = cls(dtype, missing)
+        result.set_codes(codes, values)
+        return result
+
+    @classmethod
+    def from_dict(cls, values, dtype, missing=None):
+        """from a dict of entity ID -> value, like wd_years.json"""
+        return cls.from_codes(encode_ids(values), list(values.values()),
+                              dtype, missing)
+
+    def set_codes(self, codes, values):
+        kind_indices, numbers, is_sub = split_codes(codes)
+        if is_sub.any():
+            raise ValueError("lexemes' forms and senses can't have values")
+        values = np.asarray(values)
+        for kind_index in np.unique(kind_indices).tolist():
+            in_kind = kind_indices == kind_index
+            array = self.values.get(kind_index,
+                                    np.zeros(0, dtype=self.dtype))
+            size = int(numbers[in_kind].max()) + 1
+            if size > len(array):
+                grown = np.full(size, self.missing, dtype=self.dtype)
+                grown[:len(array)] = array
+                array = self.values[kind_index] = grown
+            array[numbers[in_kind]] = values[in_kind]
+
+    def get_codes(self, codes):
+        """the values of an array of entity codes (missing for those without
+        one)"""
+        kind_indices, numbers, is_sub = split_codes(codes)
+        result = np.full(len(numbers), self.missing, dtype=self.dtype)
+        for kind_index, array in self.values.items():
+            in_kind = (kind_indices == kind_index) & ~is_sub & \
+                (numbers < len(array))
+            result[in_kind] = array[numbers[in_kind]]
+        return result
+
+    def has_codes(self, codes):
+        """whether each of an array of entity codes has a value"""
+        return self.get_codes(codes) != self.missing
+
+    def codes(self):
+        """the codes of the entities with values, sorted"""
+        parts = [np.flatnonzero(array != self.missing) |
+                 kind_index << kind_shift
+                 for kind_index, array in sorted(self.values.items())]
+        return np.concatenate(parts).astype(np.int64) if parts else \
+            np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return sum(int((array != self.missing).sum())
+                   for array in self.values.values())
+
+    def get(self, entity_id, default=None):
+        try:
+            value = self.get_codes([encode_id(entity_id)])[0]
+        except (ValueError, IndexError, KeyError):
+            return default
+        return default if value == self.missing else value.item()
+
+    def __getitem__(self, entity_id):
+        value = self.get(entity_id)
+        if value is None:
+            raise KeyError(entity_id)
+        return value
+
+    def __contains__(self, entity_id):
+        return self.get(entity_id) is not None
+
+    def to_dict(self, codes=None):
+        """a dict of entity ID -> value, for the given codes (default: all
+        with values) that have values"""
+        codes = self.codes() if codes is None else \
+            np.asarray(codes, dtype=np.int64)
+        values = self.get_codes(codes)
+        found = values != self.missing
+        return dict(zip(decode_ids(codes[found]), values[found].tolist()))
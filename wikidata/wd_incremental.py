@@ -0,0 +1,108 @@
+"""per-entity results kept from one run to the next, so that entities that
+haven't changed since the previous dump don't have to be extracted again"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+from array import array
+
+import numpy as np
+
+# an entity's key is its lastrevid, which identifies both the entity and its
+# content, since revision IDs are unique across all of Wikidata; a line
+# without one is keyed by a hash of its bytes instead, made negative so that
+# the two can't collide
+lastrevid_re = re.compile(rb'"lastrevid":([0-9]+)')
+
+
+def entity_key(line):
+    """the key of a raw dump line, for looking up its cached results"""
+    match = lastrevid_re.search(line)
+    if match:
+        return int(match.group(1))
+    digest = hashlib.blake2b(line, digest_size=8).digest()
+    return -(int.from_bytes(digest, 'little') >> 1) - 1
+
+
+def fingerprint(*settings):
+    """a hash of whatever the cached results depend on (e.g. the properties
+    extracted), so that results extracted with other settings aren't used"""
+    data = json.dumps(settings, sort_keys=True, default=sorted)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class EntityCache:
+    """the results of the previous run, stored in a directory as records of
+    bytes (in dump order) with their keys sorted for lookups; with a
+    different fingerprint, or none saved yet, the cache is empty"""
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.keys = np.zeros(0, dtype=np.int64)
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path) as metafile:
+            meta = json.loads(metafile.read())
+        if meta['fingerprint'] != fingerprint or not meta['entities']:
+            return
+        self.keys = np.load(os.path.join(path, 'keys.npy'), mmap_mode='r')
+        self.starts = np.load(os.path.join(path, 'starts.npy'), mmap_mode='r')
+        self.ends = np.load(os.path.join(path, 'ends.npy'), mmap_mode='r')
+        self.records = np.memmap(os.path.join(path, 'records.bin'),
+                                 dtype=np.uint8, mode='r')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get_many(self, keys):
+        """the records for a list of keys, with None for those not found"""
+        if not len(self.keys):
+            return [None] * len(keys)
+        keys = np.asarray(keys, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = self.keys[pos] == keys
+        return [self.records[self.starts[p]:self.ends[p]].tobytes()
+                if f else None
+                for p, f in zip(pos.tolist(), found.tolist())]
+
+
+class EntityCacheWriter:
+    """writes the records of this run, to replace the cache at path once
+    they're all written (see commit)"""
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.new_path = path + '.new'
+        self.fingerprint = fingerprint
+        shutil.rmtree(self.new_path, ignore_errors=True)
+        os.makedirs(self.new_path)
+        self.records_file = open(os.path.join(self.new_path, 'records.bin'),
+                                 'wb')
+        self.keys = array('q')
+        self.starts = array('q')
+        self.size = 0
+
+    def add(self, key, record):
+        self.keys.append(key)
+        self.starts.append(self.size)
+        self.records_file.write(record)
+        self.size += len(record)
+
+    def commit(self):
+        """finish writing, and replace the previous run's cache"""
+        self.records_file.close()
+        keys = np.frombuffer(self.keys, dtype=np.int64)
+        starts = np.frombuffer(self.starts, dtype=np.int64)
+        ends = np.append(starts[1:], self.size)
+        order = np.argsort(keys, kind='stable')
+        np.save(os.path.join(self.new_path, 'keys.npy'), keys[order])
+        np.save(os.path.join(self.new_path, 'starts.npy'), starts[order])
+        np.save(os.path.join(self.new_path, 'ends.npy'), ends[order])
+        with open(os.path.join(self.new_path, 'meta.json'), 'w') as metafile:
+            metafile.write(json.dumps({'fingerprint': self.fingerprint,
+                                       'entities': len(keys)}))
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.new_path, self.path)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""entity labels in a compact store on disk, for looking labels up without
+loading them all into a dict
+
+the store is a directory with labels.bin, the UTF-8 text of all the labels,
+and for each kind of entity (see wd_ids) an array of offsets into it indexed
+by the entity's number, so that the label of e.g. Q42 is the bytes from
+Q.npy[42] to Q.npy[43]; both are memory-mapped, and an entity without a
+label has an empty one
+
+labels are encoded with 'surrogatepass', as in wd_columns, since a few in
+the dump have lone surrogates, which UTF-8 can't otherwise encode"""
+
+import json
+import os
+import sys
+
+import numpy as np
+
+from wd_ids import (decode_id, encode_ids, kind_shift, kinds, number_bits,
+                    number_mask, sub_mask)
+
+label_file = 'labels.bin'
+
+
+def write_labels(labels, path):
+    """save a dict of labels (entity ID -> label) as a store at path"""
+    os.makedirs(path, exist_ok=True)
+    codes = encode_ids(labels)
+    if (codes >> number_bits & sub_mask).any():
+        raise ValueError("lexemes' forms and senses can't have labels")
+    texts = [label.encode('utf-8', 'surrogatepass') for label in labels.values()]
+    order = np.argsort(codes, kind='stable')
+    codes = codes[order]
+    lengths = np.fromiter(map(len, texts), dtype=np.int64,
+                          count=len(texts))[order]
+    with open(os.path.join(path, label_file), 'wb') as outfile:
+        for i in order.tolist():
+            outfile.write(texts[i])
+
+    present = []
+    ends = np.cumsum(lengths)
+    for kind_index, kind in enumerate(kinds):
+        in_kind = (codes >> kind_shift) == kind_index
+        if not in_kind.any():
+            continue
+        numbers = codes[in_kind] & number_mask
+        # the labels of a kind are consecutive in labels.bin, in number order
+        start = ends[in_kind][0] - lengths[in_kind][0]
+        kind_lengths = np.zeros(numbers[-1] + 1, dtype=np.int64)
+        kind_lengths[numbers] = lengths[in_kind]
+        offsets = np.empty(len(kind_lengths) + 1, dtype=np.int64)
+        offsets[0] = start
+        np.cumsum(kind_lengths, out=offsets[1:])
+        offsets[1:] += start
+        np.save(os.path.join(path, kind + '.npy'), offsets)
+        present.append(kind)
+    with open(os.path.join(path, 'meta.json'), 'w') as metafile:
+        metafile.write(json.dumps({'kinds': present,
+                                   'labels': int((lengths > 0).sum())}))
+
+
+def read_label_lines(path, lang='best'):
+    """a dict of the labels in one language from a file of wd_preproc's
+    'lang<tab>label<tab>ID' lines (e.g. wd_labels.txt, or a shard of it)"""
+    labels = {}
+    prefix = lang + '\t'
+    with open(path, encoding='utf-8', errors='surrogatepass') as infile:
+        for line in infile:
+            if line.startswith(prefix):
+                label, entity_id = line[len(prefix):-1].rsplit('\t', 1)
+                labels[entity_id] = label
+    return labels
+
+
+class LabelStore:
+    """a saved store of labels, looked up by entity ID, or many at a time
+    by entity code"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as metafile:
+            self.meta = json.loads(metafile.read())
+        self.offsets = {kinds.index(kind): np.load(
+            os.path.join(path, kind + '.npy'), mmap_mode='r')
+            for kind in self.meta['kinds']}
+        label_path = os.path.join(path, label_file)
+        # an empty file can't be memory-mapped
+        if os.path.getsize(label_path):
+            self.text = np.memmap(label_path, dtype=np.uint8, mode='r')
+        else:
+            self.text = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return self.meta['labels']
+
+    def spans(self, codes):
+        """the start and end in labels.bin of the label of each code"""
+        codes = np.asarray(codes, dtype=np.int64)
+        starts = np.zeros(len(codes), dtype=np.int64)
+        ends = np.zeros(len(codes), dtype=np.int64)
+        kind_indices = codes >> kind_shift
+        numbers = codes & number_mask
+        for kind_index, offsets in self.offsets.items():
+            found = (kind_indices == kind_index) & \
+                (numbers < len(offsets) - 1) & \
+                (codes >> number_bits & sub_mask == 0)
+            starts[found] = offsets[numbers[found]]
+            ends[found] = offsets[numbers[found] + 1]
+        return starts, ends
+
+    def get_codes(self, codes):
+        """the labels of an array of entity codes, with None for those
+        without one"""
+        starts, ends = self.spans(codes)
+        return [self.text[start:end].tobytes().decode('utf-8',
+                                                     'surrogatepass')
+                if end > start else None
+                for start, end in zip(starts.tolist(), ends.tolist())]
+
+    def get_many(self, qids):
+        """the labels of a list of entity IDs, with None for those without
+        one"""
+        return self.get_codes(encode_ids(qids))
+
+    def get(self, qid, default=None):
+        label = self.get_many([qid])[0]
+        return default if label is None else label
+
+    def __getitem__(self, qid):
+        label = self.get(qid)
+        if label is None:
+            raise KeyError(qid)
+        return label
+
+    def __contains__(self, qid):
+        return self.get(qid) is not None
+
+    def items(self):
+        """yield (entity ID, label) for every label, in code order"""
+        for kind_index, offsets in self.offsets.items():
+            lengths = np.diff(offsets)
+            for number in np.flatnonzero(lengths).tolist():
+                code = kind_index << kind_shift | number
+                yield decode_id(code), self.text[
+                    offsets[number]:offsets[number + 1]].tobytes().decode(
+                        'utf-8', 'surrogatepass')
+
+
+# usage: wd_labelstore.py wd_labels [ID ...]
+# prints the labels of the IDs given, or all the labels as JSON
+if __name__ == "__main__":
+    store = LabelStore(sys.argv[1])
+    if len(sys.argv) > 2:
+        for qid, label in zip(sys.argv[2:], store.get_many(sys.argv[2:])):
+            print(qid, label)
+    else:
+        print(json.dumps(dict(store.items()), indent=True))
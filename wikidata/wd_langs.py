@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""picking labels along a language fallback chain, by ranking the sitelinks
+and labels an entity has instead of looking up every language of the chain
+in turn (most entities have far fewer of them than the chain has languages)
+
+the results are the same as looking along the chain: the label is the title
+of the sitelink of the first language in the chain that has a sitelink or a
+label, or else that label
+
+an entity without labels (e.g. a lexeme), or with the dump's [] for an empty
+map of them, just has none"""
+
+import functools
+import gc
+import sys
+import time
+
+from wd_constants import lang_order
+
+
+class LabelChain:
+    """a language fallback chain, with the rank of each language in it"""
+
+    def __init__(self, langs):
+        self.langs = tuple(langs)
+        self.ranks = {}
+        self.site_ranks = {}
+        for rank, lang in enumerate(self.langs):
+            # the first of a repeated language is the one that counts
+            self.ranks.setdefault(lang, rank)
+            self.site_ranks.setdefault(lang + 'wiki', (rank, lang))
+        self.first = self.langs[0] if self.langs else None
+        self.first_site = self.first + 'wiki' if self.langs else None
+
+    def ranked_sitelinks(self, obj):
+        """(rank, language, title) of each sitelink in the chain, by rank"""
+        sitelinks = obj.get('sitelinks')
+        if not sitelinks:
+            return []
+        found = []
+        site_ranks = self.site_ranks
+        for site in sitelinks:
+            ranked = site_ranks.get(site)
+            if ranked is not None:
+                found.append(ranked + (sitelinks[site]['title'],))
+        found.sort()
+        return found
+
+    def best_label(self, obj, best_rank):
+        """(rank, label) of the entity's label of the first language in the
+        chain before best_rank, or (best_rank, None)"""
+        best = None
+        if best_rank:
+            ranks = self.ranks
+            labels = obj.get('labels') or {}
+            for lang in labels:
+                rank = ranks.get(lang)
+                if rank is not None and rank < best_rank:
+                    best_rank, best = rank, labels[lang]['value']
+        return best_rank, best
+
+    def get_label(self, obj):
+        """the entity's label, or None"""
+        # most entities have a sitelink or label in the first language
+        sitelinks = obj.get('sitelinks')
+        if sitelinks and self.first_site in sitelinks:
+            return sitelinks[self.first_site]['title']
+        first_label = (obj.get('labels') or {}).get(self.first) \
+            if self.langs else None
+        if first_label is not None:
+            return first_label['value']
+        found = self.ranked_sitelinks(obj)
+        site_rank = found[0][0] if found else len(self.langs)
+        rank, label = self.best_label(obj, site_rank)
+        return found[0][2] if rank == site_rank and found else label
+
+    def get_labels(self, obj):
+        """the entity's label as 'best', along with the title of each of its
+        sitelinks in the chain by language, in the order looking along the
+        chain adds them (the 'best' one comes after the title it's from, if
+        any, and before the rest); with no label, 'best' is None"""
+        found = self.ranked_sitelinks(obj)
+        site_rank = found[0][0] if found else len(self.langs)
+        rank, label = self.best_label(obj, site_rank)
+        labels = {}
+        if label is not None:
+            labels['best'] = label
+        for i, (rank, lang, title) in enumerate(found):
+            labels[lang] = title
+            if i == 0 and label is None:
+                labels['best'] = title
+        if 'best' not in labels:
+            labels['best'] = None
+        return labels
+
+
+@functools.lru_cache()
+def label_chain(langs):
+    """the LabelChain of a tuple of languages, made once"""
+    return LabelChain(langs)
+
+
+# get_label(obj) gets the label along lang_order
+default_chain = label_chain(lang_order)
+get_label = default_chain.get_label
+
+
+def scan_label(obj, langs=lang_order):
+    """get_label as a scan of the whole chain (for comparison)"""
+    has_sitelinks = 'sitelinks' in obj
+    obj_labels = obj.get('labels') or {}
+    for lang in langs:
+        site = lang + 'wiki'
+        if has_sitelinks and site in obj['sitelinks']:
+            return obj['sitelinks'][site]['title']
+        elif lang in obj_labels:
+            return obj_labels[lang]['value']
+    return None
+
+
+def scan_labels(obj, langs):
+    """LabelChain.get_labels as a scan of the whole chain (for comparison)"""
+    labels = {}
+    has_sitelinks = 'sitelinks' in obj
+    obj_labels = obj.get('labels') or {}
+    for lang in langs:
+        site = lang + 'wiki'
+        if has_sitelinks and site in obj['sitelinks']:
+            labels[lang] = obj['sitelinks'][site]['title']
+            if 'best' not in labels:
+                labels['best'] = labels[lang]
+        elif 'best' not in labels and lang in obj_labels:
+            labels['best'] = obj_labels[lang]['value']
+    if 'best' not in labels:
+        labels['best'] = None
+    return labels
+
+
+def call_all(func, objs):
+    """func's result (or exception type) for each of objs"""
+    results = []
+    for obj in objs:
+        try:
+            results.append(func(obj))
+        except Exception as e:
+            results.append(type(e))
+    return results
+
+
+def benchmark(objs, langs):
+    """time scanning and ranking for get_label (along lang_order) and
+    get_labels (along langs) on decoded entities; returns (name, seconds,
+    entities/s, same results) for each"""
+    chain = LabelChain(langs)
+    pairs = [('get_label', scan_label, default_chain.get_label),
+             ('get_labels', functools.partial(scan_labels, langs=langs),
+              chain.get_labels)]
+    results = []
+    for name, scan, ranked in pairs:
+        timed = []
+        for func in (scan, ranked):
+            gc.collect()
+            gc.disable()
+            start_time = time.time()
+            timed.append((call_all(func, objs), time.time() - start_time))
+            gc.enable()
+        same = [list(r.items()) if isinstance(r, dict) else r
+                for r in timed[0][0]] == \
+            [list(r.items()) if isinstance(r, dict) else r
+             for r in timed[1][0]]
+        for kind, (_, elapsed) in zip(('scan', 'ranked'), timed):
+            results.append((name + ' ' + kind, elapsed,
+                            len(objs) / max(elapsed, 1e-9), same))
+    return results
+
+
+# usage: wd_langs.py sample-dump.json [max lines]
+if __name__ == "__main__":
+    from wd_dump import decode_line, open_dump
+    from wd_preproc import label_langs
+
+    max_lines = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    sample = []
+    with open_dump(sys.argv[1]) as infile:
+        for line in infile:
+            if line.startswith(b'{'):
+                sample.append(decode_line(line))
+                if len(sample) >= max_lines:
+                    break
+
+    print('labelling', len(sample), 'entities;', len(lang_order),
+          'languages for get_label,', len(label_langs), 'for get_labels')
+    print('function\tseconds\tentities/s\tsame as scan')
+    for result in benchmark(sample, label_langs):
+        print('%s\t%.2f\t%.0f\t%s' % result)
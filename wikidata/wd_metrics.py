@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""timings and counters for pipeline runs, saved to run_metrics.json so that
+runs (e.g. of last week's dump and this week's) can be compared
+
+each script records the stages it goes through (wall time, CPU time, peak
+memory and, where it processes entities, entities per second) and counts
+things like skipped entities and exceptions; its section of run_metrics.json
+is replaced when it writes it, leaving those of the other scripts run in the
+same workspace"""
+
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from wd_dump import ThreadedReader
+
+metrics_path = 'run_metrics.json'
+
+
+def peak_rss():
+    """peak resident memory in MB of this process, and of its largest
+    finished child (e.g. a worker)"""
+    # ru_maxrss is in KB, apart from on macOS where it's in bytes
+    scale = 1 << 20 if sys.platform == 'darwin' else 1 << 10
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+
+def cpu_time():
+    """CPU time used by this process and its finished children, which
+    includes workers once they've been joined"""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+class RunMetrics:
+    """the stages and counters of a run of a script"""
+
+    def __init__(self, script):
+        self.script = script
+        self.started = time.time()
+        self.start_cpu = cpu_time()
+        self.stages = []
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name, entities=None):
+        """time the code run in a with block; entities is the number of
+        entities (or statements) it handles, or a function returning it at
+        the end (for when that's only known then)"""
+        start_time = time.time()
+        start_cpu = cpu_time()
+        try:
+            yield
+        finally:
+            if callable(entities):
+                entities = entities()
+            self.record(name, time.time() - start_time,
+                        cpu_time() - start_cpu, entities)
+
+    def record(self, name, wall, cpu=None, entities=None, **extra):
+        """add a stage timed elsewhere (e.g. in another thread)"""
+        stage = {'name': name, 'wall_s': round(wall, 3)}
+        if cpu is not None:
+            stage['cpu_s'] = round(cpu, 3)
+        if entities is not None:
+            stage['entities'] = entities
+            stage['entities_per_s'] = round(entities / max(wall, 1e-9), 1)
+        stage['peak_rss_mb'], stage['peak_child_rss_mb'] = \
+            [round(rss, 1) for rss in peak_rss()]
+        stage.update(extra)
+        self.stages.append(stage)
+
+    def record_decompression(self, infile):
+        """add the time spent decompressing a dump opened with open_dump, if
+        it's compressed; that's done alongside the rest in its own thread(s),
+        so it's a stage of its own, overlapping others"""
+        reader = getattr(infile, 'raw', None)
+        if isinstance(reader, ThreadedReader):
+            self.record('decompress', reader.busy_time,
+                        waited_s=round(reader.wait_time, 3))
+
+    def count(self, counter, key, n=1):
+        self.counters.setdefault(counter, Counter())[key] += n
+
+    def add_counts(self, counts):
+        """add a dict of counter name -> Counter (e.g. from a worker)"""
+        for counter, values in counts.items():
+            self.counters.setdefault(counter, Counter()).update(values)
+
+    def summary(self):
+        wall = time.time() - self.started
+        rss, child_rss = peak_rss()
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                     time.gmtime(self.started)),
+            'argv': sys.argv[1:],
+            'python': platform.python_version(),
+            'host': platform.node(),
+            'cpus': os.cpu_count(),
+            'wall_s': round(wall, 3),
+            'cpu_s': round(cpu_time() - self.start_cpu, 3),
+            'peak_rss_mb': round(rss, 1),
+            'peak_child_rss_mb': round(child_rss, 1),
+            'stages': self.stages,
+            'counters': {counter: dict(values.most_common())
+                         for counter, values in self.counters.items()},
+        }
+
+    def write(self, path=metrics_path):
+        """save this run's metrics in the script's section of path"""
+        runs = load_metrics(path) if os.path.exists(path) else {}
+        runs[self.script] = self.summary()
+        with open(path, 'w') as outfile:
+            outfile.write(json.dumps(runs, indent=True))
+
+
+def load_metrics(path):
+    with open(path) as infile:
+        return json.loads(infile.read())
+
+
+def compare(old, new):
+    """yield a line for each stage of each script in both runs, with its
+    times in the old and new runs"""
+    for script in new:
+        if script not in old:
+            continue
+        old_stages = {stage['name']: stage
+                      for stage in old[script]['stages']}
+        for stage in new[script]['stages'] + [dict(new[script],
+                                                   name='total')]:
+            name = stage['name']
+            before = old[script] if name == 'total' else \
+                old_stages.get(name)
+            if before is None:
+                continue
+            change = stage['wall_s'] / max(before['wall_s'], 1e-3) - 1
+            yield '%s\t%s\t%.1f\t%.1f\t%+.0f%%\t%.0f\t%.0f' % (
+                script, name, before['wall_s'], stage['wall_s'],
+                change * 100, before['peak_rss_mb'], stage['peak_rss_mb'])
+
+
+# usage: wd_metrics.py old/run_metrics.json new/run_metrics.json
+# compares the stage timings and peak memory of two runs
+if __name__ == "__main__":
+    print('script\tstage\told s\tnew s\tchange\told MB\tnew MB')
+    for line in compare(load_metrics(sys.argv[1]), load_metrics(sys.argv[2])):
+        print(line)
@@ -0,0 +1,91 @@
+"""the graph in the binary format of ngraph.tobinary, which the Causalaxies
+frontend loads, written straight from a CSRGraph instead of going through
+GraphML or DOT and Node
+
+labels.json is a JSON array of node IDs, in node order; links.bin is little
+endian int32s, giving for each node in turn -(its index + 1), then
+(index + 1) of each node it links to (if any), as ngraph.tobinary writes
+them; meta.json names the two files.
+positions.bin still comes from the layout (see makengraph.js), which reads
+these files instead of building the graph itself"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from wd_ids import decode_id
+
+# what ngraph.tobinary would call its files
+labels_file = 'labels.json'
+links_file = 'links.bin'
+meta_file = 'meta.json'
+# the same, with 'label - ID' names (see fix_labels.py)
+named_labels_file = 'newlabels.json'
+
+format_version = 'wd_ngraph'
+
+
+def link_records(graph):
+    """the int32 contents of links.bin for a CSRGraph; multiple edges between
+    two nodes are one link, as the frontend draws them"""
+    n = graph.number_of_nodes()
+    pairs = np.unique(graph.out_src().astype(np.int64) * n + graph.out_dst)
+    src, dst = pairs // n, pairs % n
+    # where each node's links start among all the links
+    link_starts = np.zeros(n, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n)[:-1], out=link_starts[1:])
+    records = np.empty(n + len(pairs), dtype='<i4')
+    # every node's header comes before its links, pushing each later one
+    # along
+    nodes = np.arange(n)
+    records[nodes + link_starts] = -(nodes + 1)
+    records[np.arange(len(pairs)) + src + 1] = dst + 1
+    return records
+
+
+def named_labels(ids, labels):
+    """'label - ID' names for a list of node IDs, from a LabelStore (just the
+    ID for those without a label)"""
+    return [qid if label is None else ' '.join([label, '-', qid])
+            for qid, label in zip(ids, labels.get_many(ids))]
+
+
+def write_ngraph(graph, out_dir='.', labels=None):
+    """write labels.json, links.bin and meta.json for a CSRGraph, and, given
+    labels (a LabelStore), newlabels.json"""
+    def path(filename):
+        return os.path.join(out_dir, filename)
+
+    ids = [decode_id(int(code)) for code in graph.nodes]
+    with open(path(labels_file), 'w') as outfile:
+        outfile.write(json.dumps(ids))
+    if labels is not None:
+        with open(path(named_labels_file), 'w') as outfile:
+            outfile.write(json.dumps(named_labels(ids, labels), indent=True))
+    link_records(graph).tofile(path(links_file))
+    with open(path(meta_file), 'w') as outfile:
+        outfile.write(json.dumps({'date': int(time.time() * 1000),
+                                  'nodeFile': labels_file,
+                                  'linkFile': links_file,
+                                  'version': format_version}))
+
+
+def read_ngraph(out_dir='.'):
+    """node IDs and (source, destination) ID pairs read back from the files
+    named in meta.json, the way the frontend reads them"""
+    with open(os.path.join(out_dir, meta_file)) as infile:
+        meta = json.loads(infile.read())
+    with open(os.path.join(out_dir, meta['nodeFile'])) as infile:
+        ids = json.loads(infile.read())
+    records = np.fromfile(os.path.join(out_dir, meta['linkFile']),
+                          dtype='<i4')
+    links = []
+    src = None
+    for value in records.tolist():
+        if value < 0:
+            src = ids[-value - 1]
+        else:
+            links.append((src, ids[value - 1]))
+    return ids, links
@@ -0,0 +1,91 @@
+"""Wikipedia titles of Wikidata items, and unordered pairs of items linked by
+any statement, for comparing with Wikipedia's own links (see the
+wikipedia/*/process_wd.py scripts)"""
+
+import json
+
+from wd_scan import Extractor
+
+default_label_langs = ('en', 'de', 'fr', 'ru', 'it', 'es', 'pl', 'ja', 'pt',
+                       'ar', 'nl', 'sv', 'uk', 'ca', 'tr', 'no', 'fi', 'id',
+                       'vi', 'zh', 'he')
+
+
+def get_labels(obj, label_langs):
+    """get appropriate label(s)"""
+    labels = {}
+    has_sitelinks = 'sitelinks' in obj
+    for lang in label_langs:
+        site = lang + 'wiki'
+        if has_sitelinks and site in obj['sitelinks']:
+            labels[lang] = obj['sitelinks'][site]['title']
+    return labels
+
+
+def check_claims(qid, claim, claim_set):
+    spec_stmts = set()
+    for spec in claim_set:
+        # since we're going through all claims without filtering for cg_rels,
+        # make sure that this is the right type of thing
+        if spec['mainsnak']['datatype'] == 'wikibase-item':
+            if 'id' in spec['mainsnak'].get('datavalue', {}).get('value', {}):
+                other_qid = spec['mainsnak']['datavalue']['value']['id']
+                # get the IDs in a specific order to avoid duplicates
+                if int(qid[1:]) <= int(other_qid[1:]):
+                    spec_stmts.add((qid, other_qid))  # , claim))
+                else:
+                    spec_stmts.add((other_qid, qid))  # , claim))
+    return spec_stmts
+
+
+def write_statements(statements, path):
+    """write file containing list of statements/relationships"""
+    with open(path, 'w') as csvfile:
+        csvfile.writelines(
+            [item[0] + ' | ' + item[1] + '\n' for item in statements])
+
+
+def write_items_json(items, path):
+    with open(path, 'w') as itemsfile:
+        itemsfile.write(json.dumps(items, indent=True))
+
+
+class SitelinkTitleExtractor(Extractor):
+    """maps from each language's Wikipedia titles to items, written to
+    wd_labels.json"""
+
+    name = 'sitelinks'
+
+    def __init__(self, out_dir='.', label_langs=default_label_langs):
+        super().__init__(out_dir)
+        self.labels = {lang: {} for lang in label_langs}
+
+    def process_entity(self, obj):
+        item_labels = get_labels(obj, self.labels)
+        for lang in item_labels:
+            self.labels[lang][item_labels[lang]] = obj['id']
+
+    def finish(self):
+        write_items_json(self.labels, self.path('wd_labels.json'))
+
+
+class ItemPairExtractor(Extractor):
+    """unordered pairs of items linked by a statement of any property,
+    written to statements.txt"""
+
+    name = 'pairs'
+
+    def __init__(self, out_dir='.'):
+        super().__init__(out_dir)
+        self.statements = set()
+
+    def process_entity(self, obj):
+        is_item = obj['type'] == 'item' or obj['type'] == 'lexeme'
+        if is_item and 'claims' in obj:
+            claims = obj['claims']
+            for claim in claims:
+                self.statements.update(
+                    check_claims(obj['id'], claim, claims[claim]))
+
+    def finish(self):
+        write_statements(self.statements, self.path('statements.txt'))
@@ -1,28 +1,42 @@
 #!/usr/bin/env python3
 """simple initial processing of Wikidata JSON dump"""
 
+import argparse
 import json
-import sys
-
-from wd_constants import all_times
+import multiprocessing as mp
+import os
+from collections import Counter, deque
+
+import numpy as np
+
+from wd_constants import all_times, times_plus_nested
+from wd_checkpoint import Checkpoint, truncate_outputs
+from wd_dates import ranked_date_dtype, ranked_date_row
+from wd_dump import batched, decode_line, open_dump, skip_bytes
+from wd_ids import encode_id
+from wd_langs import LabelChain, label_chain
+from wd_metrics import RunMetrics
+from wd_preproc_columns import ColumnBatch, ColumnWriter
+from wd_scan import Extractor
+from wd_shards import ShardedOutput, remove_manifest, shard_of
+
+# 'doi' is for Digital Object Identifiers; Wikidata has them, and Wikipedia
+#     links to them with links that look very much like inter-language
+#     Wikipedia links
+# 'best' is for the best label that can be found along the language chain
+label_langs = ('en', 'de', 'fr', 'ru', 'it', 'es', 'pl', 'ja', 'pt', 'ar', 'nl', 'sv', 'uk', 'ca', 'tr', 'no', 'fi', 'id', 'vi', 'zh', 'he', 'ceb', 'war', 'fa', 'sr', 'arz', 'ko', 'hu', 'cs', 'sh', 'ro', 'zh_min_nan', 'eu', 'ms', 'eo', 'hy', 'ce', 'bg', 'da', 'azb', 'sk', 'kk', 'min', 'hr', 'et', 'lt', 'be', 'el', 'sl', 'simple', 'gl', 'az', 'ur', 'nn', 'hi', 'th', 'ka', 'uz', 'la', 'cy', 'ta', 'vo', 'ast', 'mk', 'lv', 'tg', 'tt', 'mg', 'af', 'bn', 'oc', 'zh_yue', 'bs', 'sq', 'ky', 'new', 'tl', 'be_x_old', 'te', 'ml', 'br', 'nds', 'pms', 'su', 'sw', 'ht', 'lb', 'vec', 'jv', 'mr', 'sco', 'pnb', 'ga', 'ba', 'szl', 'is', 'my', 'fy', 'cv', 'lmo', 'an', 'pa', 'ne', 'wuu', 'yo', 'bar', 'io', 'ku', 'gu', 'als', 'ckb', 'kn', 'scn', 'bpy', 'ia', 'qu', 'diq', 'mn', 'bat_smg', 'or', 'si', 'nv', 'cdo', 'ilo', 'gd', 'yi', 'am', 'nap', 'bug', 'xmf', 'wa', 'sd', 'hsb', 'mai', 'map_bms', 'fo', 'mzn', 'li', 'eml', 'sah', 'os', 'ps', 'sa', 'frr', 'bcl', 'ace', 'zh_classical', 'mrj', 'mhr', 'hif', 'hak', 'roa_tara', 'pam', 'nso', 'km', 'hyw', 'rue', 'se', 'crh', 'bh', 'shn', 'vls', 'mi', 'nds_nl', 'nah', 'as', 'sc', 'vep', 'gor', 'gan', 'myv', 'ab', 'glk', 'bo', 'so', 'co', 'tk', 'fiu_vro', 'sn', 'lrc', 'kv', 'csb', 'ha', 'gv', 'udm', 'ie', 'ay', 'pcd', 'zea', 'kab', 'nrm', 'ug', 'lez', 'kw', 'stq', 'haw', 'frp', 'lfn', 'lij', 'mwl', 'gn', 'gom', 'rm', 'mt', 'lo', 'lad', 'koi', 'sat', 'fur', 'olo', 'dty', 'dsb', 'ang', 'ext', 'ln', 'bjn', 'ban', 'cbk_zam', 'dv', 'ksh', 'gag', 'pfl', 'tyv', 'pag', 'pi', 'zu', 'av', 'awa', 'bxr', 'xal', 'krc', 'pap', 'za', 'pdc', 'kaa', 'rw', 'arc', 'szy', 'to', 'nov', 'jam', 'tpi', 'kbp', 'kbd', 'ig', 'na', 'tet', 'wo', 'tcy', 'ki', 'inh', 'jbo', 'atj', 'roa_rup', 'bi', 'lbe', 'kg', 'ty', 'mdf', 'lg', 'srn', 'xh', 'gcr', 'fj', 'ltg', 'chr', 'sm', 'ak', 'got', 'kl', 'pih', 'om', 'cu', 'tn', 'tw', 'st', 'ts', 'rmy', 'bm', 'nqo', 'chy', 'rn', 'mnw', 'tum', 'ny', 'ss', 'ch', 'pnt', 'iu', 'ady', 'ks', 've', 'ee', 'ik', 'sg', 'ff', 'ti', 'dz', 'din', 'cr', 'ng', 'cho', 'kj', 'mh', 'ho', 'ii', 'aa', 'mus', 'hz', 'kr', 'smn', 'doi', 'best')
 
 
 def get_labels(obj, label_langs):
     """
     get appropriate label(s), including multilingual Wikipedia titles
     and a "best" overall human-readable label given the language chain
+    (a sequence of languages, or a LabelChain of them)
     """
-    labels = {}
-    has_sitelinks = 'sitelinks' in obj
-    for lang in label_langs:
-        site = lang + 'wiki'
-        if has_sitelinks and site in obj['sitelinks']:
-            labels[lang] = obj['sitelinks'][site]['title']
-            if 'best' not in labels:
-                labels['best'] = labels[lang]
-        elif 'best' not in labels and lang in obj['labels']:
-            labels['best'] = obj['labels'][lang]['value']
-    if 'best' not in labels:
+    if not isinstance(label_langs, LabelChain):
+        label_langs = label_chain(tuple(label_langs))
+    labels = label_langs.get_labels(obj)
+    if labels['best'] is None:
         labels['best'] = obj['id']
 
     if 'claims' in obj and 'P356' in obj['claims']:
@@ -35,20 +49,39 @@ def get_labels(obj, label_langs):
     return labels
 
 
-def get_date_claims(claims, props=all_times):
-    """get date claims in the specified collection of properties"""
+def add_date_row(result, skipped, prop, claim_prop, value, rank):
+    """add a ranked date row to result or, if it can't be made (e.g. the
+    time can't be parsed, or the claim has no rank), count it in skipped,
+    so that one bad date doesn't lose the entity's others"""
+    try:
+        result.append(ranked_date_row(prop, claim_prop, value, rank))
+    except (KeyError, TypeError, ValueError):
+        skipped['date'] += 1
+
+
+def get_date_claims(claims, props=all_times, skipped=None):
+    """get date claims in the specified collection of properties, as ranked
+    date rows (without the entity; see wd_dates), counting those that can't
+    be read in skipped"""
+    if skipped is None:
+        skipped = Counter()
     result = []
     for claim in claims:
         if claim in props:
             for spec in claims[claim]:
                 if 'time' in spec['mainsnak'].get('datavalue', {}).get(
                         'value', {}):
-                    date = spec['mainsnak']['datavalue']['value']['time']
-                    result.append([claim, date])
+                    add_date_row(result, skipped, claim, None,
+                                 spec['mainsnak']['datavalue']['value'],
+                                 spec.get('rank'))
     return result
 
 
-def check_nested_dates(claim, claim_set):
+def check_nested_dates(claim, claim_set, skipped=None):
+    """get the dates in the qualifiers of a claim's statements, ranked as
+    the statements are"""
+    if skipped is None:
+        skipped = Counter()
     result = []
     for spec in claim_set:
         qualifiers = spec.get('qualifiers', {})
@@ -56,12 +89,27 @@ def check_nested_dates(claim, claim_set):
             if qualifier in all_times:
                 for item in qualifiers[qualifier]:
                     if 'time' in item.get('datavalue', {}).get('value', {}):
-                        date = item['datavalue']['value']['time']
-                        result.append([claim + ' ' + qualifier, date])
+                        add_date_row(result, skipped, qualifier, claim,
+                                     item['datavalue']['value'],
+                                     spec.get('rank'))
 
     return result
 
 
+def get_dates(obj, skipped=None):
+    """the dates of an item's (or lexeme's) time claims, and of the time
+    qualifiers of claims in times_plus_nested: the same dates as wd2cg
+    finds, in the same order"""
+    if obj['type'] not in ('item', 'lexeme') or 'claims' not in obj:
+        return []
+    claims = obj['claims']
+    dates = get_date_claims(claims, skipped=skipped)
+    for claim in claims:
+        if claim in times_plus_nested:
+            dates += check_nested_dates(claim, claims[claim], skipped)
+    return dates
+
+
 def check_claims(qid, claim, claim_set):
     spec_stmts = dict()
     for spec in claim_set:
@@ -103,6 +151,10 @@ def check_claims(qid, claim, claim_set):
 
 
 def process_json_line(line, label_langs):
+    return process_entity(decode_line(line), label_langs)
+
+
+def process_entity(obj, label_langs):
     qid = None
     labels = {}
     statements = {}
@@ -110,7 +162,6 @@ def process_json_line(line, label_langs):
 
     # collect statements of interest
 
-    obj = json.loads(line.rstrip(',\n'))
     qid = obj['id']
     labels = get_labels(obj, label_langs)
 
@@ -122,13 +173,224 @@ def process_json_line(line, label_langs):
             statements.update(
                 check_claims(qid, claim, claims[claim]))
 
-
     if 'sitelinks' in obj:
         wp_langs = [l[:-4] for l in obj['sitelinks'] if l.endswith('wiki')]
 
     return qid, labels, statements, wp_langs
 
 
+# the outputs, in the order encode_entity gives lines (or rows) for them
+output_files = ('items.jsonl', 'links.jsonl', 'wd_labels.txt',
+                'date_claims.bin')
+# with --columns, items and links go in this directory instead (see
+# wd_preproc_columns)
+columns_dir = 'preproc_columns'
+# written a block of this many bytes at a time
+write_buffer_size = 1 << 22
+# the languages with a bit in the Wikipedia languages mask of a new columnar
+# output (others get one as they turn up)
+wiki_langs = tuple(lang for lang in label_langs
+                   if lang not in ('doi', 'best')) + \
+    ('commons', 'species', 'meta', 'mediawiki', 'wikidata', 'sources')
+
+
+def new_outputs(wiki_bits=None):
+    """empty outputs for encode_entity: a list of lines for each of
+    output_files (of date rows, for the dates) or, given the bits of the
+    Wikipedia languages (for columns), a ColumnBatch for the items and
+    links"""
+    if wiki_bits is not None:
+        return ColumnBatch(wiki_bits), None, [], []
+    return [], [], [], []
+
+
+def join_outputs(outputs):
+    """the outputs of encode_entity, with their lists of lines made into
+    blocks of bytes, and the date rows into a block of ranked_date_dtype
+    rows"""
+    *outputs, dates = outputs
+    return tuple(b''.join(output) if isinstance(output, list) else output
+                 for output in outputs) + \
+        (np.array(dates, dtype=ranked_date_dtype).tobytes(),)
+
+
+def encode_entity(obj, label_langs, outputs, link_counts, skipped=None):
+    """add an entity's item, links, labels and dates to outputs (see
+    new_outputs), as lines of UTF-8 bytes or as rows of columns, and count
+    its links by property in link_counts (and dates that can't be read in
+    skipped)
+
+    the lines are added in the order they used to be written in, so if one
+    can't be encoded, those before it are kept; the dates come last, so
+    they can't lose the entity anything else"""
+    items, links, label_lines, date_rows = outputs
+    qid, labels, statements, wp_langs = process_entity(obj, label_langs)
+    if isinstance(items, ColumnBatch):
+        items.add(qid, labels['best'], wp_langs, statements)
+    else:
+        items.append(json.dumps(
+            {
+             '_key': qid,
+             'label': labels['best'],
+             'wp_langs': wp_langs
+            }).encode() + b'\n')
+        links.extend([json.dumps(statements[key]).encode() + b'\n'
+                      for key in statements])
+    for key in statements:
+        link_counts.update(statements[key]['wd_types'])
+    for lang in labels:
+        label_lines.append(
+            (lang + '\t' + labels[lang] + '\t' + qid + '\n').encode())
+    dates = get_dates(obj, skipped)
+    if dates:
+        entity = encode_id(qid)
+        date_rows.extend((entity,) + row for row in dates)
+
+
+def process_lines(lines, label_langs=label_langs, wiki_bits=None, shards=0):
+    """process a batch of dump lines (e.g. in a worker process), returning
+    the number of lines, the outputs (see join_outputs) and counts for
+    metrics, so that all that's left is writing the outputs; with
+    wiki_bits, the items and links are columns, and with shards, the outputs
+    are a list of those of each shard"""
+    label_langs = label_chain(tuple(label_langs))
+    outputs = [new_outputs(wiki_bits) for _ in range(shards or 1)]
+    counts = {'exceptions': Counter(), 'skipped': Counter(),
+              'statements': Counter()}
+    for line in lines:
+        try:
+            obj = decode_line(line)
+            shard = shard_of(obj['id'], shards) if shards else 0
+            encode_entity(obj, label_langs, outputs[shard],
+                          counts['statements'], counts['skipped'])
+        except Exception as e:
+            if line != b'[\n' and line != b']\n':
+                print("*** Exception:",
+                      type(e), "-", e, "on following line:")
+                print(line.decode('utf-8', 'replace'))
+                counts['exceptions'][type(e).__name__] += 1
+                counts['skipped']['exception'] += 1
+    blocks = [join_outputs(shard_outputs) for shard_outputs in outputs]
+    return len(lines), blocks if shards else blocks[0], counts
+
+
+class PreprocExtractor(Extractor):
+    """items with their best labels and Wikipedia languages, links between
+    items, labels in every language, and dates, written as they're
+    extracted to items.jsonl, links.jsonl, wd_labels.txt and date_claims.bin
+    (mode 'a' appends to them); with columns, the items and links are
+    written as columns in preproc_columns instead (see wd_preproc_columns),
+    and with shards, each output is written in that many shards (see
+    wd_shards)"""
+
+    name = 'labels'
+
+    def __init__(self, out_dir='.', label_langs=label_langs, mode='w',
+                 columns=False, shards=0):
+        if columns and shards:
+            raise ValueError('columns can\'t be written in shards')
+        super().__init__(out_dir)
+        self.label_langs = label_chain(tuple(label_langs))
+        self.mode = mode
+        self.columns = columns
+        self.shards = shards
+        # links written, by property
+        self.link_counts = Counter()
+        # what was skipped (dates that couldn't be read), by why
+        self.skipped = Counter()
+
+    def start(self):
+        super().start()
+        self.items_file = self.rels_file = self.column_writer = \
+            self.wiki_bits = self.sharded = None
+        if self.shards:
+            # the shards share the memory a whole output's buffer would take
+            buffering = max(write_buffer_size // self.shards, 1 << 16)
+            self.sharded = [ShardedOutput(self.path(filename), self.shards,
+                                          self.mode, binary=True,
+                                          buffering=buffering)
+                            for filename in output_files]
+            return
+        for filename in output_files:
+            remove_manifest(self.path(filename))
+        if self.columns:
+            self.column_writer = ColumnWriter(self.path(columns_dir),
+                                              wiki_langs, self.mode)
+            self.wiki_bits = self.column_writer.wiki_bits
+        else:
+            self.items_file, self.rels_file = [
+                open(self.path(filename), self.mode + 'b',
+                     buffering=write_buffer_size)
+                for filename in output_files[:2]]
+        self.labels_file, self.dates_file = [
+            open(self.path(filename), self.mode + 'b',
+                 buffering=write_buffer_size)
+            for filename in output_files[2:]]
+
+    def process_entity(self, obj):
+        outputs = new_outputs(self.wiki_bits)
+        try:
+            encode_entity(obj, self.label_langs, outputs, self.link_counts,
+                          self.skipped)
+        finally:
+            if self.sharded is not None:
+                self.write_shard(shard_of(obj['id'], self.shards),
+                                 join_outputs(outputs))
+            else:
+                self.write_blocks(join_outputs(outputs))
+
+    def write_shard(self, shard, blocks):
+        for output, block in zip(self.sharded, blocks):
+            output.files[shard].write(block)
+
+    def write_blocks(self, blocks):
+        """write the outputs of encode_entity (see join_outputs), or with
+        shards, a list of those of each shard"""
+        if self.sharded is not None:
+            for shard, shard_blocks in enumerate(blocks):
+                self.write_shard(shard, shard_blocks)
+            return
+        items, links, label_lines, dates = blocks
+        if self.column_writer is not None:
+            self.column_writer.write(items)
+        else:
+            self.items_file.write(items)
+            self.rels_file.write(links)
+        self.labels_file.write(label_lines)
+        self.dates_file.write(dates)
+
+    def output_sizes(self):
+        """flush the outputs and return their sizes (for checkpoints)"""
+        sizes = {}
+        if self.sharded is not None:
+            for output in self.sharded:
+                sizes.update(output.sizes())
+            return sizes
+        if self.column_writer is not None:
+            sizes.update(self.column_writer.write_meta())
+            outfiles = (self.labels_file, self.dates_file)
+        else:
+            outfiles = (self.items_file, self.rels_file, self.labels_file,
+                        self.dates_file)
+        for outfile in outfiles:
+            outfile.flush()
+            sizes[outfile.name] = os.fstat(outfile.fileno()).st_size
+        return sizes
+
+    def finish(self):
+        if self.sharded is not None:
+            for output in self.sharded:
+                output.close()
+            return
+        if self.column_writer is not None:
+            self.column_writer.close()
+        else:
+            self.items_file.close()
+            self.rels_file.close()
+        self.labels_file.close()
+        self.dates_file.close()
+
+
 def write_statements(statements, path):
     """write file containing list of statements/relationships"""
     with open(path, 'w') as csvfile:
@@ -141,48 +403,151 @@ def write_items_json(items, path):
         itemsfile.write(json.dumps(items, indent=True))
 
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        dump_path = sys.argv[1]
-        source = open(dump_path)
+def preprocess(dump_path, workers=1, batch_size=1000, ordered=True,
+               checkpoint=None, checkpoint_every=0, resume=False,
+               metrics=None, columns=False, shards=0):
+    """write items.jsonl, links.jsonl, wd_labels.txt and date_claims.bin (or
+    with columns, preproc_columns instead of the first two; with shards, that
+    many shards of each) from the dump at dump_path (or stdin if not given),
+    spreading batches of lines across a pool of worker processes, which
+    encode the lines to write, so that all that's left for this process is
+    reading the dump and writing blocks of bytes; the
+    outputs are the same for any number of workers, unless ordered is False,
+    in which case each batch is written as soon as it's done, and the lines
+    of different batches may be in any order
+
+    with a Checkpoint, one is saved every checkpoint_every lines (rounded up
+    to a whole batch), and with resume, processing continues from the last
+    one saved (if any)"""
+    if not ordered and checkpoint_every:
+        raise ValueError('checkpoints need the outputs in dump order')
+    # start the workers before the dump is opened, since opening a compressed
+    # dump starts a decompression thread, and forking with threads running
+    # isn't safe
+    pool = mp.Pool(workers) if workers > 1 else None
+    source = open_dump(dump_path)
+
+    # a checkpoint records how much of the input has been processed, and
+    # how much of each output had been written at that point
+    index = checkpoint.load() if checkpoint is not None and resume else None
+    if index is not None:
+        truncate_outputs(index['outputs'])
+        skip_bytes(source, index['offset'])
+        offset, line_count = index['offset'], index['line_count']
+        mode = 'a'
+        print('resuming from checkpoint after', line_count, 'lines')
     else:
-        source = sys.stdin
-
-    # 'doi' is for Digital Object Identifiers; Wikidata has them, and Wikipedia
-    #     links to them with links that look very much like inter-language
-    #     Wikipedia links
-    # 'best' is for the best label that can be found along the language chain
-    label_langs = ('en', 'de', 'fr', 'ru', 'it', 'es', 'pl', 'ja', 'pt', 'ar', 'nl', 'sv', 'uk', 'ca', 'tr', 'no', 'fi', 'id', 'vi', 'zh', 'he', 'ceb', 'war', 'fa', 'sr', 'arz', 'ko', 'hu', 'cs', 'sh', 'ro', 'zh_min_nan', 'eu', 'ms', 'eo', 'hy', 'ce', 'bg', 'da', 'azb', 'sk', 'kk', 'min', 'hr', 'et', 'lt', 'be', 'el', 'sl', 'simple', 'gl', 'az', 'ur', 'nn', 'hi', 'th', 'ka', 'uz', 'la', 'cy', 'ta', 'vo', 'ast', 'mk', 'lv', 'tg', 'tt', 'mg', 'af', 'bn', 'oc', 'zh_yue', 'bs', 'sq', 'ky', 'new', 'tl', 'be_x_old', 'te', 'ml', 'br', 'nds', 'pms', 'su', 'sw', 'ht', 'lb', 'vec', 'jv', 'mr', 'sco', 'pnb', 'ga', 'ba', 'szl', 'is', 'my', 'fy', 'cv', 'lmo', 'an', 'pa', 'ne', 'wuu', 'yo', 'bar', 'io', 'ku', 'gu', 'als', 'ckb', 'kn', 'scn', 'bpy', 'ia', 'qu', 'diq', 'mn', 'bat_smg', 'or', 'si', 'nv', 'cdo', 'ilo', 'gd', 'yi', 'am', 'nap', 'bug', 'xmf', 'wa', 'sd', 'hsb', 'mai', 'map_bms', 'fo', 'mzn', 'li', 'eml', 'sah', 'os', 'ps', 'sa', 'frr', 'bcl', 'ace', 'zh_classical', 'mrj', 'mhr', 'hif', 'hak', 'roa_tara', 'pam', 'nso', 'km', 'hyw', 'rue', 'se', 'crh', 'bh', 'shn', 'vls', 'mi', 'nds_nl', 'nah', 'as', 'sc', 'vep', 'gor', 'gan', 'myv', 'ab', 'glk', 'bo', 'so', 'co', 'tk', 'fiu_vro', 'sn', 'lrc', 'kv', 'csb', 'ha', 'gv', 'udm', 'ie', 'ay', 'pcd', 'zea', 'kab', 'nrm', 'ug', 'lez', 'kw', 'stq', 'haw', 'frp', 'lfn', 'lij', 'mwl', 'gn', 'gom', 'rm', 'mt', 'lo', 'lad', 'koi', 'sat', 'fur', 'olo', 'dty', 'dsb', 'ang', 'ext', 'ln', 'bjn', 'ban', 'cbk_zam', 'dv', 'ksh', 'gag', 'pfl', 'tyv', 'pag', 'pi', 'zu', 'av', 'awa', 'bxr', 'xal', 'krc', 'pap', 'za', 'pdc', 'kaa', 'rw', 'arc', 'szy', 'to', 'nov', 'jam', 'tpi', 'kbp', 'kbd', 'ig', 'na', 'tet', 'wo', 'tcy', 'ki', 'inh', 'jbo', 'atj', 'roa_rup', 'bi', 'lbe', 'kg', 'ty', 'mdf', 'lg', 'srn', 'xh', 'gcr', 'fj', 'ltg', 'chr', 'sm', 'ak', 'got', 'kl', 'pih', 'om', 'cu', 'tn', 'tw', 'st', 'ts', 'rmy', 'bm', 'nqo', 'chy', 'rn', 'mnw', 'tum', 'ny', 'ss', 'ch', 'pnt', 'iu', 'ady', 'ks', 've', 'ee', 'ik', 'sg', 'ff', 'ti', 'dz', 'din', 'cr', 'ng', 'cho', 'kj', 'mh', 'ho', 'ii', 'aa', 'mus', 'hz', 'kr', 'smn', 'doi', 'best')
-
-    with open('items.jsonl', 'w') as items_file, \
-         open('links.jsonl', 'w') as rels_file, \
-         open('wd_labels.txt', 'w') as labels_file:
-
-        #TODO get date working
-
-        # items_file.write('_key\tlabel\n')
-        #rels_file.write('_key\t_from\ttype\t_to\n')
-
-        for line in source:
-            try:
-                qid, labels, statements, wp_langs = process_json_line(line, label_langs)
-                items_file.write(json.dumps(
-                    {
-                     '_key': qid,
-                     'label': labels['best'],
-                     'wp_langs': wp_langs
-                    }) + '\n')
-                rels_file.writelines(
-                [json.dumps(statements[key]) + '\n' for key in statements])
-                label_lines = [lang + '\t' + labels[lang] + '\t' + qid + '\n'
-                                for lang in labels]
-                labels_file.writelines(label_lines)
-            except Exception as e:
-                if line != '[\n' and line != ']\n':
-                    print("*** Exception:",
-                          type(e), "-", e, "on following line:")
-                    print(line)
+        if checkpoint is not None:
+            checkpoint.remove()
+        offset = line_count = 0
+        mode = 'w'
+    start_count = line_count
+
+    extractor = PreprocExtractor(mode=mode, columns=columns, shards=shards)
+    extractor.start()
+    # the languages that already have bits when the workers start; the
+    # writer gives others theirs
+    wiki_bits = dict(extractor.wiki_bits) if columns else None
+
+    def submit(batch):
+        """start processing a batch of lines; returns a function giving its
+        results, and one saying whether they're ready yet"""
+        if pool is not None:
+            result = pool.apply_async(process_lines,
+                                      (batch, label_langs, wiki_bits, shards))
+            return result.get, result.ready
+        result = process_lines(batch, label_langs, wiki_bits, shards)
+        return (lambda: result), (lambda: True)
+
+    def next_done(pending):
+        """take the first pending batch or, if not ordered, the first that's
+        done (if any)"""
+        if not ordered:
+            for i, (_, ready, _) in enumerate(pending):
+                if ready():
+                    get_result, _, batch_bytes = pending[i]
+                    del pending[i]
+                    return get_result, batch_bytes
+        get_result, _, batch_bytes = pending.popleft()
+        return get_result, batch_bytes
+
+    def write(result, batch_bytes):
+        nonlocal offset, line_count
+        count, blocks, counts = result
+        offset += batch_bytes
+        line_count += count
+        extractor.write_blocks(blocks)
+        if metrics is not None:
+            metrics.add_counts(counts)
+        if checkpoint_every and \
+                (line_count - count) // checkpoint_every < \
+                line_count // checkpoint_every:
+            checkpoint.save({'offset': offset, 'line_count': line_count,
+                             'outputs': extractor.output_sizes()})
+
+    with source:
+        # keep a bounded number of batches in flight, so that the whole
+        # dump isn't read into the pool's task queue ahead of the workers
+        pending = deque()
+        for batch in batched(source, batch_size):
+            pending.append(submit(batch) + (sum(map(len, batch)),))
+            if len(pending) >= workers * 4:
+                get_result, batch_bytes = next_done(pending)
+                write(get_result(), batch_bytes)
+        while pending:
+            get_result, batch_bytes = next_done(pending)
+            write(get_result(), batch_bytes)
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    extractor.finish()
+    if metrics is not None:
+        metrics.record_decompression(source)
+    return line_count - start_count
 
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('dump_path', nargs='?',
+                        help='JSON dump, optionally .gz, .bz2 or .zst '
+                             '(default: read stdin)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes encoding entities')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='dump lines handed to a worker at a time')
+    parser.add_argument('--unordered', action='store_true',
+                        help='write each batch as soon as it\'s done, '
+                             'rather than in dump order')
+    parser.add_argument('--columns', action='store_true',
+                        help='write the items and links as columns in '
+                             'preproc_columns rather than as JSON lines '
+                             '(see wd_preproc_columns)')
+    parser.add_argument('--shards', type=int, default=0,
+                        help='write each output in this many shards, by '
+                             'entity, for reading in parallel (see '
+                             'wd_shards)')
+    parser.add_argument('--checkpoint-every', type=int, default=0,
+                        help='save a checkpoint every this many lines')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue from the last checkpoint')
+    args = parser.parse_args()
+    if args.unordered and (args.checkpoint_every or args.resume):
+        parser.error('--unordered can\'t be used with checkpoints')
+    if args.columns and args.shards:
+        parser.error('--columns can\'t be written in --shards')
+
+    metrics = RunMetrics('wd_preproc')
+    checkpoint = Checkpoint('wd_preproc-checkpoint')
+    processed = 0
+    with metrics.stage('extract', lambda: processed):
+        processed = preprocess(
+            args.dump_path, workers=args.workers,
+            batch_size=args.batch_size, ordered=not args.unordered,
+            checkpoint=checkpoint, checkpoint_every=args.checkpoint_every,
+            resume=args.resume, metrics=metrics, columns=args.columns,
+            shards=args.shards)
+    checkpoint.remove()
+    metrics.write()
+
     #TODO should I check/grab/decompress/verify the wikidata dump from here?
-    #TODO get dates; at the very least, get all the date-related info you use in CG right now
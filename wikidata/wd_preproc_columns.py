@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""wd_preproc's items and links as columns of numbers rather than JSON lines
+(wd_preproc.py --columns), which take a fraction of the space and load as
+memory-mapped arrays instead of having to be parsed
+
+the columns are raw files in a directory (preproc_columns by default),
+described by its meta.json, as with wd_columns; there are two tables:
+
+    items   entity, label, wikis
+    links   src, dst, types
+
+entity, src and dst are entity codes (see wd_ids); label is a string column:
+items.label holds the UTF-8 labels one after another, and items.label.offsets
+where each one starts (and, last, where they end); wikis is a bitmask of the
+languages of the item's Wikipedia sitelinks, in mask_words 64-bit words for
+each item, where bit i stands for the language meta.json's wikis[i]; types
+is a list column: links.types holds the property codes (see wd_ids) of the
+links' wd_types one link after another, and links.types.offsets where each
+link's types start
+
+wd_preproc_columns.py preproc_columns --jsonl out_dir writes the
+items.jsonl and links.jsonl for ArangoDB; these are the same as those
+wd_preproc writes, except that each item's wp_langs are sorted by site
+(e.g. dewiki, enwiki, frwiki), since a mask doesn't keep their order
+
+sizes, and load times (into memory, with json.loads for the JSON lines), for
+the outputs of a 20,000-entity sample (wd_preproc_columns.py preproc_columns
+--compare . gives these for another):
+
+    table   JSON lines              columns
+    items   1,390 KB, 0.096 s       1,505 KB, 0.002 s
+    links   3,696 KB, 0.254 s       1,283 KB, 0.001 s
+
+items come out a little bigger, since each item's mask takes mask_words * 8 bytes
+whether it has any sitelinks or not; a mask is still quicker to filter on
+than a list of languages"""
+
+import json
+import os
+import sys
+import time
+from array import array
+
+import numpy as np
+
+from wd_ids import decode_ids, decode_prop, encode_id, encode_prop
+
+mask_words = 6
+# every language ever seen in a Wikipedia sitelink gets a bit of the mask
+max_wikis = mask_words * 64
+
+# column name -> NumPy dtype, for each table; 'str' for a string column and
+# 'list' for a list column of int32
+tables = {
+    'items': {'entity': '<i8', 'label': 'str', 'wikis': '<u8'},
+    'links': {'src': '<i8', 'dst': '<i8', 'types': 'list'},
+}
+
+
+def column_path(path, table, column):
+    return os.path.join(path, '%s.%s' % (table, column))
+
+
+class ColumnBatch:
+    """the rows of a batch of entities, collected by appending to arrays
+    (e.g. in a worker process), to be written by a ColumnWriter"""
+
+    def __init__(self, wiki_bits):
+        # language -> bit in wikis
+        self.wiki_bits = wiki_bits
+        self.entity = array('q')
+        self.label_lengths = array('q')
+        self.labels = []
+        self.wikis = array('Q')
+        # (row, language) for the languages without a bit in wiki_bits
+        self.new_wikis = []
+        self.src = array('q')
+        self.dst = array('q')
+        self.type_counts = array('q')
+        self.types = array('i')
+
+    def __getstate__(self):
+        # wiki_bits is the same for every batch, so it isn't sent back from
+        # a worker
+        return dict(self.__dict__, wiki_bits=None)
+
+    def add(self, qid, label, wp_langs, statements):
+        """add an item, and its links (wd_preproc's statements); nothing is
+        added if any of it can't be encoded"""
+        entity = encode_id(qid)
+        data = label.encode('utf-8', 'surrogatepass')
+        mask = 0
+        new_wikis = []
+        for lang in wp_langs:
+            bit = self.wiki_bits.get(lang)
+            if bit is None:
+                new_wikis.append((len(self.entity), lang))
+            else:
+                mask |= 1 << bit
+        links = [(encode_id(statement['_to']),
+                  [encode_prop(prop) for prop in statement['wd_types']])
+                 for statement in statements.values()]
+
+        self.entity.append(entity)
+        self.label_lengths.append(len(data))
+        self.labels.append(data)
+        self.wikis.extend([mask >> (64 * word) & 0xFFFFFFFFFFFFFFFF
+                           for word in range(mask_words)])
+        self.new_wikis.extend(new_wikis)
+        for dst, types in links:
+            self.src.append(entity)
+            self.dst.append(dst)
+            self.type_counts.append(len(types))
+            self.types.extend(types)
+
+
+class OffsetColumnWriter:
+    """appends the offsets of a string or list column, given the lengths of
+    its values"""
+
+    def __init__(self, path, mode):
+        self.end = 0
+        if mode == 'a' and os.path.exists(path) and os.path.getsize(path):
+            with open(path, 'rb') as infile:
+                infile.seek(-8, os.SEEK_END)
+                self.end = array('q', infile.read(8))[0]
+        self.outfile = open(path, mode + 'b')
+        if not self.outfile.tell():
+            array('q', [0]).tofile(self.outfile)
+
+    def write(self, lengths):
+        if len(lengths):
+            offsets = np.cumsum(np.frombuffer(lengths, dtype=np.int64))
+            offsets += self.end
+            self.end = int(offsets[-1])
+            self.outfile.write(offsets.tobytes())
+
+
+class ColumnWriter:
+    """writes ColumnBatches to the columns in path (mode 'a' appends to
+    them), giving languages that don't have a bit yet the next one free"""
+
+    def __init__(self, path, wikis, mode='w'):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        if mode == 'a' and os.path.exists(meta_path):
+            with open(meta_path) as metafile:
+                wikis = json.loads(metafile.read())['wikis']
+        self.wikis = list(wikis)
+        self.wiki_bits = {lang: bit for bit, lang in enumerate(self.wikis)}
+
+        def open_column(table, column):
+            return open(column_path(path, table, column), mode + 'b')
+        self.entity = open_column('items', 'entity')
+        self.labels = open_column('items', 'label')
+        self.label_offsets = OffsetColumnWriter(
+            column_path(path, 'items', 'label.offsets'), mode)
+        self.wikis_file = open_column('items', 'wikis')
+        self.src = open_column('links', 'src')
+        self.dst = open_column('links', 'dst')
+        self.types = open_column('links', 'types')
+        self.type_offsets = OffsetColumnWriter(
+            column_path(path, 'links', 'types.offsets'), mode)
+
+    def files(self):
+        return (self.entity, self.labels, self.label_offsets.outfile,
+                self.wikis_file, self.src, self.dst, self.types,
+                self.type_offsets.outfile)
+
+    def write(self, batch):
+        for row, lang in batch.new_wikis:
+            if lang not in self.wiki_bits:
+                if len(self.wikis) >= max_wikis:
+                    raise ValueError('more than %d Wikipedia languages' %
+                                     max_wikis)
+                self.wiki_bits[lang] = len(self.wikis)
+                self.wikis.append(lang)
+            bit = self.wiki_bits[lang]
+            batch.wikis[row * mask_words + bit // 64] |= 1 << (bit % 64)
+        self.entity.write(batch.entity)
+        self.labels.write(b''.join(batch.labels))
+        self.label_offsets.write(batch.label_lengths)
+        self.wikis_file.write(batch.wikis)
+        self.src.write(batch.src)
+        self.dst.write(batch.dst)
+        self.types.write(batch.types)
+        self.type_offsets.write(batch.type_counts)
+
+    def write_meta(self):
+        """write meta.json (which a checkpoint needs, for the wikis)"""
+        sizes = {}
+        for outfile in self.files():
+            outfile.flush()
+            sizes[outfile.name] = os.fstat(outfile.fileno()).st_size
+        rows = {'items': sizes[self.entity.name] // 8,
+                'links': sizes[self.src.name] // 8}
+        meta = {'mask_words': mask_words, 'wikis': self.wikis,
+                'tables': {table: {'rows': rows[table],
+                                   'columns': tables[table]}
+                           for table in tables}}
+        with open(os.path.join(self.path, 'meta.json'), 'w') as metafile:
+            metafile.write(json.dumps(meta, indent=True))
+        return sizes
+
+    def close(self):
+        self.write_meta()
+        for outfile in self.files():
+            outfile.close()
+
+
+class PreprocColumns:
+    """reader for the columns; each is memory-mapped when it's asked for"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as metafile:
+            self.meta = json.loads(metafile.read())
+        self.wikis = self.meta['wikis']
+
+    def rows(self, table):
+        return self.meta['tables'][table]['rows']
+
+    def array(self, path, dtype):
+        if not os.path.getsize(path):
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    def column(self, table, column):
+        """a column as an array; a string or list column is a pair of
+        arrays, of the offsets and the data"""
+        dtype = self.meta['tables'][table]['columns'][column]
+        path = column_path(self.path, table, column)
+        if dtype in ('str', 'list'):
+            return (self.array(path + '.offsets', np.int64),
+                    self.array(path, np.uint8 if dtype == 'str'
+                               else np.int32))
+        if column == 'wikis':
+            return self.array(path, dtype).reshape(-1,
+                                                   self.meta['mask_words'])
+        return self.array(path, dtype)
+
+    def wp_langs(self, wikis):
+        """lists of the languages in rows of wikis masks, in site order"""
+        bits = np.unpackbits(np.ascontiguousarray(wikis).view(np.uint8),
+                             axis=1, bitorder='little')
+        order = sorted(range(len(self.wikis)),
+                       key=lambda bit: self.wikis[bit] + 'wiki')
+        bits = bits[:, order]
+        langs = [self.wikis[bit] for bit in order]
+        return [[langs[i] for i in np.flatnonzero(row).tolist()]
+                for row in bits]
+
+    def items_lines(self, block_size=1 << 16):
+        """yield the lines of items.jsonl"""
+        entity = self.column('items', 'entity')
+        offsets, data = self.column('items', 'label')
+        wikis = self.column('items', 'wikis')
+        for start in range(0, len(entity), block_size):
+            end = min(start + block_size, len(entity))
+            text = data[offsets[start]:offsets[end]].tobytes()
+            bounds = (offsets[start:end + 1] - offsets[start]).tolist()
+            for qid, label_start, label_end, wp_langs in zip(
+                    decode_ids(entity[start:end]), bounds, bounds[1:],
+                    self.wp_langs(wikis[start:end])):
+                label = text[label_start:label_end].decode('utf-8',
+                                                          'surrogatepass')
+                yield json.dumps({'_key': qid, 'label': label,
+                                  'wp_langs': wp_langs}) + '\n'
+
+    def links_lines(self, block_size=1 << 16):
+        """yield the lines of links.jsonl"""
+        src = self.column('links', 'src')
+        dst = self.column('links', 'dst')
+        offsets, types = self.column('links', 'types')
+        for start in range(0, len(src), block_size):
+            end = min(start + block_size, len(src))
+            props = [decode_prop(prop) for prop in
+                     types[offsets[start]:offsets[end]].tolist()]
+            bounds = (offsets[start:end + 1] - offsets[start]).tolist()
+            for from_qid, to_qid, types_start, types_end in zip(
+                    decode_ids(src[start:end]), decode_ids(dst[start:end]),
+                    bounds, bounds[1:]):
+                yield json.dumps({'_key': from_qid + to_qid,
+                                  '_from': from_qid, '_to': to_qid,
+                                  'wd_types': props[types_start:types_end]}
+                                 ) + '\n'
+
+    def write_jsonl(self, out_dir='.'):
+        os.makedirs(out_dir, exist_ok=True)
+        for filename, lines in (('items.jsonl', self.items_lines()),
+                                ('links.jsonl', self.links_lines())):
+            with open(os.path.join(out_dir, filename), 'w') as outfile:
+                outfile.writelines(lines)
+
+
+def load_jsonl(path):
+    with open(path, 'rb') as infile:
+        return [json.loads(line) for line in infile]
+
+
+def compare(path, jsonl_dir):
+    """yield the size and load time of each table, as JSON lines (in
+    jsonl_dir) and as columns (in path)"""
+    columns = PreprocColumns(path)
+    for table, filename in (('items', 'items.jsonl'),
+                            ('links', 'links.jsonl')):
+        jsonl_path = os.path.join(jsonl_dir, filename)
+        start_time = time.time()
+        load_jsonl(jsonl_path)
+        jsonl_time = time.time() - start_time
+
+        start_time = time.time()
+        size = 0
+        for column in tables[table]:
+            loaded = columns.column(table, column)
+            for part in loaded if isinstance(loaded, tuple) else (loaded,):
+                # read it all into memory, as the JSON lines are
+                size += np.array(part).nbytes
+        yield (table, os.path.getsize(jsonl_path) / 1024, jsonl_time,
+               size / 1024, time.time() - start_time)
+
+
+# usage: wd_preproc_columns.py preproc_columns [--jsonl OUT_DIR]
+#                                            [--compare JSONL_DIR]
+if __name__ == "__main__":
+    path = sys.argv[1]
+    if len(sys.argv) > 3 and sys.argv[2] == '--jsonl':
+        PreprocColumns(path).write_jsonl(sys.argv[3])
+    elif len(sys.argv) > 3 and sys.argv[2] == '--compare':
+        print('table\tJSONL KB\tJSONL s\tcolumns KB\tcolumns s')
+        for result in compare(path, sys.argv[3]):
+            print('%s\t%.0f\t%.3f\t%.0f\t%.3f' % result)
+    else:
+        columns = PreprocColumns(path)
+        for table in tables:
+            print(table, columns.rows(table), 'rows')
+        print(len(columns.wikis), 'Wikipedia languages')
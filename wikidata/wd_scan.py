@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""scan a Wikidata JSON dump once, decoding each entity a single time and
+handing it to any number of extractors, each writing its own outputs"""
+
+import argparse
+import importlib
+import os
+import time
+
+from wd_dump import decode_line, open_dump
+
+# extractor name -> (module, class); modules are imported only when their
+# extractor is used, so e.g. extracting labels doesn't need networkx
+extractors = {
+    'statements': ('wd2cg', 'CauseGraphExtractor'),
+    'fiction': ('build_fiction_filter', 'FictionExtractor'),
+    'labels': ('wd_preproc', 'PreprocExtractor'),
+    'sitelinks': ('wd_pairs', 'SitelinkTitleExtractor'),
+    'pairs': ('wd_pairs', 'ItemPairExtractor'),
+    'columns': ('wd_columns', 'ColumnarExtractor'),
+}
+
+
+class Extractor:
+    """something made from the entities of a dump in a single pass
+
+    subclasses override process_entity, which gets each decoded entity in
+    dump order, and finish, which writes whatever hasn't been written yet;
+    outputs go in out_dir"""
+
+    name = None
+
+    def __init__(self, out_dir='.'):
+        self.out_dir = out_dir
+
+    def path(self, filename):
+        return os.path.join(self.out_dir, filename)
+
+    def start(self):
+        """called before the first entity"""
+        os.makedirs(self.out_dir, exist_ok=True)
+
+    def process_entity(self, obj):
+        raise NotImplementedError
+
+    def finish(self):
+        """called after the last entity"""
+
+
+def get_extractor(name, out_dir='.', **kwargs):
+    """make the extractor registered under name"""
+    module_name, class_name = extractors[name]
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)(out_dir=out_dir, **kwargs)
+
+
+def scan(dump_path, extractors):
+    """hand every entity of the dump at dump_path (or stdin if not given) to
+    each of the extractors, then let them finish; an exception in one
+    extractor is reported, and doesn't stop the others"""
+    for extractor in extractors:
+        extractor.start()
+
+    entity_count = 0
+    start_time = time.time()
+    with open_dump(dump_path) as infile:
+        for line in infile:
+            # skip the '[' and ']' lines around the entities
+            if not line.startswith(b'{'):
+                continue
+            try:
+                obj = decode_line(line)
+            except Exception as e:
+                print("*** Exception", type(e), "-", e, "on following line:")
+                print(line.decode('utf-8', 'replace'))
+                continue
+            entity_count += 1
+            for extractor in extractors:
+                try:
+                    extractor.process_entity(obj)
+                except Exception as e:
+                    print("*** Exception in", extractor.name, "extractor",
+                          type(e), "-", e, "on", obj.get('id'))
+
+    elapsed = time.time() - start_time
+    print('scanned %d entities in %.1f s (%.0f entities/s)' %
+          (entity_count, elapsed, entity_count / max(elapsed, 1e-9)))
+
+    for extractor in extractors:
+        extractor.finish()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('dump_path', nargs='?',
+                        help='JSON dump, optionally .gz, .bz2 or .zst '
+                             '(default: read stdin)')
+    parser.add_argument('-e', '--extract', action='append',
+                        choices=sorted(extractors), required=True,
+                        help='extractor to run (repeat for several)')
+    parser.add_argument('--out-dir', default='.',
+                        help='write each extractor\'s outputs in a '
+                             'subdirectory of this directory, named after '
+                             'the extractor')
+    args = parser.parse_args()
+
+    scan(args.dump_path,
+         [get_extractor(name, os.path.join(args.out_dir, name))
+          for name in dict.fromkeys(args.extract)])
@@ -0,0 +1,138 @@
+"""outputs split into shards by a hash of each record's source entity, so
+that they can be read in parallel (e.g. wd_preproc.py --shards 16 writes
+links-00000-of-00016.jsonl to links-00015-of-00016.jsonl instead of
+links.jsonl)
+
+every record of an entity goes in the same shard; a shard's records are in
+the order they'd have been in the whole output. once an output's shards are
+all written, a manifest (e.g. links.jsonl.shards.json) lists them, so a
+reader given the path of the whole output finds them; map_shards runs a
+function on each shard in a pool of processes, returning the results in
+shard order, so that merging them gives the same result every time"""
+
+import json
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+from wd_ids import encode_id
+
+# Fibonacci hashing: multiplying an entity code by this (mod 2**64) spreads
+# codes that are close together (as QIDs are) evenly across shards
+hash_multiplier = 0x9E3779B97F4A7C15
+hash_name = 'fibonacci64'
+uint64_mask = (1 << 64) - 1
+
+
+def shard_codes(codes, shards):
+    """the shard of each of an array of entity codes (see wd_ids)"""
+    codes = np.asarray(codes, dtype=np.int64).view(np.uint64)
+    hashed = (codes * np.uint64(hash_multiplier)) >> np.uint64(32)
+    return (hashed % np.uint64(shards)).astype(np.int64)
+
+
+def shard_of(entity_id, shards):
+    """the shard of an entity ID (the same as shard_codes gives its code)"""
+    code = encode_id(entity_id) & uint64_mask
+    return ((code * hash_multiplier & uint64_mask) >> 32) % shards
+
+
+def shard_path(path, shard, shards):
+    """e.g. links.jsonl -> links-00003-of-00016.jsonl"""
+    stem, ext = os.path.splitext(path)
+    return '%s-%05d-of-%05d%s' % (stem, shard, shards, ext)
+
+
+def manifest_path(path):
+    return path + '.shards.json'
+
+
+def load_manifest(path):
+    """the manifest of an output written in shards, or None"""
+    if not os.path.exists(manifest_path(path)):
+        return None
+    with open(manifest_path(path)) as infile:
+        return json.loads(infile.read())
+
+
+def output_paths(path):
+    """the files an output was written to: its shards, if it was written in
+    shards, or else the output itself"""
+    manifest = load_manifest(path)
+    if manifest is None:
+        return [path]
+    out_dir = os.path.dirname(path)
+    return [os.path.join(out_dir, filename) for filename in manifest['files']]
+
+
+def remove_manifest(path):
+    """forget an output's shards (e.g. when writing it whole again)"""
+    if os.path.exists(manifest_path(path)):
+        os.remove(manifest_path(path))
+
+
+def map_shards(func, path, workers=None):
+    """func(shard path) for each of an output's files, in a pool of workers
+    (by default, one for each CPU) if there's more than one, in shard
+    order; func has to be picklable (e.g. a module-level function)"""
+    paths = output_paths(path)
+    workers = min(workers or os.cpu_count(), len(paths))
+    if workers <= 1:
+        return [func(shard) for shard in paths]
+    with mp.Pool(workers) as pool:
+        return pool.map(func, paths, chunksize=1)
+
+
+class ShardedOutput:
+    """an output written to shard files; writes go to files[shard], and
+    close() writes the manifest (any previous one is removed on opening, so
+    that readers don't take a partly written output for a whole one)"""
+
+    def __init__(self, path, shards, mode='w', binary=False, buffering=-1):
+        self.path = path
+        self.shards = shards
+        self.paths = [shard_path(path, shard, shards)
+                      for shard in range(shards)]
+        remove_manifest(path)
+        self.files = [open(shard, mode + ('b' if binary else ''),
+                           buffering=buffering)
+                      for shard in self.paths]
+
+    def write_store(self, store):
+        """write a TripleStore's statements, one 'Q1 P2 Q3' per line, each
+        to the shard of its source"""
+        shards = shard_codes(store.src, self.shards)
+        for shard, outfile in enumerate(self.files):
+            store.select(shards == shard).write_lines(outfile)
+
+    def sizes(self):
+        """flush the shards and return their sizes, by path"""
+        sizes = {}
+        for outfile in self.files:
+            outfile.flush()
+            sizes[outfile.name] = os.fstat(outfile.fileno()).st_size
+        return sizes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            # without a manifest, since the output isn't whole
+            for outfile in self.files:
+                outfile.close()
+
+    def close(self):
+        sizes = self.sizes()
+        for outfile in self.files:
+            outfile.close()
+        manifest = {'output': os.path.basename(self.path),
+                    'shards': self.shards, 'hash': hash_name,
+                    'key': 'source entity',
+                    'files': [os.path.basename(path) for path in self.paths],
+                    'bytes': [sizes[path] for path in self.paths]}
+        with open(manifest_path(self.path), 'w') as outfile:
+            outfile.write(json.dumps(manifest, indent=True))
@@ -0,0 +1,334 @@
+"""compact store for (source, property, destination) statements, kept as
+parallel NumPy arrays of integer codes instead of 'Q1 P2 Q3' strings"""
+
+import os
+import shutil
+import tempfile
+from array import array
+from collections import Counter
+
+import numpy as np
+
+import wd_extsort
+from wd_ids import decode_id, decode_prop, encode_id, encode_prop
+from wd_shards import map_shards
+
+# statements are decoded to text this many at a time
+text_block_size = 1 << 20
+
+
+class TripleBuffer:
+    """append-only statement buffer, cheap to grow and to pickle between
+    processes; convert with to_store once it's complete"""
+
+    def __init__(self):
+        self.src = array('q')
+        self.prop = array('q')
+        self.dst = array('q')
+
+    def __len__(self):
+        return len(self.src)
+
+    def add(self, qid, prop, other_qids):
+        """add the statement 'qid prop other' for each of other_qids"""
+        src, prop_code = encode_id(qid), encode_prop(prop)
+        for other_qid in other_qids:
+            # encode first, so that a bad ID doesn't leave a partial statement
+            dst = encode_id(other_qid)
+            self.src.append(src)
+            self.prop.append(prop_code)
+            self.dst.append(dst)
+
+    def extend(self, other):
+        self.src.extend(other.src)
+        self.prop.extend(other.prop)
+        self.dst.extend(other.dst)
+
+    def prop_counts(self):
+        """Counter of the statements by property"""
+        props, counts = np.unique(np.frombuffer(self.prop, dtype=np.int64),
+                                  return_counts=True)
+        return Counter({decode_prop(prop): count for prop, count in
+                        zip(props.tolist(), counts.tolist())})
+
+    def to_store(self):
+        """a TripleStore sharing this buffer's memory (so the buffer can't
+        grow any further)"""
+        return TripleStore(np.frombuffer(self.src, dtype=np.int64),
+                           np.frombuffer(self.prop, dtype=np.int64),
+                           np.frombuffer(self.dst, dtype=np.int64))
+
+
+def inverse_table(inverses):
+    """lookup array from property code to the code of its inverse, or 0 for
+    properties without one, given a dict like combined_inverses"""
+    codes = {encode_prop(p): encode_prop(inverses[p]) for p in inverses}
+    table = np.zeros(max(codes) + 1, dtype=np.int64)
+    for code in codes:
+        table[code] = codes[code]
+    return table
+
+
+class TripleStore:
+    """statements as parallel int64 arrays of source, property and
+    destination codes (see wd_ids); iterating gives 'Q1 P2 Q3' strings"""
+
+    def __init__(self, src, prop, dst):
+        self.src = src
+        self.prop = prop
+        self.dst = dst
+
+    def __len__(self):
+        return len(self.src)
+
+    def __iter__(self):
+        for src, prop, dst in self.iter_triples():
+            yield src + ' ' + prop + ' ' + dst
+
+    def iter_triples(self):
+        """yield statements as (source, property, destination) ID strings"""
+        for start in range(0, len(self), text_block_size):
+            end = start + text_block_size
+            for src, prop, dst in zip(self.src[start:end].tolist(),
+                                      self.prop[start:end].tolist(),
+                                      self.dst[start:end].tolist()):
+                yield decode_id(src), decode_prop(prop), decode_id(dst)
+
+    def select(self, mask):
+        """the statements selected by a boolean mask or index array"""
+        return TripleStore(self.src[mask], self.prop[mask], self.dst[mask])
+
+    def directed(self, inverses):
+        """orient every statement the same way, replacing a property that has
+        an inverse in inverses (e.g. combined_inverses) by that inverse and
+        swapping the source and destination"""
+        table = inverse_table(inverses)
+        in_table = (self.prop > 0) & (self.prop < len(table))
+        inverse = table[np.where(in_table, self.prop, 0)]
+        flip = in_table & (inverse != 0)
+        return TripleStore(np.where(flip, self.dst, self.src),
+                           np.where(flip, inverse, self.prop),
+                           np.where(flip, self.src, self.dst))
+
+    def unique(self):
+        """the distinct statements, sorted by source, property, destination"""
+        if not len(self):
+            return self
+        order = np.lexsort((self.dst, self.prop, self.src))
+        src, prop, dst = self.src[order], self.prop[order], self.dst[order]
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = ((src[1:] != src[:-1]) | (prop[1:] != prop[:-1]) |
+                    (dst[1:] != dst[:-1]))
+        return TripleStore(src[keep], prop[keep], dst[keep])
+
+    def specific_only(self, nonspecific_props, dated_ids):
+        """drop statements using one of nonspecific_props unless at least one
+        end is among dated_ids (an array of entity codes)"""
+        nonspecific = np.isin(self.prop,
+                              [encode_prop(p) for p in nonspecific_props])
+        dated = np.isin(self.src, dated_ids) | np.isin(self.dst, dated_ids)
+        return self.select(~nonspecific | dated)
+
+    def write_text(self, path, mode='w'):
+        """write one 'Q1 P2 Q3' statement per line (mode 'a' to append)"""
+        with open(path, mode) as outfile:
+            self.write_lines(outfile)
+
+    def write_lines(self, outfile):
+        for start in range(0, len(self), text_block_size):
+            block = self.select(slice(start, start + text_block_size))
+            outfile.writelines([s + '\n' for s in block])
+
+    def save(self, path):
+        """save the arrays to a .npz file"""
+        np.savez(path, src=self.src, prop=self.prop, dst=self.dst)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """make a store from a 2D array (or list) of [src, prop, dst] rows"""
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1, 3)
+        return cls(rows[:, 0], rows[:, 1], rows[:, 2])
+
+    @classmethod
+    def concatenate(cls, stores):
+        stores = list(stores)
+        if not stores:
+            return TripleBuffer().to_store()
+        return cls(np.concatenate([s.src for s in stores]),
+                   np.concatenate([s.prop for s in stores]),
+                   np.concatenate([s.dst for s in stores]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['src'], data['prop'], data['dst'])
+
+    @classmethod
+    def read_text(cls, lines):
+        """parse 'Q1 P2 Q3' statements from lines (e.g. an open file)"""
+        buf = TripleBuffer()
+        for line in lines:
+            src, prop, dst = line.split()
+            buf.add(src, prop, (dst,))
+        return buf.to_store()
+
+    @classmethod
+    def read_shards(cls, path, workers=None):
+        """read a file of statements, or each of its shards (see wd_shards)
+        in a worker; the statements are in shard order, which unique() puts
+        back in the order of a file of unique statements (as wd2cg writes)"""
+        return cls.concatenate(map_shards(read_text_file, path, workers))
+
+
+def read_text_file(path):
+    with open(path) as infile:
+        return TripleStore.read_text(infile)
+
+
+class ChunkSpiller:
+    """write statements to disk in chunks as they're extracted, so that they
+    never all have to be in memory at once
+
+    each chunk is appended to text_path as-is, and saved directed (see
+    TripleStore.directed) and deduplicated as a sorted run of raw int64 rows
+    in a temporary directory; merged_blocks then merges the runs. as with
+    wd_extsort.ExternalSorter, once there are wd_extsort.max_runs runs they
+    are merged into one, so the final merge never reads from more than that
+    many at a time"""
+
+    def __init__(self, text_path, inverses, chunk_size, run_dir='.'):
+        self.text_path = text_path
+        self.inverses = inverses
+        self.chunk_size = chunk_size
+        self.parent_dir = run_dir
+        self.run_dir = None
+        self.run_paths = []
+        self.run_count = 0
+        self.count = 0
+        # runs named by the last two states, kept on disk even once merged
+        # so that either checkpoint can still be restored
+        self.saved_paths = [set(), set()]
+
+    def start(self):
+        """start the text file afresh and make the run directory, unless
+        that's already done (or the spiller was restored)"""
+        if self.run_dir is None:
+            open(self.text_path, 'w').close()
+            self.run_dir = tempfile.mkdtemp(prefix='statement-runs-',
+                                            dir=self.parent_dir)
+
+    def add(self, store):
+        self.start()
+        self.count += len(store)
+        store.write_text(self.text_path, 'a')
+        run = store.directed(self.inverses).unique()
+        self.write_run([np.column_stack((run.src, run.prop, run.dst))])
+        if len(self.run_paths) >= wd_extsort.max_runs:
+            self.merge_early()
+
+    def write_run(self, blocks):
+        """write a sorted run from blocks of rows"""
+        path = os.path.join(self.run_dir, 'run-%05d.bin' % self.run_count)
+        with open(path, 'wb') as f:
+            for block in blocks:
+                block.tofile(f)
+        self.run_count += 1
+        self.run_paths.append(path)
+
+    def merge_early(self):
+        """merge all runs so far into one"""
+        merged_paths, self.run_paths = self.run_paths, []
+        self.write_run(merge_runs(merged_paths))
+        self.remove_unused(merged_paths)
+
+    def remove_unused(self, paths):
+        for path in paths:
+            if (path not in self.run_paths and
+                    not any(path in saved for saved in self.saved_paths)):
+                os.remove(path)
+
+    def state(self):
+        """what restore needs to pick up from this point (for checkpoints)"""
+        self.start()
+        dropped = self.saved_paths[0]
+        self.saved_paths = [self.saved_paths[1], set(self.run_paths)]
+        self.remove_unused(dropped)
+        return {'run_dir': self.run_dir, 'run_paths': list(self.run_paths),
+                'run_count': self.run_count, 'count': self.count,
+                'text_size': os.path.getsize(self.text_path)}
+
+    def restore(self, state):
+        """go back to a saved state, dropping text and runs added after it"""
+        self.run_dir = state['run_dir']
+        self.run_paths = list(state['run_paths'])
+        self.run_count = state['run_count']
+        self.count = state['count']
+        self.saved_paths = [set(), set(self.run_paths)]
+        os.truncate(self.text_path, state['text_size'])
+        for name in os.listdir(self.run_dir):
+            path = os.path.join(self.run_dir, name)
+            if path not in self.run_paths:
+                os.remove(path)
+
+    def merged_blocks(self, block_size=text_block_size):
+        """yield the statements of all runs as TripleStores of roughly
+        block_size statements, deduplicated and in sorted order"""
+        self.start()
+        for block in merge_runs(self.run_paths, block_size):
+            yield TripleStore.from_rows(block)
+
+    def cleanup(self):
+        if self.run_dir is not None:
+            shutil.rmtree(self.run_dir)
+
+
+def count_up_to(rows, bound):
+    """how many of the sorted rows come no later than the row bound"""
+    src, prop, dst = rows[:, 0], rows[:, 1], rows[:, 2]
+    up_to = (src < bound[0]) | (src == bound[0]) & (
+        (prop < bound[1]) | (prop == bound[1]) & (dst <= bound[2]))
+    return int(np.count_nonzero(up_to))
+
+
+def merge_runs(paths, block_size=text_block_size):
+    """merge the sorted runs ChunkSpiller wrote to paths into sorted blocks
+    (2D arrays) of distinct rows, reading about block_size rows across all
+    runs at a time
+
+    each round tops up every run's buffer and takes, from all of them, the
+    rows up to the smallest last row among the runs not yet exhausted: no
+    row still to be read can come before it, so those rows can be sorted
+    and deduplicated together in NumPy"""
+    if not paths:
+        return
+    read_size = max(block_size // len(paths), 1)
+    files = [open(path, 'rb') for path in paths]
+    done = [False] * len(paths)
+    buffers = [np.zeros((0, 3), dtype=np.int64) for _ in paths]
+    try:
+        while True:
+            bound = None
+            for i, f in enumerate(files):
+                if len(buffers[i]) < read_size and not done[i]:
+                    rows = np.fromfile(f, dtype=np.int64, count=3 * read_size)
+                    buffers[i] = np.concatenate((buffers[i],
+                                                 rows.reshape(-1, 3)))
+                    done[i] = len(rows) < 3 * read_size
+                if not done[i]:
+                    last = buffers[i][-1]
+                    if bound is None or tuple(last) < tuple(bound):
+                        bound = last
+            taken = []
+            for i, buffer in enumerate(buffers):
+                count = (len(buffer) if bound is None
+                         else count_up_to(buffer, bound))
+                taken.append(buffer[:count])
+                buffers[i] = buffer[count:]
+            block = TripleStore.from_rows(np.concatenate(taken)).unique()
+            if len(block):
+                yield np.column_stack((block.src, block.prop, block.dst))
+            if bound is None:
+                return
+    finally:
+        for f in files:
+            f.close()
@@ -1,9 +1,15 @@
+import os
 import sys
 import re
 import itertools
 import json
 from lxml import etree as et
 
+# the shared dump reader lives with the Wikidata scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'wikidata'))
+from wd_dump import open_dump
+
 nsmap = {'x': 'http://www.mediawiki.org/xml/export-0.10/'}
 ns = "{http://www.mediawiki.org/xml/export-0.10/}"
 
@@ -34,7 +40,7 @@ raw_articles = []
 titles = set()
 collected_results = []
 
-filename_base = "wiki-latest-pages-articles-multistream.xml"
+filename_base = "wiki-latest-pages-articles-multistream.xml.bz2"
 
 if len(sys.argv) > 0:
     lang = sys.argv[1]
@@ -46,8 +52,9 @@ cat_prefix = json.loads(open('category_dict.json').read())[lang]
 print("cat_prefix is", cat_prefix)
 qid_dict = json.loads(open('wd_labels.json').read())[lang]
 
-# get an iterable and turn it into an iterator
-context = iter(et.iterparse(filename, events=("start", "end")))
+# get an iterable and turn it into an iterator; the dump is decompressed on
+# the fly, with its streams decompressed in parallel
+context = iter(et.iterparse(open_dump(filename), events=("start", "end")))
 
 # get the root element
 event, root = next(context)
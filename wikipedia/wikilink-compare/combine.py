@@ -1,3 +1,17 @@
+import os
+import shutil
+import sys
+import tempfile
+
+# the external sort lives with the Wikidata scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'wikidata'))
+from wd_extsort import (default_budget, intersect_sorted, merge_unique,
+                        read_lines, sort_file, subtract_sorted, write_lines)
+
+# usage: combine.py [memory budget in MB, for sorting each file]
+budget = int(sys.argv[1]) << 20 if len(sys.argv) > 1 else default_budget
+
 dates_to_filter = frozenset(open('filter.txt', 'r').read().split('\n'))
 def keep(statement, items_to_filter=dates_to_filter):
     splitup = statement.strip().split(' | ')
@@ -8,42 +22,50 @@ def keep(statement, items_to_filter=dates_to_filter):
 
 langs = ('en', 'de', 'fr', 'ru', 'it', 'es', 'pl', 'ja', 'pt', 'ar', 'nl',
          'sv', 'uk', 'ca', 'tr', 'no', 'fi', 'id', 'vi', 'zh', 'he')
+
+# each language's links are sorted into a file of their own, so that they
+# can be combined a line at a time instead of as sets in memory; the
+# combined files are sorted too (by bytes), where they used to be in
+# whatever order the sets had
+sorted_dir = tempfile.mkdtemp(prefix='combine-', dir='.')
 langsets = []
 for lang in langs:
     try:
-        langsets.append(frozenset(open(lang + 'wikilinks.txt').readlines()))
+        sorted_path = os.path.join(sorted_dir, lang + 'wikilinks.txt')
+        sort_file(lang + 'wikilinks.txt', sorted_path, budget, sorted_dir)
+        langsets.append(sorted_path)
     except FileNotFoundError:
         print(lang + 'wikilinks.txt file not found')
 
 # TODO get rid of newlines and stuff
 
-intersection = frozenset.intersection(*langsets)
-
-print('number of common links between all languages:', len(intersection))
+intersection_count = write_lines(
+    intersect_sorted(*[read_lines(path) for path in langsets]),
+    'intersection-combined.txt')
 
-with open('intersection-combined.txt', 'w') as outfile:
-    outfile.writelines(intersection)
+print('number of common links between all languages:', intersection_count)
 
 # let's try this... eek
-union = frozenset.union(*langsets)
-
-print('number of unique links between all languages:', len(union))
+union_count = write_lines(
+    merge_unique(*[read_lines(path) for path in langsets]),
+    'union-combined.txt')
 
-with open('union-combined.txt', 'w') as outfile:
-    outfile.writelines(union)
+print('number of unique links between all languages:', union_count)
 
-print('testing intersection - union:', len(intersection - union))
+print('testing intersection - union:', sum(1 for _ in subtract_sorted(
+    read_lines('intersection-combined.txt'), read_lines('union-combined.txt'))))
 
-del union
+statements_path = os.path.join(sorted_dir, 'statements.txt')
+print('number of statements from Wikidata:',
+      sort_file('statements.txt', statements_path, budget, sorted_dir))
+missing_count = write_lines(
+    subtract_sorted(read_lines('intersection-combined.txt'),
+                    read_lines(statements_path)),
+    'wd_missing.txt')
+print('number of intersection items missing from Wikidata:', missing_count)
+missing_filtered = [item for item in read_lines('wd_missing.txt')
+                    if keep(item.decode('utf-8'))]
+print('previous with selected dates filtered:', len(missing_filtered))
+write_lines(missing_filtered, 'wd_missing_filtered.txt')
 
-with open('statements.txt', 'r') as wd_file, \
-     open('wd_missing.txt', 'w') as wd_missing, \
-     open('wd_missing_filtered.txt', 'w') as wd_missing_filtered:
-    statements = frozenset(wd_file.readlines())
-    print('number of statements from Wikidata:', len(statements))
-    missing = intersection - statements
-    print('number of intersection items missing from Wikidata:', len(missing))
-    wd_missing.writelines(missing)
-    missing_filtered = [item for item in missing if keep(item)]
-    print('previous with selected dates filtered:', len(missing_filtered))
-    wd_missing_filtered.writelines(missing_filtered)
+shutil.rmtree(sorted_dir)